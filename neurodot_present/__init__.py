@@ -2,9 +2,15 @@ from common import SETTINGS, COLORS, bell, UserEscape, sound_alarm
 from screen import Screen, run_start_sequence, run_stop_sequence
 from fixation_cross import FixationCross
 from text_display import TextDisplay
-from checkerboard import CheckerBoard, CheckerBoardScreen
+from checkerboard import CheckerBoard, TiledCheckerBoard, CheckerBoardScreen
+from polar_checkerboard import PolarCheckerBoard, PolarCheckerBoardScreen
 from checkerboard_flasher import CheckerBoardFlasherScreen
 from double_checkerboard_flasher import DoubleCheckerBoardFlasher
+from jfpm_speller import JFPMSpellerScreen
+from sprite_array import SpriteArray
+from animated_screen import AnimatedScreen
+from random_dots import RandomDotKinematogram
+from multifocal import MultifocalBoard, MultifocalScreen
 
 from _settings_mod import _settings as settings
 from _settings_mod import get_class_VsyncPatch
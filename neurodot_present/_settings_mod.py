@@ -2,6 +2,7 @@ from collections import OrderedDict
 
 _settings = OrderedDict()
 _settings['vsync_version'] = 1
+_settings['display_rate']  = None #Hz, see Screen.measure_display_rate
 
 
 def get_class_VsyncPatch():
@@ -12,5 +13,8 @@ def get_class_VsyncPatch():
     elif _settings['vsync_version'] == 2:
         from vsync_patch import VsyncPatch_Version2 as VsyncPatch
         return VsyncPatch
+    elif _settings['vsync_version'] == 3:
+        from vsync_patch import VsyncPatch_FrameCounter as VsyncPatch
+        return VsyncPatch
     else:
-        raise ValueError("bad setting of 'vsync_version', settings: %r" % settings)
+        raise ValueError("bad setting of 'vsync_version', settings: %r" % _settings)
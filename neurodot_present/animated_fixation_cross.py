@@ -7,7 +7,7 @@ import OpenGL.GL as gl
 import OpenGL.GLU as glu
 
 #local imports
-from common import DEBUG, COLORS, cart2pol, pol2cart
+from common import COLORS, cart2pol, pol2cart
 from sprites import Sprite
 
 
@@ -77,7 +77,7 @@ class AnimatedFixationCross(Sprite):
 if __name__ == "__main__":
     import sys
     import pygame
-    from common import DEBUG, UserEscape
+    from common import UserEscape
     from screen import Screen
     from animated_screen import AnimatedScreen
     from numpy import pi
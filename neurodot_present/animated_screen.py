@@ -8,86 +8,104 @@ import OpenGL.GLU as glu
 
 
 #local imports
-from common import DEBUG, COLORS
+from common import COLORS, get_display_rate
 
 from screen import Screen
+from sprite_array import SpriteArray
+from trajectories import flip_index
+from animated_fixation_cross import AnimatedFixationCross
 
 class AnimatedScreen(Screen):
-    def setup(self, sprite_list, **kwargs):
-        """'sprite_list' is a sequence of neurodot_present.common.Sprite 
-           class compatible objects
+    def setup(self,
+              sprite_list = (),
+              sprite_array = None,
+              batch_sprites = True,
+              precompute_trajectories = True,
+              display_rate = None,
+              **kwargs
+             ):
+        """'sprite_list' is a sequence of neurodot_present.common.Sprite
+           class compatible objects, 'sprite_array' a SpriteArray (or e.g. a
+           RandomDotKinematogram) moving many sprites at once; with 'batch_sprites' the AnimatedFixationCross
+           objects of 'sprite_list' are gathered into a SpriteArray too.
+           With 'precompute_trajectories' the positions at every frame of
+           the run are tabulated before it starts, for frames at
+           'display_rate' (default: the measured settings['display_rate'])
         """
         Screen.setup(self, **kwargs)
+        sprite_list = list(sprite_list)
+        self.sprite_arrays = []
+        if not sprite_array is None:
+            self.sprite_arrays.append(sprite_array)
+        if batch_sprites:
+            crosses = [sprite for sprite in sprite_list
+                       if isinstance(sprite, AnimatedFixationCross) and sprite.trajectory is None]
+            if crosses:
+                self.sprite_arrays.append(SpriteArray.from_sprites(crosses))
+                sprite_list = [sprite for sprite in sprite_list if not sprite in crosses]
         self.sprite_list = sprite_list
+        self.precompute_trajectories = precompute_trajectories
+        self.display_rate = display_rate
+        self.t = None
+
+    def get_movement_duration(self):
+        "longest movement_duration of the sprites"
+        durations = [sprite.movement_duration for sprite in self.sprite_list]
+        durations += [np.max(sprites.movement_duration) for sprites in self.sprite_arrays if len(sprites)]
+        return max(durations) if durations else 0.0
+
+    def precompute(self, duration):
+        "tabulate the sprite positions for every frame of 'duration' seconds"
+        display_rate = get_display_rate(self.display_rate)
+        num_frames = flip_index(duration, display_rate) + 1
+        for sprites in self.sprite_arrays:
+            if hasattr(sprites, 'precompute'):
+                sprites.precompute(num_frames, display_rate)
+        for sprite in self.sprite_list:
+            if hasattr(sprite, 'precompute'):
+                sprite.precompute(num_frames, display_rate)
+
+    def start_time(self, t):
+        Screen.start_time(self, t)
+        # reset values to initials
+        for sprite in self.sprite_list:
+            sprite.reset()
+        for sprites in self.sprite_arrays:
+            sprites.start_time(t)
+        self.t = t
+
+    def update(self, t, dt):
+        Screen.update(self, t, dt)
+        self.t = t
+        for sprites in self.sprite_arrays:
+            sprites.update(t)  # all positions in one vectorized step
+        for sprite in self.sprite_list:
+            if t - self.t0 < sprite.movement_duration:
+                sprite.update(t = t)  # update sprite's coordinates
+
+    def render(self):
+        Screen.render_before(self)
+        for sprites in self.sprite_arrays:
+            sprites.render()
+        for sprite in self.sprite_list:
+            sprite.has_rendered = False # reset sprite's render flag
+            if self.t - self.t0 < sprite.movement_duration:
+                sprite.render(t = self.t)  # attempt to render sprite
+        gl.glLoadIdentity()
+        # render fixation cross and vsync patch
+        Screen.render_after(self)
 
     def run(self,
             duration = None,
             vsync_value = 0,
-            wait_on_user_escape = False,
-            mask_user_escape = False,
+            **kwargs
             ):
-        """'duration' param can be used to set a minimum run time 
+        """'duration' param can be used to set a minimum run time
            (though sprites will not move after their movement duration is up)
         """
-        import pygame
-        
-        if not duration == None:
-            duration_list = [duration]
-        else:
-            duration_list = []
-
-        # reset values to initials
-        for sprite in self.sprite_list:
-            sprite.reset()
-
-        # get sprite duration times and set t0
-        duration_list += [sprite.movement_duration for sprite in self.sprite_list]
-        t0 = time.time()
-
-        is_running = True
-        while is_running:
-            #get fresh time
-            t = time.time()
-
-            # clear screen
-            gl.glClear(gl.GL_COLOR_BUFFER_BIT)
-            r,g,b = self.background_color
-            gl.glClearColor(r,g,b,1.0)
-            gl.glMatrixMode(gl.GL_MODELVIEW)
-            gl.glLoadIdentity()
-
-            # call update() and render() for sprites, get render flags
-            render_flags = []
-            for sprite in self.sprite_list:
-
-                sprite.has_rendered = False # reset sprite's render flag
-                if t - t0 < sprite.movement_duration:
-
-                    sprite.update(t = t)  # update sprite's coordinates
-                    sprite.render(t= t)  # attempt to render sprite
-                    render_flags.append(sprite.has_rendered) # get updated render flag
-
-            # render fixation cross if it exists
-            if not self.fixation_cross == None:
-                self.fixation_cross.render()
-
-            # flip display only if a sprite object has rendered
-            if any(render_flags):
-                # render vsync patch
-                self.vsync_patch.render(value = vsync_value)
-                pygame.display.flip()
-
-            # handle outstanding events
-            is_running = self.pygame_handle_events(mask_user_escape = mask_user_escape)
-
-            # check if it has been long enough for duration param or maximum sprite movement_duration
-            if t - t0 > max(duration_list):
-                is_running = False
-
-        if wait_on_user_escape:
-            is_waiting = True
-            try:
-                while is_waiting:
-                    is_waiting = self.handle_events(mask_user_escape = False) #ignore mask request which would get you stuck in FULLSCREEN!
-            except UserEscape:
-                pass
+        movement_duration = self.get_movement_duration()
+        if duration is None or duration < movement_duration:
+            duration = movement_duration
+        if self.precompute_trajectories:
+            self.precompute(movement_duration)
+        Screen.run(self, duration = duration, vsync_value = vsync_value, **kwargs)
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 from __future__ import print_function
 
+import copy
+import numpy as np
 import OpenGL.GL as gl
 import OpenGL.GLU as glu
 
@@ -8,6 +10,7 @@ import OpenGL.GLU as glu
 from common import COLORS
 
 from screen import Screen
+from quad_batch import QuadBatch, rect_vertices
 
 class CheckerBoard:
     def __init__(self,
@@ -17,6 +20,7 @@ class CheckerBoard:
                  color1 = COLORS['white'],
                  color2 = COLORS['black'],
                  fixation_dot_color = None,
+                 check_colors = None,
                  ):
         self.nrows = int(nrows)
         if check_width is None:
@@ -33,8 +37,31 @@ class CheckerBoard:
         self.color2 = color2
         self.fixation_dot_color = fixation_dot_color
         self.display_list_multi = None  #for cached rendering of multiple display lists, leaving ability to change color
+        self._tiled = None  #per check colors are drawn from a TiledCheckerBoard mesh instead
+        if not check_colors is None:
+            self.set_check_colors(check_colors)
+
+    def set_check_colors(self, colors):
+        """ give every check its own color from the (nrows, nrows, 3) RGB or
+            (nrows, nrows) luminance array 'colors' (see
+            TiledCheckerBoard.set_check_colors), None restores color1/color2;
+            returns the number of re-uploaded checks
+        """
+        if colors is None:
+            self._tiled = None
+            return 0
+        if self._tiled is None:
+            self._tiled = TiledCheckerBoard(self.nrows,
+                                            extents = (0.0, 0.0, self.board_width, self.check_height*self.nrows),
+                                            check_width = self.check_width,
+                                            fixation_dot_color = self.fixation_dot_color,
+                                           )
+        return self._tiled.set_check_colors(colors)
 
     def render(self):
+        if not self._tiled is None:
+            self._tiled.render()
+            return
         color1 = self.color1
         color2 = self.color2
 
@@ -119,10 +146,127 @@ class CheckerBoard:
         except AttributeError:
             pass
             
+def check_edges(lo, hi, check_size):
+    """ edges of the checks of 'check_size' covering [lo, hi], centered on
+        its middle, with the outermost checks clipped to the interval
+    """
+    num_checks = int(np.ceil((hi - lo)/float(check_size) - 1e-6))
+    edges = 0.5*(lo + hi) + check_size*(np.arange(num_checks + 1) - 0.5*num_checks)
+    return np.clip(edges, lo, hi)
+
+def tiled_check_vertices(row_edges, col_edges):
+    """ (4*N, 2) vertices of the checks between the row and column edges,
+        ordered row by row from the bottom, and the (N,) parity of each check
+    """
+    rows, cols = np.meshgrid(np.arange(len(row_edges) - 1), np.arange(len(col_edges) - 1), indexing = 'ij')
+    rows, cols = rows.ravel(), cols.ravel()
+    vertices = rect_vertices(col_edges[cols], row_edges[rows], col_edges[cols + 1], row_edges[rows + 1])
+    return (vertices, (rows + cols) % 2)
+
+class TiledCheckerBoard:
+    """ A checkerboard tiling the rectangle 'extents' (left, bottom, right,
+        top), e.g. the whole aspect corrected screen, with 'nrows' rows.
+
+        With 'ncols' the columns evenly divide the width (rectangular
+        checks), otherwise the checks are square, or 'check_width' wide, and
+        centered so that the edge columns are clipped symmetrically.  The
+        mesh is built once in a vertex buffer and drawn in one call; the
+        counter phase board (see reversed) shares it as a second color set.
+
+        Instead of the two colors every check can be given its own (see
+        set_check_colors), then a frame only re-uploads the checks that
+        changed.
+    """
+    def __init__(self,
+                 nrows,
+                 ncols = None,
+                 extents = (-1.0, -1.0, 1.0, 1.0),
+                 check_width = None,
+                 color1 = COLORS['white'],
+                 color2 = COLORS['black'],
+                 fixation_dot_color = None,
+                 ):
+        left, bottom, right, top = extents
+        self.extents = tuple(extents)
+        self.check_height = (top - bottom)/float(nrows)
+        if check_width is None:
+            if ncols is None:
+                check_width = self.check_height
+            else:
+                check_width = (right - left)/float(ncols)
+        self.check_width = check_width
+        self.row_edges = np.linspace(bottom, top, int(nrows) + 1)
+        self.col_edges = check_edges(left, right, check_width)
+        self.nrows = len(self.row_edges) - 1
+        self.ncols = len(self.col_edges) - 1
+        self.board_width  = right - left
+        self.board_height = top - bottom
+        vertices, self.parity = tiled_check_vertices(self.row_edges, self.col_edges)
+        self.batch = QuadBatch(vertices, num_color_sets = 2, dynamic = False)
+        #run colors through filter to catch names and convert to RGB
+        self.color1 = COLORS.get(color1, color1)
+        self.color2 = COLORS.get(color2, color2)
+        self.fixation_dot_color = fixation_dot_color
+        self.color_set = 0
+        self.check_colors = None #(nrows, ncols, 3) per check colors, if set
+        self._uploaded_colors = None
+        self._upload_colors()
+
+    def reversed(self):
+        "the counter phase board, sharing this board's mesh"
+        board = copy.copy(self)
+        board.color1, board.color2 = self.color2, self.color1
+        board.color_set = 1 - self.color_set
+        board.check_colors = None
+        board._upload_colors()
+        return board
+
+    def set_check_colors(self, colors):
+        """ give every check its own color from the (nrows, ncols, 3) RGB or
+            (nrows, ncols) luminance array 'colors', row 0 at the bottom; only
+            the runs of checks that differ from the current colors are
+            re-uploaded.  None restores color1/color2.  Returns the number of
+            re-uploaded checks
+        """
+        if colors is None:
+            self.check_colors = None
+            self._upload_colors()
+            return self.batch.num_quads
+        colors = np.asarray(colors, dtype = np.float32)
+        if colors.ndim == 2: #luminance
+            colors = np.repeat(colors[:,:,np.newaxis], 3, axis = 2)
+        if colors.shape != (self.nrows, self.ncols, 3):
+            raise ValueError("check colors must have shape (%d, %d, 3) or (%d, %d), not %r" % (self.nrows, self.ncols, self.nrows, self.ncols, colors.shape))
+        self.check_colors = colors
+        return self.batch.update_changed_colors(colors.reshape((-1,3)), color_set = self.color_set)
+
+    def _upload_colors(self):
+        #this board's color set has color1 on the even checks
+        colors = np.where((self.parity == 0)[:,np.newaxis], self.color1, self.color2)
+        self.batch.set_colors(colors, color_set = self.color_set)
+        self._uploaded_colors = (tuple(self.color1), tuple(self.color2))
+
+    def render(self):
+        #colors may have been reassigned since the last frame
+        if self.check_colors is None and (tuple(self.color1), tuple(self.color2)) != self._uploaded_colors:
+            self._upload_colors()
+        self.batch.render(color_set = self.color_set)
+        if not self.fixation_dot_color is None:
+            left, bottom, right, top = self.extents
+            gl.glDisable(gl.GL_LIGHTING)
+            gl.glColor3f(*self.fixation_dot_color)
+            gl.glPushMatrix()
+            gl.glTranslatef(0.5*(left + right), 0.5*(bottom + top), 0)
+            glu.gluDisk(glu.gluNewQuadric(), 0, 0.005, 45, 1)
+            gl.glPopMatrix()
+            gl.glEnable(gl.GL_LIGHTING)
+
 class CheckerBoardScreen(Screen):
     def setup(self,
               nrows,
               check_width = None,
+              ncols = None,
+              full_screen = False,
               check_color1 = 'white',
               check_color2 = 'black',
               screen_background_color = 'neutral-gray',
@@ -138,13 +282,27 @@ class CheckerBoardScreen(Screen):
                      vsync_patch = vsync_patch,
                      )
         
-        self.CB = CheckerBoard(nrows = nrows,
-                               check_width = check_width,
-                               color1 = check_color1,
-                               color2 = check_color2,
-                               fixation_dot_color = fixation_dot_color
-                              )
-                             
+        if full_screen:
+            #tile the aspect corrected screen, in screen coordinates
+            self.CB = TiledCheckerBoard(nrows = nrows,
+                                        ncols = ncols,
+                                        extents = (self.screen_left, self.screen_bottom, self.screen_right, self.screen_top),
+                                        check_width = check_width,
+                                        color1 = check_color1,
+                                        color2 = check_color2,
+                                        fixation_dot_color = fixation_dot_color
+                                       )
+            if pos_x is None:
+                pos_x = 0.0
+            if pos_y is None:
+                pos_y = 0.0
+        else:
+            self.CB = CheckerBoard(nrows = nrows,
+                                   check_width = check_width,
+                                   color1 = check_color1,
+                                   color2 = check_color2,
+                                   fixation_dot_color = fixation_dot_color
+                                  )
         if pos_x is None:
             pos_x = -0.5*self.CB.board_width
         if pos_y is None:
@@ -169,6 +327,7 @@ if __name__ == "__main__":
                                      #debug = True
                                      )
     CBS.setup(nrows = NROWS,
+              full_screen = True, #square checks tiling the whole screen
               screen_background_color = "neutral-gray",
               vsync_value = 1
              )
@@ -13,17 +13,22 @@ import copy
 import numpy as np
 
 #local imports
-from common import SETTINGS, COLORS, VSYNC_PATCH_HEIGHT_DEFAULT, VSYNC_PATCH_WIDTH_DEFAULT, DEFAULT_FLASH_RATE
+from common import SETTINGS, COLORS, VSYNC_PATCH_HEIGHT_DEFAULT, VSYNC_PATCH_WIDTH_DEFAULT, DEFAULT_FLASH_RATE,\
+                   get_display_rate
 from common import UserEscape
 
 from screen import Screen
 
-from checkerboard import CheckerBoard
+from checkerboard import CheckerBoard, TiledCheckerBoard
+
+COLOR_SCHEDULE_DURATION_DEFAULT = 60.0 #seconds precompiled when the run has no duration, extended as needed
 
 class CheckerBoardFlasherScreen(Screen):
     def setup(self,
               nrows,
               check_width = None,
+              ncols = None,
+              full_screen = False,
               check_color1 = 'white',
               check_color2 = 'black',
               screen_background_color = 'neutral-gray',
@@ -32,10 +37,14 @@ class CheckerBoardFlasherScreen(Screen):
               #rate_compensation = None,
               vsync_patch = "bottom-right",
               vsync_value = None,
+              log_frames = False,
+              probe_patches = False,
              ):
         Screen.setup(self,
                      background_color = screen_background_color,
                      vsync_patch = vsync_patch,
+                     log_frames = log_frames,
+                     probe_patches = probe_patches,
                      )
 
         #run colors through filter to catch names and convert to RGB
@@ -43,12 +52,25 @@ class CheckerBoardFlasherScreen(Screen):
         check_color2 = COLORS.get(check_color2, check_color2)
 
         # set checkerboard-related attributes
-        if check_width is None:
-            check_width = 2.0/nrows #fill whole screen
-        self.board_width = check_width*nrows
         self.nrows = nrows
-        self.CB1 = CheckerBoard(nrows, check_width, color1 = check_color1, color2 = check_color2, fixation_dot_color = fixation_dot_color)
-        self.CB2 = CheckerBoard(nrows, check_width, color1 = check_color2, color2 = check_color1, fixation_dot_color = fixation_dot_color) #reversed pattern
+        if full_screen:
+            #one mesh tiling the aspect corrected screen, the reversed pattern shares it
+            self.CB1 = TiledCheckerBoard(nrows,
+                                         ncols = ncols,
+                                         extents = (self.screen_left, self.screen_bottom, self.screen_right, self.screen_top),
+                                         check_width = check_width,
+                                         color1 = check_color1,
+                                         color2 = check_color2,
+                                         fixation_dot_color = fixation_dot_color,
+                                        )
+            self.CB2 = self.CB1.reversed()
+            self.board_width = self.CB1.board_width
+        else:
+            if check_width is None:
+                check_width = 2.0/nrows #fill screen height
+            self.board_width = check_width*nrows
+            self.CB1 = CheckerBoard(nrows, check_width, color1 = check_color1, color2 = check_color2, fixation_dot_color = fixation_dot_color)
+            self.CB2 = CheckerBoard(nrows, check_width, color1 = check_color2, color2 = check_color1, fixation_dot_color = fixation_dot_color) #reversed pattern
         #self.CB_cycle = itertools.cycle((self.CB1,self.CB2))
 
         # set time-related attributes
@@ -58,7 +80,10 @@ class CheckerBoardFlasherScreen(Screen):
         #self.rate_compensation = rate_compensation
 
         # get useful coordinate values for checkerboard rendering locations
-        self.xC, self.yC = (-0.5*self.board_width,-0.5*self.board_width)
+        if full_screen:
+            self.xC, self.yC = (0.0, 0.0)
+        else:
+            self.xC, self.yC = (-0.5*self.board_width,-0.5*self.board_width)
 
     def start_time(self,t):
         # get start time and set current CB objects (and their change times)
@@ -91,6 +116,9 @@ class CheckerBoardFlasherScreen(Screen):
             self._current_CB, self._last_CB = (self._last_CB, self._current_CB)
             self.ready_to_render = True
 
+    def get_reversing_boards(self):
+        return [('checkerboard', self._current_CB.color1, self.flash_rate)]
+
     def run(self, **kwargs):
         # loop rate set too high so it should run effectively as fast as python is capable of looping
         Screen.run(self, display_loop_rate = 10000, **kwargs)
@@ -99,17 +127,81 @@ class CheckerBoardFlasherScreen(Screen):
 class CheckerBoardFlasherColorFunctionScreen(CheckerBoardFlasherScreen):
     def setup(self,
               color_function,
+              precompile = False,
+              display_rate = None,  #Hz, default settings['display_rate']
               **kwargs):
+        """ 'color_function(t)' returns the pair of check colors at elapsed
+            time t; with 'precompile' it must also accept an array of times and
+            return a (len(t), 2, 3) array, it is then evaluated once over the
+            whole frame timeline and played back one entry per flipped frame
+        """
         CheckerBoardFlasherScreen.setup(self,**kwargs)
         self._color_function = color_function
-        
+        self.precompile = precompile
+        self.display_rate = display_rate
+        if not getattr(self, '_color_schedule_function', None) is color_function:
+            self._color_schedule = None #invalidate the cache if the function changed
+        self._color_schedule_frame = None
+
+    def get_display_rate(self):
+        return get_display_rate(self.display_rate)
+
+    def _ensure_color_schedule(self, num_frames):
+        # reuse the cached schedule if it was computed from the same function
+        # at the same display rate and covers enough frames
+        display_rate = self.get_display_rate()
+        sched = self._color_schedule
+        if (not sched is None
+            and self._color_schedule_function is self._color_function
+            and self._color_schedule_rate == display_rate
+            and len(sched) >= num_frames):
+            return
+        t = np.arange(num_frames)/float(display_rate)
+        sched = np.asarray(self._color_function(t), dtype = float)
+        if sched.shape != (num_frames, 2, 3):
+            raise ValueError("precompiled color_function must return a (frames, 2, 3) array, got shape %r" % (sched.shape,))
+        self._color_schedule = sched
+        self._color_schedule_function = self._color_function
+        self._color_schedule_rate = display_rate
+
+    def start_time(self, t):
+        CheckerBoardFlasherScreen.start_time(self, t)
+        self._color_schedule_frame = None
+
     def update(self, t, dt):
-        c1, c2 = self._color_function(t - self._t0)
-        self.CB1.color1 = c1
-        self.CB1.color2 = c2
-        self.CB2.color1 = c2
-        self.CB2.color2 = c1
+        if not self.precompile:
+            c1, c2 = self._color_function(t - self._t0)
+            self.CB1.color1 = c1
+            self.CB1.color2 = c2
+            self.CB2.color1 = c2
+            self.CB2.color2 = c1
+            CheckerBoardFlasherScreen.update(self, t, dt)
+            return
+        # one schedule entry per flipped frame, extended if the run outlasts it
+        frame_index = self.frame_count
+        if frame_index >= len(self._color_schedule):
+            self._ensure_color_schedule(2*(frame_index + 1))
+        sched = self._color_schedule
+        color_changed = frame_index != self._color_schedule_frame
+        if color_changed:
+            self._color_schedule_frame = frame_index
+            c1, c2 = sched[frame_index]
+            self.CB1.color1 = c1
+            self.CB1.color2 = c2
+            self.CB2.color1 = c2
+            self.CB2.color2 = c1
         CheckerBoardFlasherScreen.update(self, t, dt)
+        if color_changed:
+            self.ready_to_render = True
+
+    def run(self, duration = 5, **kwargs):
+        if self.precompile:
+            if duration is None:
+                num_frames = int(np.ceil(COLOR_SCHEDULE_DURATION_DEFAULT*self.get_display_rate()))
+            else:
+                num_frames = int(np.ceil(duration*self.get_display_rate())) + 2
+            self._ensure_color_schedule(num_frames)
+        CheckerBoardFlasherScreen.run(self, duration = duration, **kwargs)
 
 ################################################################################
 # TEST CODE
@@ -128,24 +220,28 @@ if __name__ == "__main__":
     RAMP_DURATION = 10.0
     DWELL_TIME    = 5.0
 
+    # the ramps are vectorized, so that they can be precompiled over the
+    # whole frame timeline, for scalar x they return a (2,3) array
+    def gray_pair(y1, y2):
+        y1, y2 = np.broadcast_arrays(y1, y2)
+        c1 = np.stack((y1, y1, y1), axis = -1)
+        c2 = np.stack((y2, y2, y2), axis = -1)
+        return np.stack((c1, c2), axis = -2)
+
     def contrast_ramp(duration, c_max = 1.0):
         def cf(x):
-            y  = x/duration
-            y  = min(y,c_max)
+            y  = np.asarray(x)/duration
+            y  = np.minimum(y,c_max)
             y1 = 0.5*(1 + y)
             y2 = 0.5*(1 - y)
-            c1 = (y1, y1, y1)
-            c2 = (y2, y2, y2)
-            return (c1, c2)
+            return gray_pair(y1, y2)
         return cf
 
     def brightness_ramp(duration, c_max = 1.0):
         def cf(x):
-            c  = x/(duration)
-            c = min(c,c_max)
-            c1 = (c  , c , c )
-            c2 = (0.0,0.0,0.0)
-            return (c1, c2)
+            c  = np.asarray(x)/(duration)
+            c = np.minimum(c,c_max)
+            return gray_pair(c, 0.0)
         return cf
         
     def exp_brightness_ramp(duration,
@@ -154,11 +250,9 @@ if __name__ == "__main__":
                             b = 10.0,
                             ):
         def cf(x):
-            c  = b**(e_min*(1.0 - x/(duration)))
-            c = min(c,c_max)
-            c1 = (c  , c , c )
-            c2 = (0.0,0.0,0.0)
-            return (c1, c2)
+            c  = b**(e_min*(1.0 - np.asarray(x)/(duration)))
+            c = np.minimum(c,c_max)
+            return gray_pair(c, 0.0)
         return cf
 
     CBF = CheckerBoardFlasherColorFunctionScreen.with_pygame_display(
@@ -170,6 +264,7 @@ if __name__ == "__main__":
               nrows = 128,
               flash_rate = 13,
               screen_background_color = COLORS['black'],
+              precompile = True,
               )
     
     while True:
@@ -15,6 +15,7 @@ import shelve
 import scipy.interpolate
 
 import resources
+from _settings_mod import _settings
 
 from PIL import Image
 
@@ -47,10 +48,23 @@ VSYNC_PATCH_HEIGHT_DEFAULT = 0.225
 
 DEFAULT_FLASH_RATE = 17 #Hz
 
+DEFAULT_DISPLAY_RATE = 144 #Hz
+
 MONITOR_NAME = 'benq'
 
 #-------------------------------------------------------------------------------
 # utility functions
+def get_display_rate(display_rate = None):
+    """ 'display_rate' if given, else the refresh rate measured by
+        Screen.measure_display_rate (settings['display_rate']), else
+        DEFAULT_DISPLAY_RATE
+    """
+    if display_rate is None:
+        display_rate = _settings.get('display_rate')
+    if display_rate is None:
+        display_rate = DEFAULT_DISPLAY_RATE
+    return display_rate
+
 def bell(blocking=False):
     pygame.mixer.init()
     bell_sound = pygame.mixer.Sound(resources.get_bellpath("bell.wav"))
@@ -150,6 +164,12 @@ def correct_gamma(input_color, monitor_name = MONITOR_NAME, interp_kind = 'linea
 
     return(float(inv_gam_func(input_color)))
 
+def luminance(color):
+    """ relative luminance of RGB 'color' values (Rec. 709 weights), works
+        on single colors or (..., 3) arrays
+    """
+    return np.dot(np.asarray(color, dtype = float), (0.2126, 0.7152, 0.0722))
+
 #-------------------------------------------------------------------------------
 # graphics
 class Quad:
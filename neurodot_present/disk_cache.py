@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Content addressed on-disk cache of rasterized text.
+
+Entries are keyed by a hash of the font file contents, the font size (after
+fitting to any bounds), the colors and the text, so renaming or editing a font
+invalidates them automatically.  Each entry is a plain .npy file that is
+memory-mapped on load; the total size is bounded by evicting the least
+recently used files (their modification time is refreshed on every hit).
+Walking the cache directory to find them is slow for a large cache, so a
+running total of the bytes stored is kept and the walk only happens when
+it goes over the budget.
+"""
+from __future__ import print_function
+
+import os, hashlib, tempfile
+
+import numpy as np
+
+DISK_CACHE_DIR_DEFAULT   = os.path.join(os.path.expanduser("~"), ".neurodot_present", "cache")
+DISK_CACHE_BYTES_DEFAULT = 1024*1024*1024
+
+_font_hashes = {}
+
+def font_hash(font_path):
+    "SHA-1 of the font file contents, memoized per path and modification time"
+    if font_path is None:
+        import pygame #the pygame default font
+        font_path = os.path.join(os.path.dirname(pygame.__file__), pygame.font.get_default_font())
+    mtime = os.path.getmtime(font_path)
+    key = (font_path, mtime)
+    if not key in _font_hashes:
+        sha = hashlib.sha1()
+        with open(font_path, 'rb') as font_file:
+            for block in iter(lambda: font_file.read(1 << 20), b''):
+                sha.update(block)
+        _font_hashes[key] = sha.hexdigest()
+    return _font_hashes[key]
+
+def text_key(text, font_path, font_size, color, bg_color = None):
+    "hex digest identifying a string rasterized at exactly 'font_size'"
+    if not isinstance(text, bytes):
+        text = text.encode('utf-8')
+    sha = hashlib.sha1()
+    sha.update(repr((font_hash(font_path), int(font_size), tuple(color),
+                     None if bg_color is None else tuple(bg_color))).encode('ascii'))
+    sha.update(text)
+    return sha.hexdigest()
+
+class DiskCache:
+    def __init__(self, directory = DISK_CACHE_DIR_DEFAULT, max_bytes = DISK_CACHE_BYTES_DEFAULT):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits   = 0
+        self.misses = 0
+        self._nbytes = None #running total of the entry sizes, found by a walk on first need
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".npy")
+
+    def load(self, key):
+        "memory-mapped array stored under 'key', or None"
+        path = self._path(key)
+        try:
+            array = np.load(path, mmap_mode = 'r')
+        except (IOError, OSError, ValueError):
+            self.misses += 1
+            return None
+        try:
+            os.utime(path, None) #mark as recently used
+        except OSError:
+            pass
+        self.hits += 1
+        return array
+
+    def save(self, key, array):
+        path = self._path(key)
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                pass #made concurrently
+        # write to a temporary file first so readers never see partial entries
+        fd, tmp_path = tempfile.mkstemp(suffix = ".npy", dir = directory)
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                np.save(tmp_file, np.ascontiguousarray(array))
+            old_nbytes = os.path.getsize(path) if os.path.exists(path) else 0
+            os.rename(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        if not self._nbytes is None:
+            self._nbytes += os.path.getsize(path) - old_nbytes
+
+    def entries(self):
+        "list of (mtime, nbytes, path) of all entries"
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for dirpath, dirnames, filenames in os.walk(self.directory):
+            for filename in filenames:
+                if filename.endswith(".npy"):
+                    path = os.path.join(dirpath, filename)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    @property
+    def nbytes(self):
+        if self._nbytes is None:
+            self._nbytes = sum(nbytes for mtime, nbytes, path in self.entries())
+        return self._nbytes
+
+    def evict(self, max_bytes = None):
+        "remove the least recently used entries until at most 'max_bytes' remain"
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        entries = sorted(self.entries())
+        total = sum(nbytes for mtime, nbytes, path in entries)
+        for mtime, nbytes, path in entries:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= nbytes
+        self._nbytes = total
+
+    def evict_if_full(self):
+        "evict only if the running total is over max_bytes, cheap enough to call after every save"
+        if self.nbytes > self.max_bytes:
+            self.evict()
+
+    def clear(self):
+        self.evict(max_bytes = 0)
+
+_default_disk_cache = None
+
+def get_default_disk_cache():
+    global _default_disk_cache
+    if _default_disk_cache is None:
+        _default_disk_cache = DiskCache()
+        #once per session, this also finds the running total
+        _default_disk_cache.evict()
+    return _default_disk_cache
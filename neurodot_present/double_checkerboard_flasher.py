@@ -33,10 +33,14 @@ class DoubleCheckerBoardFlasher(Screen):
               #rate_compensation = None,
               vsync_patch = "bottom-right",
               vsync_value = None,
+              log_frames = False,
+              probe_patches = False,
              ):
         Screen.setup(self,
                      background_color = screen_background_color,
                      vsync_patch = vsync_patch,
+                     log_frames = log_frames,
+                     probe_patches = probe_patches,
                      )
 
         #run colors through filter to catch names and convert to RGB
@@ -103,6 +107,11 @@ class DoubleCheckerBoardFlasher(Screen):
             self._current_CB_right = self.CB_cycle_right.next()
             self.ready_to_render = True
 
+    def get_reversing_boards(self):
+        return [('left' , self._current_CB_left.color1 , self.flash_rate_left),
+                ('right', self._current_CB_right.color1, self.flash_rate_right),
+               ]
+
     def run(self, **kwargs):
         # loop rate set too high so it should run effectively as fast as python is capable of looping
         Screen.run(self, display_loop_rate = 10000, **kwargs)
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+
+import threading
+import numpy as np
+
+EVENT_CAPACITY_DEFAULT = 1024
+FLUSH_INTERVAL_DEFAULT = 0.25 #seconds
+
+# vsync patch transitions
+EVENT_PULSE_START = 1  #first pulse of a code is switched on
+EVENT_PULSE_OFF   = 2  #a pulse is switched off
+EVENT_PULSE_END   = 3  #final pulse of a code is switched on
+
+EVENT_NAMES = {
+    EVENT_PULSE_START: 'PULSE START',
+    EVENT_PULSE_OFF  : 'PULSE OFF',
+    EVENT_PULSE_END  : 'PULSE END',
+}
+
+EVENT_DTYPE = np.dtype([('event', np.uint8),
+                        ('t'    , np.float64),
+                        ('frame', np.int64),
+                        ('code' , np.int32),
+                       ])
+
+class EventRecorder:
+    """ Preallocated ring buffer of (event, t, frame, code) records.
+
+        'record' is meant to be called from the display loop (a single
+        writer): it never blocks, allocates or does I/O, it fills the next
+        slot and then advances the write index, whose store the GIL makes
+        atomic, so the writer takes no lock.  A background thread ('start')
+        or an explicit 'flush' moves the recorded events into the history,
+        and optionally writes them to 'stream', off the hot path; 'stop'
+        ends the thread and flushes what is left.  If the flusher falls
+        more than 'capacity' events behind, the oldest unflushed events are
+        overwritten and counted in 'num_lost', including those overwritten
+        while they were being copied.
+    """
+    def __init__(self,
+                 capacity = EVENT_CAPACITY_DEFAULT,
+                 flush_interval = FLUSH_INTERVAL_DEFAULT,
+                 stream = None,
+                 ):
+        self.capacity = int(capacity)
+        self.flush_interval = flush_interval
+        self.stream = stream
+        self._buffer = np.zeros(self.capacity, dtype = EVENT_DTYPE)
+        self._write_index = 0  #only ever advanced by the recording thread
+        self._read_index  = 0  #only ever advanced by the flushing side
+        self._history = []
+        self._flush_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.num_lost = 0
+
+    def record(self, event, t, frame = -1, code = 0):
+        i = self._write_index
+        self._buffer[i % self.capacity] = (event, t, frame, code)
+        self._write_index = i + 1
+
+    def flush(self):
+        with self._flush_lock:
+            w = self._write_index
+            r = self._read_index
+            if w - r > self.capacity:
+                self.num_lost += w - r - self.capacity
+                r = w - self.capacity
+            if w == r:
+                return
+            chunk = self._buffer[np.arange(r, w) % self.capacity]
+            #the writer may have lapped the copied slots meanwhile, the slot
+            #it is filling right now included
+            overwritten = min(max(self._write_index + 1 - self.capacity - r, 0), w - r)
+            if overwritten:
+                self.num_lost += overwritten
+                chunk = chunk[overwritten:]
+            self._history.append(chunk)
+            self._read_index = w
+        if not self.stream is None:
+            self.stream.write(format_events(chunk))
+            self.stream.flush()
+
+    def _flush_loop(self):
+        while not self._stop_event.wait(self.flush_interval):
+            self.flush()
+
+    def start(self):
+        "start the background flushing thread, if it is not already running"
+        if not self._thread is None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target = self._flush_loop, name = "EventRecorder-flush")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        if not self._thread is None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def clear(self):
+        with self._flush_lock:
+            self._read_index = self._write_index
+            self._history = []
+            self.num_lost = 0
+
+    def events(self, event = None):
+        """ structured array of all events recorded so far, optionally only
+            those of type 'event'
+        """
+        self.flush()
+        with self._flush_lock:
+            if self._history:
+                events = np.concatenate(self._history)
+                self._history = [events]
+            else:
+                events = np.zeros(0, dtype = EVENT_DTYPE)
+        if not event is None:
+            events = events[events['event'] == event]
+        return events
+
+def format_events(events):
+    lines = []
+    for ev in events:
+        name = EVENT_NAMES.get(int(ev['event']), str(ev['event']))
+        lines.append("%-12s t = %.6f  frame = %d  code = %d\n" % (name, ev['t'], ev['frame'], ev['code']))
+    return "".join(lines)
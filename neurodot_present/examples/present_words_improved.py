@@ -4,6 +4,7 @@ import random
 import upsidedown
 from neurodot_present.present_lib import Screen, FixationCross, TextDisplay, UserEscape, bell, run_start_sequence, run_stop_sequence
 import neurodot_present.resources
+from neurodot_present.text_atlas import TextAtlas
 
 STIMULUS_DURATION = 0.5
 
@@ -80,6 +81,20 @@ def main():
         stim_list.append(latin)
         stim_list.append(cypher)
     random.shuffle(stim_list)
+
+    # rasterize every stimulus before the session so that no font rendering happens at trial onset,
+    # in the font, size and colors the TextDisplay would render them with
+    font_path = None
+    if not text.font_type is None:
+        font_path = neurodot_present.resources.get_fontpath(text.font_type)
+    text.text_atlas = TextAtlas.build([stim['word'] for stim in stim_list],
+                                      font_path = font_path,
+                                      font_size = text.font_size,
+                                      color    = tuple(int(c*255) for c in text.text_color),
+                                      bg_color = tuple(int(c*255) for c in text.text_bgColor),
+                                      max_size = (text.screen_width, text.screen_height),
+                                     )
+    text.text_atlas.upload() #textures go to the GPU now rather than on the first trial
     
     try:
         #start sequence
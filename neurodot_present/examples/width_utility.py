@@ -7,32 +7,33 @@ cipher.
 """
 import os
 import collections
-from neurodot_present.present_lib import TextDisplay
 import neurodot_present.resources
+from neurodot_present.text_widths import WidthIndex
 
-neurodot_present.present_lib.DEBUG = True
 min_word_characters = 4  # characters in shortest word found in word_list.txt
 max_word_characters = 6  # characters in longest word found in word_list.txt
 font_size = 288
 font_type = 'FreeMono.ttf'
 
-#latinText = TextDisplay(font_type="Arial.ttf")
-#hebrewText = TextDisplay(font_type="ArialHebrew.ttf")
+#latinFont = neurodot_present.resources.get_font(neurodot_present.resources.get_fontpath("Arial.ttf"), font_size)
+#hebrewFont = neurodot_present.resources.get_font(neurodot_present.resources.get_fontpath("ArialHebrew.ttf"), int(font_size * arial_heightScaleFactor))
 #arial_heightScaleFactor = 1.333333333
 
-latinText = TextDisplay(font_type=font_type)
-hebrewText = TextDisplay(font_type=font_type)
+font_path = neurodot_present.resources.get_fontpath(font_type)
+neurodot_present.resources.preload_fonts([(font_path, font_size)], verbose=True)
+# one shared Font object, widths come from the glyph metrics without rendering
+latinFont = neurodot_present.resources.get_font(font_path, font_size)
+hebrewFont = neurodot_present.resources.get_font(font_path, font_size)
 hebrew_alphabet = list(
     u"\u05D0\u05D1\u05D2\u05D3\u05D4\u05D5\u05D6\u05D7\u05D8\u05D9\u05DA\u05DB\u05DC\u05DD\u05DE\u05DF\u05E1\u05E2\u05E3\u05E4\u05E5\u05E6\u05E7\u05E8\u05E9\u05EA")
 
 
 def getLatinWidth(str):
-    return latinText.render_surface(text_content=str, font_size=font_size).get_width()
+    return latinFont.size(str)[0]
 
 
 def getHebWidth(str):
-    #return hebrewText.render_surface(text_content=str, font_size=int(font_size * arial_heightScaleFactor)).get_width()
-    return hebrewText.render_surface(text_content=str, font_size=font_size).get_width()
+    return hebrewFont.size(str)[0]
 
 # get list of words from text file
 word_list = []
@@ -128,3 +129,12 @@ print 'Shortest Hebrew:', '{0:>36} -{1:>5} pixels'.format(shortestHebWord, short
 print 'Longest Latin:  ', '{0:>36} -{1:>5} pixels'.format(longestLatinWord, longestLatinWidth)
 print 'Longest Hebrew: ', '{0:>36} -{1:>5} pixels'.format(longestHebWord, longestHebWidth)
 print ""
+
+# widths of every word and of random cyphers of it, as sums of glyph metrics
+index = WidthIndex.build(word_list, font_path, font_size, cypher_alphabet=hebrew_alphabet, seed=0)
+index.save(os.path.splitext(font_type)[0] + "_%d_widths.npz" % font_size)
+print "Over", len(index.perms), "random cyphers:"
+print ""
+print 'Latin:  ', '{0:>5} -{1:>5} pixels'.format(index.widths.min(), index.widths.max())
+print 'Hebrew: ', '{0:>5} -{1:>5} pixels'.format(*index.cypher_range())
+print ""
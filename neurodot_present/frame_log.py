@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+
+import numpy as np
+
+FRAME_LOG_CAPACITY_DEFAULT = 4096 #frames, grows by doubling
+
+class FrameLog:
+    """ Per-frame record of the flip timestamps and the values drawn on each
+        named channel (e.g. the luminance of each flasher target).
+        Storage is preallocated and grows by doubling so that recording a
+        frame inside the display loop is just two array assignments.
+    """
+    def __init__(self, channel_names, capacity = FRAME_LOG_CAPACITY_DEFAULT):
+        self.channel_names = list(channel_names)
+        self._t      = np.zeros(capacity, dtype = np.float64)
+        self._values = np.zeros((capacity, len(self.channel_names)), dtype = np.float64)
+        self.num_frames = 0
+
+    def reset(self):
+        self.num_frames = 0
+
+    def _grow(self):
+        capacity = 2*len(self._t)
+        t = np.zeros(capacity, dtype = self._t.dtype)
+        t[:self.num_frames] = self._t[:self.num_frames]
+        values = np.zeros((capacity, self._values.shape[1]), dtype = self._values.dtype)
+        values[:self.num_frames] = self._values[:self.num_frames]
+        self._t, self._values = t, values
+
+    def record(self, t, values = ()):
+        n = self.num_frames
+        if n == len(self._t):
+            self._grow()
+        self._t[n] = t
+        self._values[n] = values
+        self.num_frames = n + 1
+
+    @property
+    def t(self):
+        "flip timestamps of the recorded frames"
+        return self._t[:self.num_frames]
+
+    @property
+    def values(self):
+        "(frames x channels) array of recorded values"
+        return self._values[:self.num_frames]
+
+    def channel(self, name):
+        return self.values[:,self.channel_names.index(name)]
+
+    def __len__(self):
+        return self.num_frames
+
+    def save(self, filename):
+        np.savez(filename,
+                 t = self.t,
+                 values = self.values,
+                 channel_names = np.array(self.channel_names),
+                )
+
+    @classmethod
+    def load(cls, filename):
+        data = np.load(filename)
+        obj = cls(channel_names = [str(name) for name in data['channel_names']],
+                  capacity = max(len(data['t']), 1),
+                 )
+        n = len(data['t'])
+        obj._t[:n] = data['t']
+        obj._values[:n] = data['values']
+        obj.num_frames = n
+        return obj
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+
+import numpy as np
+import OpenGL.GL as gl
+
+#local imports
+from common import COLORS, get_display_rate
+
+from screen import Screen
+
+from quad_batch import QuadBatch, rect_vertices
+
+JFPM_NUM_TARGETS = 40
+JFPM_FREQUENCY_START = 8.0 #Hz
+JFPM_FREQUENCY_STEP  = 0.2 #Hz
+JFPM_PHASE_STEP      = 0.5*np.pi
+LUMINANCE_MATRIX_DURATION_DEFAULT = 60.0 #seconds precomputed for an open ended run, extended as needed
+
+def jfpm_frequencies_phases(num_targets = JFPM_NUM_TARGETS,
+                            frequency_start = JFPM_FREQUENCY_START,
+                            frequency_step  = JFPM_FREQUENCY_STEP,
+                            phase_step      = JFPM_PHASE_STEP,
+                           ):
+    """ joint frequency-phase modulation code book, target k gets
+        frequency_start + k*frequency_step and phase k*phase_step
+    """
+    k = np.arange(num_targets)
+    frequencies = frequency_start + k*frequency_step
+    phases = np.mod(k*phase_step, 2*np.pi)
+    return (frequencies, phases)
+
+def jfpm_luminance_matrix(frequencies,
+                          phases,
+                          num_frames,
+                          display_rate = None,
+                          inv_gamma_func = None,
+                         ):
+    """ compute the (frames x targets) luminance matrix of the sampled
+        sinusoidal stimulation method, for frame i and target k:
+            L[i,k] = 0.5*(1 + sin(2*pi*f_k*i/display_rate + phi_k))
+        'display_rate' defaults to the measured settings['display_rate']
+    """
+    frame_times = np.arange(num_frames)/float(get_display_rate(display_rate))
+    frequencies = np.asarray(frequencies, dtype = float)
+    phases      = np.asarray(phases, dtype = float)
+    L = 0.5*(1.0 + np.sin(2*np.pi*frame_times[:,np.newaxis]*frequencies + phases))
+    if not inv_gamma_func is None:
+        L = inv_gamma_func(L)
+    return L
+
+class JFPMSpellerScreen(Screen):
+    def setup(self,
+              frequencies = None,
+              phases = None,
+              target_rows = 5,
+              target_cols = 8,
+              target_width = 0.2,
+              nrows = 1,
+              display_rate = None,  #Hz, default settings['display_rate']
+              inv_gamma_func = None,
+              screen_background_color = 'black',
+              vsync_patch = "bottom-right",
+              vsync_value = None,
+              log_frames = False,
+              probe_patches = False,
+             ):
+        Screen.setup(self,
+                     background_color = screen_background_color,
+                     vsync_patch = vsync_patch,
+                     vsync_value = vsync_value,
+                     log_frames = log_frames,
+                     probe_patches = probe_patches,
+                     )
+        num_targets = target_rows*target_cols
+        if frequencies is None or phases is None:
+            default_frequencies, default_phases = jfpm_frequencies_phases(num_targets)
+            if frequencies is None:
+                frequencies = default_frequencies
+            if phases is None:
+                phases = default_phases
+        self.frequencies = np.asarray(frequencies, dtype = float)
+        self.phases      = np.asarray(phases, dtype = float)
+        if not (len(self.frequencies) == len(self.phases) == num_targets):
+            raise ValueError("need %d frequencies and phases for a %dx%d speller layout" % (num_targets, target_rows, target_cols))
+        self.num_targets  = num_targets
+        self.display_rate = display_rate
+        self.inv_gamma_func = inv_gamma_func
+
+        # target centers on a regular grid, filled row by row from the top left
+        col_pitch = (self.screen_right - self.screen_left)/target_cols
+        row_pitch = (self.screen_top - self.screen_bottom)/target_rows
+        k = np.arange(num_targets)
+        xc = self.screen_left + col_pitch*(k % target_cols + 0.5)
+        yc = self.screen_top  - row_pitch*(k // target_cols + 0.5)
+        self.target_positions = np.column_stack((xc, yc))
+        self.target_width = target_width
+
+        # each target is an nrows x nrows checkerboard, all quads go in one batch
+        nrows = int(nrows)
+        w = float(target_width)/nrows
+        cx, cy = np.meshgrid(np.arange(nrows), np.arange(nrows))
+        cx, cy = cx.ravel(), cy.ravel()
+        tgt = np.repeat(k, nrows*nrows)
+        cx  = np.tile(cx, num_targets)
+        cy  = np.tile(cy, num_targets)
+        left   = xc[tgt] - 0.5*target_width + w*cx
+        bottom = yc[tgt] - 0.5*target_width + w*cy
+        self._batch = QuadBatch(rect_vertices(left, bottom, left + w, bottom + w))
+        # each vertex looks up its luminance as column 'target' (color1 checks)
+        # or 'target + num_targets' (reversed color2 checks) of a frame row
+        parity = (cx + cy) % 2
+        self._vertex_lum_index = np.repeat(tgt + parity*num_targets, 4)
+        self._vertex_lum    = np.zeros(len(self._vertex_lum_index), dtype = np.float32)
+        self._vertex_colors = np.zeros((len(self._vertex_lum_index), 3), dtype = np.float32)
+
+        self._frame_luminance = None
+        self._frame_luminance_rate = None
+        self._frame_index = None
+
+    def get_display_rate(self):
+        return get_display_rate(self.display_rate)
+
+    def _ensure_frame_luminance(self, num_frames):
+        # the (frames x 2*targets) matrix is only recomputed if it is too
+        # short or the display rate has been measured since
+        display_rate = self.get_display_rate()
+        if (not self._frame_luminance is None
+            and self._frame_luminance_rate == display_rate
+            and len(self._frame_luminance) >= num_frames):
+            return
+        L1 = jfpm_luminance_matrix(self.frequencies, self.phases,
+                                   num_frames = num_frames,
+                                   display_rate = display_rate,
+                                  )
+        L2 = 1.0 - L1  #color2 checks are in counter phase, as for the sin flasher
+        if not self.inv_gamma_func is None:
+            L1 = self.inv_gamma_func(L1)
+            L2 = self.inv_gamma_func(L2)
+        self._frame_luminance = np.hstack((L1, L2)).astype(np.float32)
+        self._frame_luminance_rate = display_rate
+
+    def start_time(self, t):
+        Screen.start_time(self, t)
+        self._frame_index = None
+
+    def render(self):
+        Screen.render_before(self)
+        gl.glLoadIdentity()
+        self._batch.render()
+        Screen.render_after(self)
+
+    def update(self, t, dt):
+        Screen.update(self, t, dt) #important, this handles vsync updates
+        self.ready_to_render = self.vsync_patch.ready_to_render
+
+        # one row of the luminance matrix per flipped frame, so that the
+        # rows match the flips whatever the loop timing; extended if the run
+        # outlasts it
+        frame_index = self.frame_count
+        if frame_index >= len(self._frame_luminance):
+            self._ensure_frame_luminance(2*(frame_index + 1))
+        if frame_index != self._frame_index:
+            self._frame_index = frame_index
+            np.take(self._frame_luminance[frame_index], self._vertex_lum_index, out = self._vertex_lum)
+            self._vertex_colors[:] = self._vertex_lum[:,np.newaxis]
+            self._batch.set_colors(self._vertex_colors.reshape((-1,4,3)))
+            self.ready_to_render = True
+
+    def get_frame_log_channels(self):
+        return Screen.get_frame_log_channels(self) + ['target%02d' % k for k in range(self.num_targets)]
+
+    def get_frame_log_values(self):
+        #the first frame is rendered before any update
+        frame_index = 0 if self._frame_index is None else self._frame_index
+        return tuple(Screen.get_frame_log_values(self)) + tuple(self._frame_luminance[frame_index,:self.num_targets])
+
+    def get_stimulus_frequencies(self):
+        freqs = Screen.get_stimulus_frequencies(self)
+        for k, f in enumerate(self.frequencies):
+            freqs['target%02d' % k] = f
+        return freqs
+
+    def run(self, duration = 5, **kwargs):
+        if duration is None:
+            num_frames = int(np.ceil(LUMINANCE_MATRIX_DURATION_DEFAULT*self.get_display_rate()))
+        else:
+            num_frames = int(np.ceil(duration*self.get_display_rate())) + 2
+        self._ensure_frame_luminance(num_frames)
+        # loop rate set too high so it should run effectively as fast as python is capable of looping
+        Screen.run(self, duration = duration, display_loop_rate = 10000, **kwargs)
+
+################################################################################
+# TEST CODE
+################################################################################
+if __name__ == "__main__":
+    import sys
+    #ensure that video mode is at the maxium FPS
+    if sys.platform.startswith("linux"):
+        from subprocess import call
+        call(["xrandr","-r","144"])
+
+    SPELLER = JFPMSpellerScreen.with_pygame_display(#debug = True
+                                                   )
+    SPELLER.setup(screen_background_color = 'black',
+                 )
+    SPELLER.measure_display_rate() #the luminance matrix is sampled at this rate
+    SPELLER.run(duration = 5, vsync_value = 1)
@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+"""
+Multifocal VEP stimulation with m-sequences.
+
+A dartboard of segments (see MultifocalBoard), each a small polar
+checkerboard, is pattern reversed by one binary m-sequence: segment k
+follows the sequence shifted by k*lag steps, one step per frame, so that
+the responses of the segments are decorrelated.  The (frames x segments)
+state matrix is computed before the run, each frame streams the colours of
+all segments in one buffer upload and the frame log records the sequence
+step that was actually shown, from which the per-segment kernels are
+extracted by cross-correlation with the recorded signal.
+"""
+from __future__ import print_function
+
+import numpy as np
+import OpenGL.GL as gl
+
+#local imports
+from common import COLORS, get_display_rate
+
+from screen import Screen
+from quad_batch import QuadBatch
+from polar_checkerboard import ring_edges, polar_check_vertices, SEGMENT_ANGLE_DEFAULT
+
+#feedback taps (1-indexed bit positions) of maximal length shift registers
+M_SEQUENCE_TAPS = {
+     2: (2, 1),
+     3: (3, 2),
+     4: (4, 3),
+     5: (5, 3),
+     6: (6, 5),
+     7: (7, 6),
+     8: (8, 6, 5, 4),
+     9: (9, 5),
+    10: (10, 7),
+    11: (11, 9),
+    12: (12, 6, 4, 1),
+    13: (13, 4, 3, 1),
+    14: (14, 5, 3, 1),
+    15: (15, 14),
+    16: (16, 15, 13, 4),
+}
+KERNEL_DURATION_DEFAULT = 0.2 #seconds of response extracted after each step
+
+_m_sequences = {}
+
+def m_sequence(order):
+    """ the binary (0/1) maximal length sequence of 2**order - 1 steps
+        generated by a linear feedback shift register
+    """
+    seq = _m_sequences.get(order)
+    if seq is None:
+        taps = M_SEQUENCE_TAPS[order]
+        length = 2**order - 1
+        seq = np.empty(length, dtype = np.int8)
+        register = [1]*order
+        for i in range(length):
+            seq[i] = register[-1]
+            bit = 0
+            for tap in taps:
+                bit ^= register[tap - 1]
+            register = [bit] + register[:-1]
+        _m_sequences[order] = seq
+    return seq
+
+def segment_states(sequence, num_segments, lag = None):
+    """ (steps x segments) states of the segments, segment k following
+        'sequence' shifted by k*'lag' steps (default: spread evenly over the
+        sequence length)
+    """
+    sequence = np.asarray(sequence)
+    length = len(sequence)
+    if lag is None:
+        lag = length//num_segments
+    if lag*(num_segments - 1) >= length:
+        raise ValueError("lag %d is too long for %d segments on a sequence of %d steps" % (lag, num_segments, length))
+    index = (np.arange(length)[:,np.newaxis] + lag*np.arange(num_segments)) % length
+    return sequence[index]
+
+def step_onsets(t_flip, t_samples):
+    "sample index of the first sample at or after each flip"
+    return np.searchsorted(t_samples, t_flip)
+
+def _correlate(drive, signal, onsets, num_lags):
+    """ (segments x lags) cross-correlation of the (frames x segments) +/-1
+        'drive' with the signal windows following the frame 'onsets'
+    """
+    valid = onsets + num_lags <= len(signal)
+    drive = drive[valid]
+    windows = signal[onsets[valid,np.newaxis] + np.arange(num_lags)]
+    windows = windows - windows.mean(axis = 0)
+    return np.dot(drive.T, windows)/len(drive)
+
+def first_order_kernels(signal, t_samples, t_flip, states, kernel_duration = KERNEL_DURATION_DEFAULT):
+    """ (segments x lags) first order kernels of the 'signal' sampled at
+        't_samples' for the frames flipped at 't_flip' with the (frames x
+        segments) 0/1 'states', e.g. segment_states indexed by the logged
+        sequence steps
+    """
+    signal = np.asarray(signal, dtype = float)
+    sample_rate = (len(t_samples) - 1)/(t_samples[-1] - t_samples[0])
+    num_lags = int(round(kernel_duration*sample_rate))
+    drive = 2.0*np.asarray(states, dtype = float) - 1.0
+    return _correlate(drive, signal, step_onsets(t_flip, t_samples), num_lags)
+
+def second_order_kernels(signal, t_samples, t_flip, states, kernel_duration = KERNEL_DURATION_DEFAULT):
+    """ first slice of the second order kernels, the response to a reversal
+        (state change) from the previous frame, see first_order_kernels
+    """
+    signal = np.asarray(signal, dtype = float)
+    sample_rate = (len(t_samples) - 1)/(t_samples[-1] - t_samples[0])
+    num_lags = int(round(kernel_duration*sample_rate))
+    drive = 2.0*np.asarray(states, dtype = float) - 1.0
+    drive = -drive[1:]*drive[:-1] #+1 on a reversal
+    return _correlate(drive, signal, step_onsets(t_flip[1:], t_samples), num_lags)
+
+def simulate_responses(t_flip, states, kernels, sample_rate = 1000.0, noise = 0.0, padding = 0.5, seed = None):
+    """ a stand-in EEG recording: the sum over the frames flipped at 't_flip'
+        of the (segments x lags) 'kernels' weighted by the +/-1 (frames x
+        segments) 'states', plus white noise; returns the signal and the
+        time of every sample
+    """
+    t_flip = np.asarray(t_flip, dtype = float)
+    kernels = np.asarray(kernels, dtype = float)
+    num_lags = kernels.shape[1]
+    t_start = t_flip[0] - padding
+    num_samples = int((t_flip[-1] - t_flip[0] + 2*padding)*sample_rate) + num_lags
+    t_samples = t_start + np.arange(num_samples)/float(sample_rate)
+    #response to each frame, then overlap-add one lag at a time
+    responses = np.dot(2.0*np.asarray(states, dtype = float) - 1.0, kernels)
+    onsets = step_onsets(t_flip, t_samples)
+    rng = np.random.RandomState(seed)
+    signal = rng.normal(scale = noise, size = num_samples) if noise else np.zeros(num_samples)
+    for j in range(num_lags):
+        signal[onsets + j] += responses[:,j]
+    return (signal, t_samples)
+
+################################################################################
+class MultifocalBoard:
+    """ A dartboard of 'num_rings' x 'num_wedges' segments, each divided into
+        'check_rings' x 'check_wedges' checks, tessellated once into a vertex
+        buffer.  The checks of a segment are color1/color2 in state 0 and
+        reversed in state 1; set_state writes all segments in one upload.
+    """
+    def __init__(self,
+                 num_rings = 6,
+                 num_wedges = 10,
+                 check_rings = 4,
+                 check_wedges = 4,
+                 inner_radius = 0.05,
+                 outer_radius = 1.0,
+                 ring_spacing = 'log',
+                 color1 = COLORS['white'],
+                 color2 = COLORS['black'],
+                 ):
+        self.num_rings  = int(num_rings)
+        self.num_wedges = int(num_wedges)
+        self.num_segments = self.num_rings*self.num_wedges
+        R = self.num_rings*check_rings
+        W = self.num_wedges*check_wedges
+        segments_per_check = max(int(np.ceil(2*np.pi/W/SEGMENT_ANGLE_DEFAULT)), 1)
+        self.radii = ring_edges(R, inner_radius, outer_radius, ring_spacing)
+        self.batch = QuadBatch(polar_check_vertices(self.radii, W, segments_per_check))
+        #segment and check parity of every vertex, the quads are ordered by
+        #ring, then wedge, then arc segment (see polar_check_vertices)
+        rings, wedges = np.meshgrid(np.arange(R), np.arange(W), indexing = 'ij')
+        segment = (rings//check_rings)*self.num_wedges + wedges//check_wedges
+        parity = (rings + wedges) % 2
+        self._vertex_segment = np.repeat(segment.ravel(), 4*segments_per_check)
+        self._vertex_parity  = np.repeat(parity.ravel(), 4*segments_per_check).astype(np.int8)
+        self.set_colors(color1, color2)
+        self.state = np.zeros(self.num_segments, dtype = np.int8)
+        self.set_state(self.state)
+
+    def set_colors(self, color1, color2):
+        #run colors through filter to catch names and convert to RGB
+        self.color1 = COLORS.get(color1, color1)
+        self.color2 = COLORS.get(color2, color2)
+        self._palette = np.array((self.color1, self.color2), dtype = np.float32)
+
+    def set_state(self, state):
+        "the 0/1 reversal state of every segment"
+        self.state = np.asarray(state, dtype = np.int8)
+        index = np.bitwise_xor(self.state[self._vertex_segment], self._vertex_parity)
+        self.batch.set_colors(self._palette[index].reshape((-1,4,3)))
+
+    def render(self):
+        self.batch.render()
+
+class MultifocalScreen(Screen):
+    def setup(self,
+              num_rings = 6,
+              num_wedges = 10,
+              check_rings = 4,
+              check_wedges = 4,
+              inner_radius = 0.05,
+              outer_radius = 1.0,
+              ring_spacing = 'log',
+              check_color1 = 'white',
+              check_color2 = 'black',
+              screen_background_color = 'neutral-gray',
+              sequence_order = 15,
+              lag = None,           #steps between the segments' sequences
+              display_rate = None,  #Hz, default settings['display_rate']
+              pos_x = 0.0,
+              pos_y = 0.0,
+              vsync_patch = "bottom-right",
+              vsync_value = None,
+              log_frames = True,
+             ):
+        Screen.setup(self,
+                     background_color = screen_background_color,
+                     vsync_patch = vsync_patch,
+                     vsync_value = vsync_value,
+                     log_frames = log_frames,
+                     )
+        self.MFB = MultifocalBoard(num_rings = num_rings,
+                                   num_wedges = num_wedges,
+                                   check_rings = check_rings,
+                                   check_wedges = check_wedges,
+                                   inner_radius = inner_radius,
+                                   outer_radius = outer_radius,
+                                   ring_spacing = ring_spacing,
+                                   color1 = check_color1,
+                                   color2 = check_color2,
+                                  )
+        self.sequence = m_sequence(sequence_order)
+        self.states = segment_states(self.sequence, self.MFB.num_segments, lag = lag)
+        self.display_rate = display_rate
+        self.pos_x = pos_x
+        self.pos_y = pos_y
+        self.step = None
+
+    def get_display_rate(self):
+        return get_display_rate(self.display_rate)
+
+    def start_time(self, t):
+        Screen.start_time(self, t)
+        self.step = None
+        self.update(t, 0.0)
+
+    def update(self, t, dt):
+        Screen.update(self, t, dt) #important, this handles vsync updates
+        #one sequence step per flipped frame, whatever the loop timing, so a
+        #dropped frame delays the sequence instead of skipping a step
+        step = self.frame_count % len(self.states)
+        if step != self.step:
+            self.step = step
+            self.MFB.set_state(self.states[step])
+
+    def render(self):
+        Screen.render_before(self)
+        gl.glLoadIdentity()
+        gl.glTranslatef(self.pos_x, self.pos_y, 0.0)
+        self.MFB.render()
+        gl.glLoadIdentity()
+        Screen.render_after(self)
+
+    def get_frame_log_channels(self):
+        return Screen.get_frame_log_channels(self) + ['mfvep_step']
+
+    def get_frame_log_values(self):
+        #the segment states shown are self.states[step]
+        return tuple(Screen.get_frame_log_values(self)) + (self.step,)
+
+    def get_logged_states(self):
+        "(frames x segments) states of the logged frames"
+        steps = self.frame_log.channel('mfvep_step').astype(int)
+        return self.states[steps]
+
+    def run(self, duration = None, **kwargs):
+        "'duration' defaults to one pass through the sequence"
+        if duration is None:
+            duration = len(self.states)/float(self.get_display_rate())
+        Screen.run(self, duration = duration, **kwargs)
+
+################################################################################
+# TEST CODE
+################################################################################
+if __name__ == "__main__":
+    import time
+    #offline check of the kernel extraction on a simulated recording
+    DISPLAY_RATE = 60.0
+    SAMPLE_RATE  = 1000.0
+    NUM_SEGMENTS = 60
+    states = segment_states(m_sequence(15), NUM_SEGMENTS)
+    t_flip = np.arange(len(states))/DISPLAY_RATE + np.random.normal(scale = 1e-4, size = len(states))
+    #a damped oscillation per segment with random amplitude and latency
+    rng = np.random.RandomState(0)
+    lags = np.arange(int(KERNEL_DURATION_DEFAULT*SAMPLE_RATE))/SAMPLE_RATE
+    amplitude = rng.uniform(0.5, 2.0, (NUM_SEGMENTS, 1))
+    latency   = rng.uniform(0.06, 0.10, (NUM_SEGMENTS, 1))
+    true_kernels = amplitude*np.sin(2*np.pi*10.0*(lags - latency))*np.exp(-((lags - latency)/0.03)**2)
+    signal, t_samples = simulate_responses(t_flip, states, true_kernels, sample_rate = SAMPLE_RATE, noise = 5.0, seed = 1)
+    t0 = time.time()
+    kernels = first_order_kernels(signal, t_samples, t_flip, states)
+    print("%d segments x %d steps: kernels in %0.3f s" % (NUM_SEGMENTS, len(states), time.time() - t0))
+    r = [np.corrcoef(k, tk)[0,1] for k, tk in zip(kernels, true_kernels)]
+    print("correlation with the true kernels: min %0.3f, median %0.3f" % (np.min(r), np.median(r)))
+
+    MFS = MultifocalScreen.with_pygame_display()
+    MFS.setup(num_rings = 6,
+              num_wedges = 10,
+             )
+    MFS.run(duration = 10)
+    print("logged %d frames, states %r" % (len(MFS.frame_log), MFS.get_logged_states().shape))
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic photodiode and amplifier recordings, for testing trigger timing
+without the lab hardware.
+
+The on/off states of the vsync patch cells in a FrameLog ('patch0',
+'patch1', ...) are turned into the sampled output of one photodiode per
+cell: each state change starts at its flip time plus the input latency and
+the scan-out offset of the cell, the panel approaches the new level with
+separate rise and fall time constants, and the amplifier samples the result
+with its own (drifting) clock and adds noise.  The samples are quantized to
+the raw interleaved integer format read by trigger_decoder.open_trace.
+"""
+from __future__ import print_function
+
+import numpy as np
+
+SAMPLE_RATE_DEFAULT = 10000.0 #Hz
+RISE_TIME_DEFAULT   = 0.001   #seconds, 10-90% of an LCD panel turning white
+FALL_TIME_DEFAULT   = 0.004   #seconds, 90-10% turning black
+LATENCY_DEFAULT     = 0.010   #seconds, from flip to the start of scan-out
+NOISE_DEFAULT       = 0.02    #standard deviation, fraction of the on/off difference
+LEVELS_DEFAULT      = (1000, 20000) #raw amplifier counts with the patch off/on
+PADDING_DEFAULT     = 0.5     #seconds recorded before the first and after the last flip
+
+#a first order response covers 10-90% in ln(9) time constants
+TIME_CONSTANT_FACTOR = 1.0/np.log(9.0)
+
+def patch_channels(frame_log):
+    "names of the vsync patch cell channels of a FrameLog"
+    return [name for name in frame_log.channel_names if name.startswith('patch')]
+
+def scanout_offsets(cell_tops, screen_bottom, screen_top, display_rate):
+    """ delay of each cell relative to the top of the screen, for a panel
+        scanned out from top to bottom over one frame period
+    """
+    cell_tops = np.asarray(cell_tops, dtype = float)
+    return (screen_top - cell_tops)/float(screen_top - screen_bottom)/display_rate
+
+def photodiode_response(t_change, levels, t_samples, rise_time = RISE_TIME_DEFAULT, fall_time = FALL_TIME_DEFAULT, initial_level = None):
+    """ first order panel response at 't_samples' to the piecewise constant
+        'levels' starting at the (sorted) times 't_change'
+    """
+    t_change = np.asarray(t_change, dtype = float)
+    levels   = np.asarray(levels, dtype = float)
+    if initial_level is None:
+        initial_level = levels[0]
+    prev_levels = np.concatenate(([initial_level], levels[:-1]))
+    tau = np.where(levels >= prev_levels, rise_time, fall_time)*TIME_CONSTANT_FACTOR
+    # the level reached at each change only depends on the previous segment,
+    # a cheap scalar recursion over the (few) changes
+    y0 = np.empty(len(levels))
+    y = initial_level
+    for i in range(len(levels)):
+        if i > 0:
+            dt = t_change[i] - t_change[i-1]
+            y = levels[i-1] + (y - levels[i-1])*np.exp(-dt/tau[i-1])
+        y0[i] = y
+    # then every sample is evaluated in its segment at once
+    seg = np.searchsorted(t_change, t_samples, side = 'right') - 1
+    before = seg < 0
+    seg = np.maximum(seg, 0)
+    dt = np.maximum(t_samples - t_change[seg], 0.0)
+    response = levels[seg] + (y0[seg] - levels[seg])*np.exp(-dt/tau[seg])
+    response[before] = initial_level
+    return response
+
+def simulate_photodiode(t_flip,
+                        states,
+                        sample_rate    = SAMPLE_RATE_DEFAULT,
+                        rise_time      = RISE_TIME_DEFAULT,
+                        fall_time      = FALL_TIME_DEFAULT,
+                        latency        = LATENCY_DEFAULT,
+                        scanout_offset = 0.0,
+                        noise          = NOISE_DEFAULT,
+                        clock_drift    = 0.0,
+                        levels         = LEVELS_DEFAULT,
+                        padding        = PADDING_DEFAULT,
+                        dtype          = np.int16,
+                        seed           = None,
+                       ):
+    """ sampled photodiode signals for the (frames x channels) on/off
+        'states' shown from the flip times 't_flip' on.
+
+        'scanout_offset' is a delay per channel (see scanout_offsets) and
+        'clock_drift' the relative error of the amplifier clock in parts
+        per million, positive when it runs fast.  Returns the (samples x
+        channels) raw trace and the true time of every sample, the first
+        sample being taken 'padding' seconds before the first flip.
+    """
+    t_flip = np.asarray(t_flip, dtype = float)
+    states = np.asarray(states, dtype = float)
+    if states.ndim == 1:
+        states = states[:,np.newaxis]
+    num_channels = states.shape[1]
+    scanout_offset = np.broadcast_to(np.asarray(scanout_offset, dtype = float), (num_channels,))
+    low, high = levels
+    t_start = t_flip[0] - padding
+    duration = t_flip[-1] - t_flip[0] + 2*padding
+    num_samples = int(duration*sample_rate)
+    # the amplifier believes it samples at 'sample_rate'
+    t_samples = t_start + np.arange(num_samples)/(sample_rate*(1.0 + 1e-6*clock_drift))
+    rng = np.random.RandomState(seed)
+    info = np.iinfo(dtype)
+    trace = np.empty((num_samples, num_channels), dtype = dtype)
+    for ch in range(num_channels):
+        # only the frames at which the state changes matter
+        s = states[:,ch]
+        changed = np.concatenate(([True], s[1:] != s[:-1]))
+        t_change = t_flip[changed] + latency + scanout_offset[ch]
+        x = photodiode_response(t_change, low + (high - low)*s[changed], t_samples,
+                                rise_time = rise_time,
+                                fall_time = fall_time,
+                                initial_level = low,
+                               )
+        x += rng.normal(scale = noise*abs(high - low), size = num_samples)
+        trace[:,ch] = np.clip(np.round(x), info.min, info.max)
+    return (trace, t_samples)
+
+def simulate_frame_log(frame_log, channels = None, **kwargs):
+    """ simulate one photodiode per vsync patch cell of 'frame_log' (or per
+        channel of 'channels'), see simulate_photodiode for the options
+    """
+    if channels is None:
+        channels = patch_channels(frame_log)
+    cols = [frame_log.channel_names.index(name) for name in channels]
+    return simulate_photodiode(frame_log.t, frame_log.values[:,cols], **kwargs)
+
+def write_trace(filename, trace):
+    "write a trace in the raw interleaved amplifier format, see trigger_decoder.open_trace"
+    np.ascontiguousarray(trace).tofile(filename)
+
+################################################################################
+# TEST CODE
+################################################################################
+if __name__ == "__main__":
+    import os, tempfile, time
+    from frame_log import FrameLog
+    from trigger_decoder import decode_file
+    from vsync_patch import VsyncPatch_Version2
+
+    # a VsyncPatch_Version2 pulse train at 144 Hz, codes counted in frames
+    DISPLAY_RATE = 144.0
+    PULSE_FRAMES, TIMING_BASE_FRAMES = VsyncPatch_Version2.frame_timing(DISPLAY_RATE)
+    codes = np.arange(1, 19)
+    states = []
+    for code in codes:
+        gap = int((code + 0.25)*TIMING_BASE_FRAMES + 0.5)
+        states += [1]*PULSE_FRAMES + [0]*gap + [1]*PULSE_FRAMES + [0]*100
+    log = FrameLog(['patch0'])
+    # flips on the refresh grid with a little jitter
+    t_flip = np.arange(len(states))/DISPLAY_RATE + np.random.normal(scale = 1e-4, size = len(states))
+    for t, s in zip(t_flip, states):
+        log.record(t, (s,))
+
+    trace, t_samples = simulate_frame_log(log, clock_drift = 50.0, seed = 0)
+    filename = os.path.join(tempfile.gettempdir(), "simulated_photodiode.raw")
+    write_trace(filename, trace)
+    t_start = time.time()
+    events = decode_file(filename, SAMPLE_RATE_DEFAULT, version = 2, display_rate = DISPLAY_RATE)
+    print("decoded %d events in %0.3f seconds" % (len(events), time.time() - t_start))
+    print("codes correct: %s" % np.array_equal(events['code'], codes))
+    # onset of each code is its first flip plus the latency
+    first_flips = t_flip[np.flatnonzero(np.diff(np.concatenate(([0], states))) > 0)[::2]]
+    lag = t_samples[events['onset']] - first_flips[:len(events)]
+    print("onset lag: mean %0.2f ms, std %0.3f ms" % (1e3*lag.mean(), 1e3*lag.std()))
+    os.remove(filename)
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+
+import numpy as np
+import OpenGL.GL as gl
+
+#local imports
+from common import COLORS, DEFAULT_FLASH_RATE, pol2cart
+
+from screen import Screen
+
+from quad_batch import QuadBatch
+
+SEGMENT_ANGLE_DEFAULT = np.radians(4.0) #largest arc drawn as one straight edge
+
+def ring_edges(num_rings, inner_radius, outer_radius, ring_spacing = 'log'):
+    """ the num_rings + 1 ring boundary radii, 'log' spacing scales the
+        rings with eccentricity like the cortical magnification
+    """
+    if ring_spacing == 'log':
+        return np.exp(np.linspace(np.log(inner_radius), np.log(outer_radius), num_rings + 1))
+    elif ring_spacing == 'linear':
+        return np.linspace(inner_radius, outer_radius, num_rings + 1)
+    raise ValueError("ring_spacing must be 'log' or 'linear', not '%s'" % ring_spacing)
+
+def polar_check_vertices(radii, num_wedges, segments_per_check = 1):
+    """ (4*N, 2) vertices of the quads of a polar checkerboard with rings
+        between the successive 'radii', each check subdivided into
+        'segments_per_check' quads along its arc; the quads are ordered by
+        ring, then wedge (starting at angle 0, counterclockwise), then segment
+    """
+    radii = np.asarray(radii, dtype = float)
+    num_rings = len(radii) - 1
+    theta = np.linspace(0, 2*np.pi, num_wedges*segments_per_check + 1)
+    r0 = radii[:-1,np.newaxis]; r1 = radii[1:,np.newaxis]
+    a0 = theta[np.newaxis,:-1];  a1 = theta[np.newaxis,1:]
+    #(rings x segments x 4 corners) in polar coordinates, counterclockwise
+    r = np.stack(np.broadcast_arrays(r0, r0, r1, r1), axis = -1)
+    a = np.stack(np.broadcast_arrays(a0, a1, a1, a0), axis = -1)
+    x, y = pol2cart(r, a)
+    return np.stack((x, y), axis = -1).reshape((-1,2)).astype(np.float32)
+
+def wrapped_runs(first, count, period):
+    "the (first, count) index runs covering 'count' items from 'first' on, modulo 'period'"
+    first = int(first) % period
+    count = min(int(count), period)
+    if first + count <= period:
+        return [(first, count)]
+    return [(first, period - first), (0, first + count - period)]
+
+class PolarCheckerBoard:
+    """ A checkerboard of 'num_rings' rings by 'num_wedges' wedges, tessellated
+        once into a vertex buffer with the two contrast phases as color sets.
+
+        Moving stimuli never re-tessellate: a rotating wedge is a range of
+        wedges plus a rotation by less than one wedge, an expanding ring a
+        range of rings plus, for log spaced rings, a scaling by less than one
+        ring ratio (see wedge_state and ring_state).
+    """
+    def __init__(self,
+                 num_rings = 8,
+                 num_wedges = 16,
+                 inner_radius = 0.05,
+                 outer_radius = 1.0,
+                 ring_spacing = 'log',
+                 segments_per_check = None,
+                 color1 = COLORS['white'],
+                 color2 = COLORS['black'],
+                 ):
+        self.num_rings  = int(num_rings)
+        self.num_wedges = int(num_wedges)
+        self.ring_spacing = ring_spacing
+        self.radii = ring_edges(self.num_rings, inner_radius, outer_radius, ring_spacing)
+        if segments_per_check is None:
+            segments_per_check = max(int(np.ceil(2*np.pi/self.num_wedges/SEGMENT_ANGLE_DEFAULT)), 1)
+        self.segments_per_check = segments_per_check
+        self.wedge_angle = 2*np.pi/self.num_wedges
+        #run colors through filter to catch names and convert to RGB
+        self.color1 = COLORS.get(color1, color1)
+        self.color2 = COLORS.get(color2, color2)
+        self.batch = QuadBatch(polar_check_vertices(self.radii, self.num_wedges, segments_per_check),
+                               num_color_sets = 2,
+                               dynamic = False,
+                              )
+        self.set_colors(self.color1, self.color2)
+
+    def set_colors(self, color1, color2):
+        "color set 0 has 'color1' on the checks with even ring + wedge, set 1 the reverse"
+        rings, wedges = np.meshgrid(np.arange(self.num_rings), np.arange(self.num_wedges), indexing = 'ij')
+        even = np.repeat(((rings + wedges) % 2 == 0).ravel(), self.segments_per_check)
+        self.batch.set_colors(np.where(even[:,np.newaxis], color1, color2), color_set = 0)
+        self.batch.set_colors(np.where(even[:,np.newaxis], color2, color1), color_set = 1)
+        self.color1 = color1
+        self.color2 = color2
+
+    def wedge_state(self, angle, num_wedges):
+        """ (rotation, wedge_range) showing 'num_wedges' wedges whose leading
+            edge starts at 'angle' (radians)
+        """
+        k = int(np.floor(angle/self.wedge_angle))
+        return (angle - k*self.wedge_angle, (k, num_wedges))
+
+    def ring_state(self, position, num_rings):
+        """ (scale, ring_range) showing 'num_rings' rings from the continuous
+            ring index 'position' on; with linear ring spacing the band moves
+            by whole rings
+        """
+        k = int(np.floor(position))
+        scale = 1.0
+        if self.ring_spacing == 'log':
+            ratio = self.radii[1]/self.radii[0]
+            scale = ratio**(position - k)
+        return (scale, (k, num_rings))
+
+    def quad_runs(self, ring_range = None, wedge_range = None):
+        "(first_quads, quad_counts) of the checks in the (first, count) ranges, which wrap around"
+        S = self.segments_per_check
+        W = self.num_wedges
+        if ring_range is None:
+            ring_runs = [(0, self.num_rings)]
+        else:
+            ring_runs = wrapped_runs(ring_range[0], ring_range[1], self.num_rings)
+        if wedge_range is None:
+            #whole rings are contiguous
+            return ([first*W*S for first, count in ring_runs], [count*W*S for first, count in ring_runs])
+        wedge_runs = wrapped_runs(wedge_range[0], wedge_range[1], W)
+        firsts = []
+        counts = []
+        for ring_first, ring_count in ring_runs:
+            for ring in range(ring_first, ring_first + ring_count):
+                for wedge_first, wedge_count in wedge_runs:
+                    firsts.append((ring*W + wedge_first)*S)
+                    counts.append(wedge_count*S)
+        return (firsts, counts)
+
+    def render(self, color_set = 0, rotation = 0.0, scale = 1.0, ring_range = None, wedge_range = None):
+        """ draw the checks in the ring and wedge ranges (default all) with
+            the contrast phase 'color_set', centered at the current origin,
+            rotated by 'rotation' radians and scaled by 'scale'
+        """
+        gl.glPushMatrix()
+        try:
+            if rotation:
+                gl.glRotatef(np.degrees(rotation), 0.0, 0.0, 1.0)
+            if scale != 1.0:
+                gl.glScalef(scale, scale, 1.0)
+            if ring_range is None and wedge_range is None:
+                self.batch.render(color_set = color_set)
+            else:
+                firsts, counts = self.quad_runs(ring_range, wedge_range)
+                self.batch.render_ranges(firsts, counts, color_set = color_set)
+        finally:
+            gl.glPopMatrix()
+
+class PolarCheckerBoardScreen(Screen):
+    def setup(self,
+              num_rings = 8,
+              num_wedges = 16,
+              inner_radius = 0.05,
+              outer_radius = 1.0,
+              ring_spacing = 'log',
+              check_color1 = 'white',
+              check_color2 = 'black',
+              screen_background_color = 'neutral-gray',
+              flash_rate = DEFAULT_FLASH_RATE, #contrast reversals per second
+              mode = 'full',         #'full', 'wedge' (rotating) or 'ring' (expanding)
+              wedge_width = 4,       #wedges shown in 'wedge' mode
+              rotation_period = 32.0,#seconds per revolution of the wedge
+              ring_width = 2,        #rings shown in 'ring' mode
+              expansion_period = 32.0,#seconds for the ring to sweep all rings
+              pos_x = 0.0,
+              pos_y = 0.0,
+              vsync_patch = "bottom-right",
+              vsync_value = None,
+              log_frames = False,
+              probe_patches = False,
+             ):
+        Screen.setup(self,
+                     background_color = screen_background_color,
+                     vsync_patch = vsync_patch,
+                     vsync_value = vsync_value,
+                     log_frames = log_frames,
+                     probe_patches = probe_patches,
+                     )
+        if not mode in ('full', 'wedge', 'ring'):
+            raise ValueError("mode must be 'full', 'wedge' or 'ring', not '%s'" % mode)
+        self.PCB = PolarCheckerBoard(num_rings = num_rings,
+                                     num_wedges = num_wedges,
+                                     inner_radius = inner_radius,
+                                     outer_radius = outer_radius,
+                                     ring_spacing = ring_spacing,
+                                     color1 = check_color1,
+                                     color2 = check_color2,
+                                    )
+        self.flash_rate = flash_rate
+        self.mode = mode
+        self.wedge_width = wedge_width
+        self.rotation_period = rotation_period
+        self.ring_width = ring_width
+        self.expansion_period = expansion_period
+        self.pos_x = pos_x
+        self.pos_y = pos_y
+        self._color_set = 0
+        self._rotation = 0.0
+        self._scale = 1.0
+        self._ring_range = None
+        self._wedge_range = None
+
+    def start_time(self, t):
+        Screen.start_time(self, t)
+        self._t0 = t
+        self.update(t, 0.0)
+
+    def update(self, t, dt):
+        Screen.update(self, t, dt) #important, this handles vsync updates
+        elapsed = t - self._t0
+        self._color_set = int(elapsed*self.flash_rate) % 2
+        if self.mode == 'wedge':
+            angle = 2*np.pi*elapsed/self.rotation_period
+            self._rotation, self._wedge_range = self.PCB.wedge_state(angle, self.wedge_width)
+        elif self.mode == 'ring':
+            position = self.PCB.num_rings*elapsed/self.expansion_period
+            self._scale, self._ring_range = self.PCB.ring_state(position, self.ring_width)
+
+    def render(self):
+        Screen.render_before(self)
+        gl.glLoadIdentity()
+        gl.glTranslatef(self.pos_x, self.pos_y, 0.0)
+        self.PCB.render(color_set = self._color_set,
+                        rotation = self._rotation,
+                        scale = self._scale,
+                        ring_range = self._ring_range,
+                        wedge_range = self._wedge_range,
+                       )
+        gl.glLoadIdentity()
+        Screen.render_after(self)
+
+    def get_reversing_boards(self):
+        #the innermost check at angle 0
+        color = self.PCB.color1 if self._color_set == 0 else self.PCB.color2
+        return [('polar_checkerboard', color, self.flash_rate)]
+
+################################################################################
+# TEST CODE
+################################################################################
+if __name__ == "__main__":
+    import sys
+    mode = sys.argv[1] if len(sys.argv) > 1 else 'wedge'
+    PCBS = PolarCheckerBoardScreen.with_pygame_display()
+    PCBS.setup(num_rings = 12,
+               num_wedges = 24,
+               mode = mode, #'full', 'wedge' or 'ring'
+               rotation_period = 8.0,
+               expansion_period = 8.0,
+               flash_rate = 8.0,
+              )
+    PCBS.run(duration = 16)
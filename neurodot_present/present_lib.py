@@ -11,6 +11,7 @@ import fractions
 import copy
 
 from . import resources
+from .text_rendering import RenderedText, fit_font_size
 
 
 DEBUG = False
@@ -933,6 +934,7 @@ class TextDisplay(Screen):
                            font_type = None,
                            screen_bgColor = 'white',
                            vsync_value = 0,
+                           text_atlas = None,
                            ):
         #if text_bgColor is unspecified, set to same as background color (renders faster than using alpha)
         if text_bgColor == None:
@@ -945,6 +947,8 @@ class TextDisplay(Screen):
         self.text_bgColor = COLORS[text_bgColor]
         self.font_size = font_size
         self.font_type = font_type
+        #a TextAtlas with the strings pre-rendered in this font, size and colors
+        self.text_atlas = text_atlas
 
         self.textSurface = self.render_surface(self.text_content, self.font_size)
 
@@ -956,29 +960,15 @@ class TextDisplay(Screen):
         else:
             font_path = resources.get_fontpath(self.font_type)
 
+        #Scaling font; attempting to render text that is too wide/tall sets the raster position off screen and nothing is rendered
+        font_size = fit_font_size(text_content, font_path, font_size, (self.screen_width, self.screen_height))
+
         #render textSurface from text_content
-        self.font = pygame.font.Font(font_path, font_size)
+        self.font = resources.get_font(font_path, font_size)
         self.textSurface = self.font.render(text_content, 1, \
             [int(self.text_color[0]*255), int(self.text_color[1]*255), int(self.text_color[2]*255)], \
             [int(self.text_bgColor[0]*255), int(self.text_bgColor[1]*255), int(self.text_bgColor[2]*255)])
 
-        #Scaling font; attempting to render text that is too wide/tall sets the raster position off screen and nothing is rendered
-        if self.textSurface.get_width() > self.screen_width:
-            percent_scale = float(self.screen_width) / self.textSurface.get_width()
-            self.font = pygame.font.Font(font_path, int(font_size * percent_scale))
-            self.textSurface = self.font.render(text_content, 1, \
-                [int(self.text_color[0]*255), int(self.text_color[1]*255), int(self.text_color[2]*255)], \
-                [int(self.text_bgColor[0]*255), int(self.text_bgColor[1]*255), int(self.text_bgColor[2]*255)])
-            print("WARNING (TextDisplay): '", text_content, "' is too wide for screen; scaling to fit")
-
-        if self.textSurface.get_height() > self.screen_height:
-            percent_scale = float(self.screen_height) / self.textSurface.get_height()
-            self.font = pygame.font.Font(font_path, int(font_size * percent_scale))
-            self.textSurface = self.font.render(text_content, 1, \
-                [int(self.text_color[0]*255), int(self.text_color[1]*255), int(self.text_color[2]*255)], \
-                [int(self.text_bgColor[0]*255), int(self.text_bgColor[1]*255), int(self.text_bgColor[2]*255)])
-            print("WARNING (TextDisplay): '", text_content, "' is too tall for screen; scaling to fit")
-
         return self.textSurface
 
     def run(self, text_content = None, duration = 5, vsync_value = None, scale_refObj = None):
@@ -993,8 +983,13 @@ class TextDisplay(Screen):
         t  = pygame.time.get_ticks()
         is_running = True
 
-        #render textSurface
-        self.textSurface = self.render_surface(self.text_content, self.font_size)
+        use_atlas = (not self.text_atlas is None) and (self.text_content in self.text_atlas) and (scale_refObj is None)
+        if use_atlas:
+            width, height = self.text_atlas.size(self.text_content)
+        else:
+            #render textSurface
+            self.textSurface = self.render_surface(self.text_content, self.font_size)
+            width, height = self.textSurface.get_size()
 
         # check if we are scaling size to match other TextDisplay obj's last run() and scale textSurface if needed
         if not scale_refObj is None:
@@ -1002,14 +997,16 @@ class TextDisplay(Screen):
             width_scale = float(ref_surface.get_width()) / float(self.textSurface.get_width())
             height_scale = float(ref_surface.get_height()) / float(self.textSurface.get_height())
             self.textSurface = pygame.transform.scale(self.textSurface, (int(width_scale * self.textSurface.get_width()), int(height_scale * self.textSurface.get_height())))
+            width, height = self.textSurface.get_size()
 
         #set background color
         gl.glClearColor(self.screen_bgColor[0], self.screen_bgColor[1], self.screen_bgColor[2], 1.0)
 
-        #prepare some values for rendering centered text
-        centerOffset_pixels = [-self.textSurface.get_width()/2, -self.textSurface.get_height()/2]
-        raster_position = self.get_coords(*centerOffset_pixels)
-        textData = pygame.image.tostring(self.textSurface, "RGBA", True)
+        #prepare some values for rendering centered text, uploaded once as a texture
+        left, bottom = self.get_coords(-width/2.0, -height/2.0)
+        right, top   = self.get_coords( width/2.0,  height/2.0)
+        if not use_atlas:
+            rendered_text = RenderedText(self.textSurface)
 
         while is_running:
             #prepare rendering model
@@ -1018,8 +1015,10 @@ class TextDisplay(Screen):
             gl.glLoadIdentity()
 
             #render text
-            gl.glRasterPos2d(*raster_position)
-            gl.glDrawPixels(self.textSurface.get_width(), self.textSurface.get_height(), gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, textData)
+            if use_atlas:
+                self.text_atlas.draw(self.text_content, left, bottom, right, top)
+            else:
+                rendered_text.draw(left, bottom, right, top)
 
             #render the vsync patch
             self.vsync_patch.render(value = vsync_value)
@@ -1036,6 +1035,9 @@ class TextDisplay(Screen):
             if t - t0 > duration:
                 is_running = False
 
+        if not use_atlas:
+            rendered_text.release()
+
     def get_coords(self, xPos, yPos): #xPos, yPos in pixels with origin at center of screen
         xPos = self.screen_right * (float(xPos) / (self.screen_width/2))
         yPos = self.screen_top * (float(yPos) / (self.screen_height/2))
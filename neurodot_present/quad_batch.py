@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+
+import ctypes
+import numpy as np
+import OpenGL.GL as gl
+
+FLOAT_SIZE = 4 #bytes in a GL_FLOAT
+
+#-------------------------------------------------------------------------------
+# geometry helpers
+def rect_vertices(left, bottom, right, top):
+    """ build the (4*N, 2) vertex array of N axis aligned rectangles, the
+        arguments may be scalars or length N arrays
+    """
+    left, bottom, right, top = np.broadcast_arrays(*[np.atleast_1d(np.asarray(a, dtype = np.float32))
+                                                    for a in (left, bottom, right, top)])
+    vertices = np.empty((left.shape[0], 4, 2), dtype = np.float32)
+    vertices[:,0,0] = left ; vertices[:,0,1] = bottom  #left  bottom
+    vertices[:,1,0] = right; vertices[:,1,1] = bottom  #right bottom
+    vertices[:,2,0] = right; vertices[:,2,1] = top     #right top
+    vertices[:,3,0] = left ; vertices[:,3,1] = top     #left  top
+    return vertices.reshape((-1,2))
+
+################################################################################
+class QuadBatch:
+    """ A set of quads drawn from one vertex buffer with a per-vertex colour
+        buffer, so that the whole set costs a single glDrawArrays call.
+
+        The colour buffer can hold several 'color sets' (e.g. one per code
+        value of a patch) which are selected at render time without any
+        upload, or a single set that is streamed with `set_colors`.
+    """
+    def __init__(self,
+                 vertices,
+                 num_color_sets = 1,
+                 dynamic = True,
+                 ):
+        vertices = np.ascontiguousarray(vertices, dtype = np.float32).reshape((-1,2))
+        if len(vertices) % 4:
+            raise ValueError("number of vertices (%d) must be a multiple of 4" % len(vertices))
+        self.vertices = vertices
+        self.num_vertices = len(vertices)
+        self.num_quads    = self.num_vertices // 4
+        self.num_color_sets = int(num_color_sets)
+        self.colors = np.zeros((self.num_color_sets, self.num_vertices, 3), dtype = np.float32)
+        self.dynamic = dynamic
+        self._vertex_buffer = None  #GL buffers are created lazily on first render, when a context exists
+        self._color_buffer  = None
+
+    def set_colors(self, colors, color_set = 0):
+        """ 'colors' is a single RGB triple, a (num_quads, 3) array of per quad
+            colors or a (num_quads, 4, 3) array of per vertex colors
+        """
+        self.update_colors(colors, first_quad = 0, color_set = color_set)
+
+    def update_colors(self, colors, first_quad = 0, color_set = 0):
+        """ overwrite the colors of a contiguous run of quads starting at
+            'first_quad', only that range of the GL buffer is re-uploaded
+        """
+        colors = np.asarray(colors, dtype = np.float32)
+        if colors.ndim == 1:   #single color for all remaining quads
+            colors = np.tile(colors, ((self.num_quads - first_quad)*4, 1))
+        elif colors.ndim == 2: #one color per quad
+            colors = np.repeat(colors, 4, axis = 0)
+        else:                  #one color per vertex
+            colors = colors.reshape((-1,3))
+        v0 = 4*first_quad
+        if v0 + len(colors) > self.num_vertices:
+            raise ValueError("too many colors (%d quads) for %d quads starting at quad %d" % (len(colors)//4, self.num_quads, first_quad))
+        self.colors[color_set, v0:v0 + len(colors)] = colors
+        if not self._color_buffer is None:
+            offset = (color_set*self.num_vertices + v0)*3*FLOAT_SIZE
+            gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self._color_buffer)
+            gl.glBufferSubData(gl.GL_ARRAY_BUFFER, offset, colors.nbytes, colors)
+            gl.glBindBuffer(gl.GL_ARRAY_BUFFER, 0)
+
+    def update_changed_colors(self, colors, color_set = 0, max_runs = 32):
+        """ set the (num_quads, 3) per quad 'colors', re-uploading only the
+            runs of quads whose color differs from the current one, or the
+            whole set in one call if there are more than 'max_runs' runs;
+            returns the number of changed quads
+        """
+        colors = np.asarray(colors, dtype = np.float32).reshape((self.num_quads, 3))
+        changed = np.any(self.colors[color_set, ::4] != colors, axis = 1)
+        num_changed = np.count_nonzero(changed)
+        if num_changed == 0:
+            return 0
+        #starts and ends of the runs of changed quads
+        steps = np.diff(np.concatenate(([0], changed.view(np.int8), [0])))
+        starts = np.flatnonzero(steps == 1)
+        ends   = np.flatnonzero(steps == -1)
+        if len(starts) > max_runs:
+            self.set_colors(colors, color_set = color_set)
+        else:
+            for start, end in zip(starts, ends):
+                self.update_colors(colors[start:end], first_quad = int(start), color_set = color_set)
+        return num_changed
+
+    def _create_buffers(self):
+        usage = gl.GL_DYNAMIC_DRAW if self.dynamic else gl.GL_STATIC_DRAW
+        self._vertex_buffer = gl.glGenBuffers(1)
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self._vertex_buffer)
+        gl.glBufferData(gl.GL_ARRAY_BUFFER, self.vertices.nbytes, self.vertices, gl.GL_STATIC_DRAW)
+        self._color_buffer = gl.glGenBuffers(1)
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self._color_buffer)
+        gl.glBufferData(gl.GL_ARRAY_BUFFER, self.colors.nbytes, self.colors, usage)
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, 0)
+
+    def render(self, color_set = 0, first_quad = 0, num_quads = None):
+        if self._vertex_buffer is None:
+            self._create_buffers()
+        if num_quads is None:
+            num_quads = self.num_quads - first_quad
+        gl.glDisable(gl.GL_LIGHTING)
+        gl.glEnableClientState(gl.GL_VERTEX_ARRAY)
+        gl.glEnableClientState(gl.GL_COLOR_ARRAY)
+        try:
+            gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self._vertex_buffer)
+            gl.glVertexPointer(2, gl.GL_FLOAT, 0, ctypes.c_void_p(0))
+            gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self._color_buffer)
+            offset = color_set*self.num_vertices*3*FLOAT_SIZE
+            gl.glColorPointer(3, gl.GL_FLOAT, 0, ctypes.c_void_p(offset))
+            gl.glDrawArrays(gl.GL_QUADS, 4*first_quad, 4*num_quads)
+        finally:
+            gl.glBindBuffer(gl.GL_ARRAY_BUFFER, 0)
+            gl.glDisableClientState(gl.GL_COLOR_ARRAY)
+            gl.glDisableClientState(gl.GL_VERTEX_ARRAY)
+            gl.glEnable(gl.GL_LIGHTING)
+
+    def render_ranges(self, first_quads, quad_counts, color_set = 0):
+        """ draw several runs of quads, run i being quad_counts[i] quads from
+            first_quads[i] on, with a single glMultiDrawArrays call
+        """
+        if self._vertex_buffer is None:
+            self._create_buffers()
+        firsts = 4*np.asarray(first_quads, dtype = np.int32)
+        counts = 4*np.asarray(quad_counts, dtype = np.int32)
+        if not len(firsts):
+            return
+        gl.glDisable(gl.GL_LIGHTING)
+        gl.glEnableClientState(gl.GL_VERTEX_ARRAY)
+        gl.glEnableClientState(gl.GL_COLOR_ARRAY)
+        try:
+            gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self._vertex_buffer)
+            gl.glVertexPointer(2, gl.GL_FLOAT, 0, ctypes.c_void_p(0))
+            gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self._color_buffer)
+            offset = color_set*self.num_vertices*3*FLOAT_SIZE
+            gl.glColorPointer(3, gl.GL_FLOAT, 0, ctypes.c_void_p(offset))
+            gl.glMultiDrawArrays(gl.GL_QUADS, firsts, counts, len(firsts))
+        finally:
+            gl.glBindBuffer(gl.GL_ARRAY_BUFFER, 0)
+            gl.glDisableClientState(gl.GL_COLOR_ARRAY)
+            gl.glDisableClientState(gl.GL_VERTEX_ARRAY)
+            gl.glEnable(gl.GL_LIGHTING)
+
+    def __del__(self):
+        # __del__ gets called sometimes when render() hasn't yet been run and the GL buffers don't yet exist
+        try:
+            if not self._vertex_buffer is None:
+                gl.glDeleteBuffers(2, [self._vertex_buffer, self._color_buffer])
+        except Exception:
+            pass
+
+################################################################################
+class StreamingBuffer:
+    """ A vertex buffer whose contents are replaced every frame.  Before each
+        upload the old storage is orphaned (glBufferData with no data), so
+        the driver hands out fresh memory instead of stalling until draws
+        still reading the previous frame's data have finished.
+    """
+    def __init__(self, nbytes = 0):
+        self.nbytes = nbytes
+        self._buffer = None  #GL buffer is created lazily on first upload, when a context exists
+
+    def upload(self, data):
+        "replace the contents with 'data', the buffer is left bound"
+        if self._buffer is None:
+            self._buffer = gl.glGenBuffers(1)
+        self.nbytes = max(self.nbytes, data.nbytes)
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self._buffer)
+        gl.glBufferData(gl.GL_ARRAY_BUFFER, self.nbytes, None, gl.GL_STREAM_DRAW)
+        gl.glBufferSubData(gl.GL_ARRAY_BUFFER, 0, data.nbytes, data)
+
+    def __del__(self):
+        try:
+            if not self._buffer is None:
+                gl.glDeleteBuffers(1, [self._buffer])
+        except Exception:
+            pass
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+
+import ctypes
+import numpy as np
+import OpenGL.GL as gl
+
+#local imports
+from common import COLORS, get_display_rate
+from trajectories import flip_index
+from quad_batch import StreamingBuffer
+
+################################################################################
+class RandomDotKinematogram:
+    """ Random-dot motion in an aperture, for use as a sprite array of an
+        AnimatedScreen.
+
+        A fraction 'coherence' of the dots moves in 'direction' (radians) at
+        'speed' (screen units/s), the others each in a random direction.
+        Dots live in the square around the aperture and wrap around at its
+        edges, so the density stays uniform, and only those inside the
+        aperture are drawn.  A dot older than 'lifetime' seconds is replotted
+        at a random position (and its signal/noise role drawn again).
+
+        All dot state is kept in arrays and advanced by whole frames at
+        'display_rate', so the motion does not depend on the loop timing;
+        the visible dots are drawn as points from one streamed vertex buffer.
+    """
+    def __init__(self,
+                 num_dots = 5000,
+                 coherence = 0.5,
+                 direction = 0.0,
+                 speed = 0.5,
+                 lifetime = None,           #seconds, None for unlimited
+                 aperture_center = (0.0, 0.0),
+                 aperture_radius = 0.5,
+                 aperture_shape = 'circle', #or 'square'
+                 dot_size = 4.0,            #pixels
+                 dot_color = 'white',
+                 movement_duration = 5.0,   #seconds
+                 display_rate = None,       #Hz, default settings['display_rate']
+                 seed = None,
+                ):
+        self.num_dots = num_dots
+        self.coherence = coherence
+        self.direction = direction
+        self.speed = speed
+        self.lifetime = lifetime
+        self.aperture_center = np.asarray(aperture_center, dtype = np.float32)
+        self.aperture_radius = aperture_radius
+        if not aperture_shape in ('circle', 'square'):
+            raise ValueError("aperture_shape must be 'circle' or 'square', not '%s'" % aperture_shape)
+        self.aperture_shape = aperture_shape
+        self.dot_size = dot_size
+        self.dot_color = COLORS.get(dot_color, dot_color)
+        self.movement_duration = movement_duration
+        self.display_rate = display_rate
+        self.rng = np.random.RandomState(seed)
+        #dot state, positions relative to the aperture center
+        self.positions  = np.zeros((num_dots, 2), dtype = np.float32)
+        self.velocities = np.zeros((num_dots, 2), dtype = np.float32)
+        self.coherent   = np.zeros(num_dots, dtype = bool)
+        self.ages       = np.zeros(num_dots)
+        self.visible    = np.zeros(num_dots, dtype = bool)
+        self.active = False
+        self.t0 = None
+        self.frame = 0
+        self._buffer = StreamingBuffer(self.positions.nbytes)
+
+    def get_display_rate(self):
+        return get_display_rate(self.display_rate)
+
+    def respawn(self, mask = None):
+        "place the dots selected by the boolean 'mask' (default all) anew"
+        if mask is None:
+            mask = np.ones(self.num_dots, dtype = bool)
+        n = np.count_nonzero(mask)
+        if n == 0:
+            return
+        r = self.aperture_radius
+        self.positions[mask] = self.rng.uniform(-r, r, (n, 2))
+        self.ages[mask] = 0.0
+        self.coherent[mask] = self.rng.random_sample(n) < self.coherence
+        self._set_velocities(mask)
+
+    def _set_velocities(self, mask):
+        coherent = self.coherent[mask]
+        theta = np.where(coherent, self.direction, self.rng.uniform(0, 2*np.pi, len(coherent)))
+        self.velocities[mask,0] = self.speed*np.cos(theta)
+        self.velocities[mask,1] = self.speed*np.sin(theta)
+
+    def set_coherence(self, coherence, direction = None):
+        "change the signal fraction (and direction) from the next frame on"
+        self.coherence = coherence
+        if not direction is None:
+            self.direction = direction
+        self.coherent = self.rng.random_sample(self.num_dots) < coherence
+        self._set_velocities(np.ones(self.num_dots, dtype = bool))
+
+    def start_time(self, t):
+        self.t0 = t
+        self.frame = 0
+        self.respawn()
+        if not self.lifetime is None:
+            #stagger the ages so that the dots do not all expire together
+            self.ages[:] = self.rng.uniform(0, self.lifetime, self.num_dots)
+        self._update_visible()
+        self.active = True
+
+    def update(self, t):
+        "advance the dots by the frames flipped since the last update"
+        if self.t0 is None:
+            self.start_time(t)
+        elapsed = t - self.t0
+        self.active = elapsed < self.movement_duration
+        display_rate = self.get_display_rate()
+        #the frame being rendered is shown at the next flip
+        frame = flip_index(elapsed, display_rate)
+        steps = frame - self.frame
+        if steps <= 0:
+            return
+        self.frame = frame
+        dt = steps/float(display_rate)
+        self.positions += self.velocities*dt
+        self.ages += dt
+        #wrap around the square around the aperture
+        r = self.aperture_radius
+        np.subtract(np.mod(self.positions + r, 2*r), r, out = self.positions)
+        if not self.lifetime is None:
+            self.respawn(self.ages >= self.lifetime)
+        self._update_visible()
+
+    def _update_visible(self):
+        if self.aperture_shape == 'circle':
+            p = self.positions
+            self.visible = (p[:,0]*p[:,0] + p[:,1]*p[:,1]) <= self.aperture_radius**2
+        else:
+            self.visible = np.ones(self.num_dots, dtype = bool)
+
+    def render(self):
+        "draw the dots inside the aperture, returns whether any was drawn"
+        if not self.active:
+            return False
+        points = np.ascontiguousarray(self.positions[self.visible] + self.aperture_center)
+        gl.glDisable(gl.GL_LIGHTING)
+        gl.glEnable(gl.GL_POINT_SMOOTH) #round dots
+        gl.glEnable(gl.GL_BLEND)
+        gl.glBlendFunc(gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA)
+        gl.glPointSize(self.dot_size)
+        gl.glColor3f(*self.dot_color)
+        gl.glEnableClientState(gl.GL_VERTEX_ARRAY)
+        try:
+            self._buffer.upload(points)
+            gl.glVertexPointer(2, gl.GL_FLOAT, 0, ctypes.c_void_p(0))
+            gl.glDrawArrays(gl.GL_POINTS, 0, len(points))
+        finally:
+            gl.glBindBuffer(gl.GL_ARRAY_BUFFER, 0)
+            gl.glDisableClientState(gl.GL_VERTEX_ARRAY)
+            gl.glDisable(gl.GL_BLEND)
+            gl.glDisable(gl.GL_POINT_SMOOTH)
+            gl.glEnable(gl.GL_LIGHTING)
+        return True
+
+    def __len__(self):
+        return self.num_dots
+
+################################################################################
+# TEST CODE
+################################################################################
+if __name__ == "__main__":
+    import sys, time
+    import pygame
+    from common import UserEscape
+    from animated_screen import AnimatedScreen
+
+    NUM_DOTS = 5000
+    rdk = RandomDotKinematogram(num_dots = NUM_DOTS,
+                                coherence = 0.3,
+                                direction = 0.5*np.pi,
+                                lifetime = 0.2,
+                                movement_duration = 10.0,
+                                seed = 0,
+                               )
+    #cost of the dot update alone
+    rdk.start_time(0.0)
+    display_rate = rdk.get_display_rate()
+    t0 = time.time()
+    for i in range(1, 1001):
+        rdk.update(i/float(display_rate))
+    print("%d dots: %0.3f ms per update" % (NUM_DOTS, 1e3*(time.time() - t0)/1000))
+
+    try:
+        aSCR = AnimatedScreen.with_pygame_display()
+        aSCR.setup(sprite_array = rdk,
+                   background_color = 'black',
+                   log_frames = True,
+                  )
+        aSCR.run(duration = 10)
+        dt = np.diff(aSCR.frame_log.t)
+        print("%d frames, median frame interval %0.2f ms, max %0.2f ms" % (len(dt) + 1, 1e3*np.median(dt), 1e3*dt.max()))
+    except UserEscape as exc:
+        print(exc)
+
+    pygame.quit()
+    sys.exit()
@@ -1,3 +1,4 @@
+from __future__ import print_function
 import os
 module_path = os.path.dirname(__file__)
 
@@ -13,3 +14,43 @@ def get_fontpath(font_type):
 def get_bellpath(bell_name):
     bp = os.path.sep.join((module_path, bell_name))
     return unicode(bp)
+
+#shared pygame Font objects by (font path, size), opening a TTF parses the
+#whole file so each one is loaded only once
+_font_pool = {}
+font_load_times = {} #seconds spent loading each pooled font
+
+def get_font(font_path, font_size):
+    """ shared pygame.font.Font for the font file (None for the pygame
+        default font) at the size in points
+    """
+    key = (font_path, int(font_size))
+    font = _font_pool.get(key)
+    if font is None:
+        import time
+        import pygame
+        if not pygame.font.get_init():
+            pygame.font.init()
+        t0 = time.time()
+        font = pygame.font.Font(font_path, key[1])
+        font_load_times[key] = time.time() - t0
+        _font_pool[key] = font
+    return font
+
+def preload_fonts(fonts, verbose = False):
+    """ load the (font path, size) pairs of 'fonts' into the pool at startup;
+        returns the total load time in seconds
+    """
+    total = 0.0
+    for font_path, font_size in fonts:
+        key = (font_path, int(font_size))
+        if not key in _font_pool:
+            get_font(font_path, font_size)
+            total += font_load_times[key]
+            if verbose:
+                print("loaded font %s at %d pt in %0.1f ms" % (font_path, key[1], 1e3*font_load_times[key]))
+    return total
+
+def clear_font_pool():
+    _font_pool.clear()
+    font_load_times.clear()
@@ -14,9 +14,12 @@ import ctypes
 
 #local imports
 from common import SETTINGS,COLORS, SCREEN_LB, SCREEN_LT, SCREEN_RB, SCREEN_RT,\
-                   Quad, UserEscape, write_frame_to_png, enable_VBI_sync_osx
+                   Quad, UserEscape, write_frame_to_png, enable_VBI_sync_osx, luminance
 
 from fixation_cross import FixationCross
+from frame_log import FrameLog
+from event_log import EventRecorder
+from vsync_patch import make_vsync_patch, make_vsync_patch_group, is_single_position, ProbePatches
 
 #delay configurable class loading
 import neurodot_present
@@ -164,6 +167,14 @@ class Screen:
                                                ))
         self.display_surface = display_surface
         self.run_mode = run_mode
+        self.log_frames = False
+        self.frame_log  = None
+        self.finish_flips = False
+        self._finish_flips = False
+        self.probe_patches = False
+        self.probe_row  = None
+        #one event recorder for the vsync patches of this screen, flushed at the end of each run
+        self.event_log  = EventRecorder()
 
         #detect and initialize joysticks
         if use_joysticks:
@@ -186,16 +197,34 @@ class Screen:
               vsync_patch  = "bottom-right",
               fixation_cross = None,
               exit_keys = None,
+              log_frames = False,
+              probe_patches = False,
+              finish_flips = False,
              ):
 
         self.background_color = COLORS.get(background_color, background_color)
 
         self.vsync_value = vsync_value
+        #patches that record their transitions use the screen's event log
+        patch_kwargs = {}
+        if getattr(neurodot_present.get_class_VsyncPatch(), 'RECORDS_EVENTS', False):
+            patch_kwargs['event_log'] = self.event_log
         if vsync_patch == "bottom-right":
             VsyncPatch = neurodot_present.get_class_VsyncPatch()
             #define the vsync patch as being in the bottom right corner
             self.vsync_patch = VsyncPatch.make_bottom_right(screen_bottom = self.screen_bottom,
-                                                            screen_right  = self.screen_right)
+                                                            screen_right  = self.screen_right,
+                                                            **patch_kwargs)
+        elif isinstance(vsync_patch, (str, list, tuple)):
+            #one patch at a named position or (fx, fy) anchor, or a group of
+            #patches at several positions showing the same code, e.g.
+            #["top-left","bottom-right"]
+            VsyncPatch = neurodot_present.get_class_VsyncPatch()
+            screen_rect = (self.screen_left, self.screen_bottom, self.screen_right, self.screen_top)
+            if is_single_position(vsync_patch):
+                self.vsync_patch = make_vsync_patch(VsyncPatch, vsync_patch, *screen_rect, **patch_kwargs)
+            else:
+                self.vsync_patch = make_vsync_patch_group(VsyncPatch, vsync_patch, *screen_rect, **patch_kwargs)
         else:
             self.vsync_patch = vsync_patch
         self.fixation_cross = fixation_cross
@@ -203,6 +232,13 @@ class Screen:
         if exit_keys is None:
             exit_keys = []
         self.exit_keys = exit_keys
+        #record flip times and drawn values for each frame, see get_frame_log_channels
+        self.log_frames = log_frames
+        #show a probe patch mirroring the value of each frame log channel
+        self.probe_patches = probe_patches
+        #block after each flip until it has happened, so that its timestamp is
+        #exact; always done when frames are logged or the patch records events
+        self.finish_flips = finish_flips
         
     def start_rendering(self):
         #gl.glShadeModel(gl.GL_SMOOTH)
@@ -223,6 +259,24 @@ class Screen:
         glu.gluOrtho2D(self.screen_left, self.screen_right, self.screen_bottom, self.screen_top)
         self.ready_to_render = True
         
+    def measure_display_rate(self, num_frames = 120):
+        """ flip 'num_frames' blank frames and estimate the refresh rate from
+            the median flip interval, the result is kept in
+            neurodot_present.settings['display_rate'] where the vsync patches
+            look it up to time their pulses in frames
+        """
+        import pygame
+        self.start_rendering()
+        flip_times = np.zeros(num_frames)
+        for i in range(num_frames):
+            self.render_before()
+            pygame.display.flip()
+            gl.glFinish() #block until the flip has really happened
+            flip_times[i] = time.time()
+        display_rate = 1.0/np.median(np.diff(flip_times))
+        neurodot_present.settings['display_rate'] = display_rate
+        return display_rate
+
     def render_before(self):
         #prepare rendering model
         gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
@@ -233,8 +287,11 @@ class Screen:
     def render_after(self):
         if not self.fixation_cross is None:
             self.fixation_cross.render()
+        #render the probe patches, which also draw the vsync patch if they can
+        if not self.probe_row is None:
+            self.probe_row.render(self.get_frame_log_values())
         #render the vsync patch
-        if not self.vsync_patch is None:
+        if not self.vsync_patch is None and (self.probe_row is None or self.probe_row.patch is None):
             #print("vsync_patch.render: %s" % self.vsync_value)
             self.vsync_patch.render()
 
@@ -244,7 +301,85 @@ class Screen:
 
     def start_time(self, t):
         self.t0 = t
+        self.frame_count = 0 #frames flipped since the start, see frame_flipped
         self.vsync_patch.start_time(t, vsync_value = self.vsync_value)
+        if self.log_frames:
+            self.frame_log = FrameLog(self.get_frame_log_channels() + self.get_patch_log_channels())
+        else:
+            self.frame_log = None
+        self._finish_flips = (self.finish_flips or self.log_frames
+                              or getattr(self.vsync_patch, 'RECORDS_EVENTS', False))
+        num_probes = len(self.get_frame_log_channels()) if self.probe_patches else 0
+        if num_probes == 0:
+            self.probe_row = None
+        elif (self.probe_row is None
+              or self.probe_row.num_probes != num_probes
+              or not self.probe_row.patch in (None, self.vsync_patch)):
+            #laid out around the vsync patch cells, which are drawn with the probes
+            self.probe_row = ProbePatches.make_row(num_probes,
+                                                   screen_left   = self.screen_left,
+                                                   screen_bottom = self.screen_bottom,
+                                                   screen_right  = self.screen_right,
+                                                   patch = self.vsync_patch,
+                                                  )
+
+    def get_reversing_boards(self):
+        """ list of (channel, color, flash_rate) of the pattern reversing
+            boards shown, 'color' being that of a check which alternates on
+            each reversal; each board is logged as the luminance of that
+            check and expected at flash_rate/2 Hz
+        """
+        return []
+
+    def get_frame_log_channels(self):
+        """ names of the values recorded on each frame when 'log_frames' is
+            set, subclasses extend this list and get_frame_log_values
+        """
+        return [channel for channel, color, flash_rate in self.get_reversing_boards()]
+
+    def get_frame_log_values(self):
+        return tuple(luminance(color) for channel, color, flash_rate in self.get_reversing_boards())
+
+    def get_patch_log_channels(self):
+        """ the on/off state of each vsync patch cell is logged after the
+            stimulus channels as 'patch0', 'patch1', ...
+        """
+        if not hasattr(self.vsync_patch, 'get_cell_states'):
+            return []
+        return ['patch%d' % i for i in range(len(self.vsync_patch.get_cell_states()))]
+
+    def get_stimulus_frequencies(self):
+        """ mapping of frame log channel to the fundamental frequency (Hz)
+            it is supposed to be presented at, used for spectral verification
+        """
+        #two reversals per luminance cycle
+        return OrderedDict((channel, flash_rate/2.0) for channel, color, flash_rate in self.get_reversing_boards())
+
+    def record_frame(self, t):
+        if not self.frame_log is None:
+            values = tuple(self.get_frame_log_values())
+            if hasattr(self.vsync_patch, 'get_cell_states'):
+                values += tuple(self.vsync_patch.get_cell_states())
+            self.frame_log.record(t, values)
+
+    def frame_flipped(self, t):
+        """ called by the display loops after each flip, 't' being its
+            timestamp; frames are counted here rather than in render, which
+            also runs once before the loop without being shown
+        """
+        self.record_frame(t)
+        if hasattr(self.vsync_patch, 'frame_flipped'):
+            self.vsync_patch.frame_flipped()
+        self.frame_count += 1
+
+    def stop_event_log(self):
+        """ stop the background flushing of the event log(s) at the end of
+            a run and flush the last events
+        """
+        self.event_log.stop()
+        patch_log = getattr(self.vsync_patch, 'event_log', None)
+        if not patch_log is None and not patch_log is self.event_log:
+            patch_log.stop()
 
     def update(self, t, dt):
         self.vsync_patch.update(t,dt)
@@ -289,29 +424,34 @@ class Screen:
         self.start_rendering()
         #render the scene to the buffer
         self.render()
-        while is_running:
-            t = time.time()
-            dt = t - last_t
-            #dt = clock.tick_busy_loop(display_loop_rate)/1e3 #more accurate than tick, but uses more CPU resources
-            #t = pygame.time.get_ticks()/1e3 #convert milliseconds to seconds
-            #print(t,dt)
-
-            #update the scene model
-            self.update(t, dt)
-
-            if self.ready_to_render:
-                #render the scene to the buffer
-                self.render()
-                #show the scene
-                pygame.display.flip()
-                #gl.glFinish()
-
-            #handle outstanding events
-            is_running = self.pygame_handle_events(mask_user_escape = mask_user_escape)
-            if t - self.t0 > duration and not duration is None:
-                is_running = False
-            #update last time
-            last_t = t
+        try:
+            while is_running:
+                t = time.time()
+                dt = t - last_t
+                #dt = clock.tick_busy_loop(display_loop_rate)/1e3 #more accurate than tick, but uses more CPU resources
+                #t = pygame.time.get_ticks()/1e3 #convert milliseconds to seconds
+                #print(t,dt)
+
+                #update the scene model
+                self.update(t, dt)
+
+                if self.ready_to_render:
+                    #render the scene to the buffer
+                    self.render()
+                    #show the scene
+                    pygame.display.flip()
+                    if self._finish_flips:
+                        gl.glFinish() #block until the flip has really happened, so the timestamp is the flip's
+                    self.frame_flipped(time.time())
+
+                #handle outstanding events
+                is_running = self.pygame_handle_events(mask_user_escape = mask_user_escape)
+                if t - self.t0 > duration and not duration is None:
+                    is_running = False
+                #update last time
+                last_t = t
+        finally:
+            self.stop_event_log()
 
         #now wait until the user presses escape
         if wait_on_user_escape:
@@ -358,6 +498,7 @@ class Screen:
             #record the scene
             pixel_data = gl.glReadPixels(0,0,w,h, gl.GL_RGBA, gl.GL_UNSIGNED_BYTE)
             write_frame_to_png("frame", frame_num, w, h, data = pixel_data, outdir=recording_name)
+            self.frame_flipped(t)
             #show the scene
             if show:
                 pygame.display.flip()
@@ -394,29 +535,35 @@ class Screen:
 
         #render the scene to the buffer
         self.render()
-        while is_running:
-            t = time.time()
-            dt = t - last_t
-            #dt = clock.tick_busy_loop(display_loop_rate)/1e3 #more accurate than tick, but uses more CPU resources
-            #t = pygame.time.get_ticks()/1e3 #convert milliseconds to seconds
-            #print(t,dt)
-
-            #update the scene model
-            self.update(t, dt)
-
-            if self.ready_to_render:
-                pass
-                #render the scene to the buffer
-            self.render()
-                #show the scene
-            self.display_surface.flip()
-
-            #handle outstanding events
-            is_running = self.pygame_handle_events(mask_user_escape = mask_user_escape)
-            if t - self.t0 > duration and not duration is None:
-                is_running = False
-            #update last time
-            last_t = t
+        try:
+            while is_running:
+                t = time.time()
+                dt = t - last_t
+                #dt = clock.tick_busy_loop(display_loop_rate)/1e3 #more accurate than tick, but uses more CPU resources
+                #t = pygame.time.get_ticks()/1e3 #convert milliseconds to seconds
+                #print(t,dt)
+
+                #update the scene model
+                self.update(t, dt)
+
+                if self.ready_to_render:
+                    pass
+                    #render the scene to the buffer
+                self.render()
+                    #show the scene
+                self.display_surface.flip()
+                if self._finish_flips:
+                    gl.glFinish() #block until the flip has really happened, so the timestamp is the flip's
+                self.frame_flipped(time.time())
+
+                #handle outstanding events
+                is_running = self.pygame_handle_events(mask_user_escape = mask_user_escape)
+                if t - self.t0 > duration and not duration is None:
+                    is_running = False
+                #update last time
+                last_t = t
+        finally:
+            self.stop_event_log()
 
         #now wait until the user presses escape
         if wait_on_user_escape:
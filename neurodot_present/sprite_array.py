@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+
+import ctypes
+import numpy as np
+import OpenGL.GL as gl
+
+#local imports
+from common import COLORS
+from trajectories import LinearTrajectory, precompute_positions, flip_index
+from quad_batch import StreamingBuffer, FLOAT_SIZE
+
+VERTEX_FIELDS = 5 #interleaved x, y, r, g, b
+
+#quad corner offsets of each shape in units of the sprite's size and of its
+#thickness, vertices ordered left-top, left-bottom, right-bottom, right-top
+SHAPES = {
+    'cross' : (np.array([[-0.5, 0.0], [-0.5, 0.0], [ 0.5, 0.0], [ 0.5, 0.0],    #horizontal beam
+                         [ 0.0, 0.5], [ 0.0,-0.5], [ 0.0,-0.5], [ 0.0, 0.5]]),  #vertical beam
+               np.array([[ 0.0, 0.5], [ 0.0,-0.5], [ 0.0,-0.5], [ 0.0, 0.5],
+                         [-0.5, 0.0], [-0.5, 0.0], [ 0.5, 0.0], [ 0.5, 0.0]])),
+    'square': (np.array([[-0.5, 0.5], [-0.5,-0.5], [ 0.5,-0.5], [ 0.5, 0.5]]),
+               np.zeros((4,2))),
+}
+
+################################################################################
+class SpriteArray:
+    """ Many sprites of one shape, by default moving at constant velocity,
+        kept as arrays (structure of arrays) instead of one Sprite object
+        each.
+
+        Every frame all positions are computed in one vectorized step from
+        the elapsed time, polar (r, theta) positions are converted where
+        flagged, and the interleaved vertex and color data of the sprites
+        still moving is streamed into a single dynamic vertex buffer drawn
+        with one glDrawArrays call.  Like Sprite objects, a sprite is only
+        drawn during its movement_duration.
+
+        Instead of the linear motion a 'trajectory' (see trajectories) can
+        give the positions; after 'precompute' they are looked up in a
+        table evaluated at the flip time of every frame.
+    """
+    def __init__(self,
+                 position_initial = None,
+                 velocity = None,
+                 position_final = None,
+                 movement_duration = 1.0,  #seconds, scalar or one per sprite
+                 use_polar_coords = False, #scalar or one flag per sprite
+                 size      = 0.1,
+                 thickness = 0.01,
+                 color = 'white',
+                 shape = 'cross',
+                 trajectory = None,
+                ):
+        if trajectory is None:
+            position_initial = np.atleast_2d(np.asarray(position_initial, dtype = float))
+            # check if velocity was specified or if it must be calculated from initial and final positions
+            if not velocity is None:
+                velocity = np.asarray(velocity, dtype = float)
+            elif not position_final is None:
+                duration = np.asarray(movement_duration, dtype = float).reshape((-1,1))
+                velocity = (np.asarray(position_final, dtype = float) - position_initial)/duration
+            else:
+                raise AttributeError('Must specify either velocity, position_final or trajectory of SpriteArray')
+            trajectory = LinearTrajectory(position_initial, velocity, use_polar_coords = use_polar_coords)
+        self.trajectory = trajectory
+        self.num_sprites = N = trajectory.num_sprites
+        self.movement_duration = np.broadcast_to(np.asarray(movement_duration, dtype = float), (N,)).copy()
+        self.size      = np.broadcast_to(np.asarray(size, dtype = float), (N,)).copy()
+        self.thickness = np.broadcast_to(np.asarray(thickness, dtype = float), (N,)).copy()
+        self.shape = shape
+        size_offsets, thickness_offsets = SHAPES[shape]
+        self.vertices_per_sprite = len(size_offsets)
+        #(sprites x vertices x 2) offsets of the vertices from the sprite position
+        self._offsets = (self.size[:,np.newaxis,np.newaxis]*size_offsets +
+                         self.thickness[:,np.newaxis,np.newaxis]*thickness_offsets).astype(np.float32)
+        #(sprites x vertices x 5) interleaved data streamed to the vertex buffer
+        self._vertex_data = np.zeros((N, self.vertices_per_sprite, VERTEX_FIELDS), dtype = np.float32)
+        self.set_colors(color)
+        self.positions = np.zeros((N,2))  #current cartesian positions
+        self.active = np.zeros(N, dtype = bool)
+        self.t0 = None
+        self.position_table = None #(frames x sprites x 2), see precompute
+        self.display_rate = None
+        self._buffer = StreamingBuffer(self._vertex_data.nbytes)
+
+    @classmethod
+    def from_sprites(cls, sprites, shape = 'cross'):
+        """ gather Sprite objects with size, thickness and color attributes
+            (e.g. AnimatedFixationCross) into one SpriteArray
+        """
+        trajectory = LinearTrajectory(position_initial = [s.position_initial for s in sprites],
+                                      velocity         = [s.velocity for s in sprites],
+                                      use_polar_coords = [s.use_polar_coords for s in sprites],
+                                     )
+        return cls(trajectory = trajectory,
+                   movement_duration = [s.movement_duration for s in sprites],
+                   size      = [s.size for s in sprites],
+                   thickness = [s.thickness for s in sprites],
+                   color     = [s.color for s in sprites],
+                   shape = shape,
+                  )
+
+    def set_colors(self, color):
+        "a color name, an RGB triple or one RGB triple per sprite"
+        if isinstance(color, str):
+            color = COLORS[color]
+        color = np.asarray([COLORS[c] if isinstance(c, str) else c for c in color], dtype = np.float32)
+        self._vertex_data[:,:,2:5] = np.broadcast_to(color, (self.num_sprites, 3))[:,np.newaxis,:]
+
+    def start_time(self, t):
+        self.t0 = t
+        self.update(t)
+
+    def precompute(self, num_frames, display_rate):
+        "tabulate the positions at the flip times of 'num_frames' frames"
+        self.position_table = precompute_positions(self.trajectory, num_frames, display_rate)
+        self.display_rate = display_rate
+
+    def update(self, t):
+        "move all sprites to their positions at time 't'"
+        if self.t0 is None:
+            self.t0 = t
+        elapsed = t - self.t0
+        self.active = elapsed < self.movement_duration
+        if self.position_table is None:
+            p = self.trajectory.evaluate(elapsed)[0]
+        else:
+            #the frame being rendered is shown at the next flip
+            frame = min(flip_index(elapsed, self.display_rate), len(self.position_table) - 1)
+            p = self.position_table[frame]
+        self.positions = p
+        self._vertex_data[:,:,0:2] = p[:,np.newaxis,:] + self._offsets
+
+    def render(self):
+        "draw the sprites still moving, returns whether any was drawn"
+        if not self.active.any():
+            return False
+        if self.active.all():
+            data = self._vertex_data
+        else:
+            data = np.ascontiguousarray(self._vertex_data[self.active])
+        num_vertices = data.shape[0]*self.vertices_per_sprite
+        stride = VERTEX_FIELDS*FLOAT_SIZE
+        gl.glDisable(gl.GL_LIGHTING)
+        gl.glEnableClientState(gl.GL_VERTEX_ARRAY)
+        gl.glEnableClientState(gl.GL_COLOR_ARRAY)
+        try:
+            self._buffer.upload(data)
+            gl.glVertexPointer(2, gl.GL_FLOAT, stride, ctypes.c_void_p(0))
+            gl.glColorPointer(3, gl.GL_FLOAT, stride, ctypes.c_void_p(2*FLOAT_SIZE))
+            gl.glDrawArrays(gl.GL_QUADS, 0, num_vertices)
+        finally:
+            gl.glBindBuffer(gl.GL_ARRAY_BUFFER, 0)
+            gl.glDisableClientState(gl.GL_COLOR_ARRAY)
+            gl.glDisableClientState(gl.GL_VERTEX_ARRAY)
+            gl.glEnable(gl.GL_LIGHTING)
+        return True
+
+    def __len__(self):
+        return self.num_sprites
+
+################################################################################
+# TEST CODE
+################################################################################
+if __name__ == "__main__":
+    import sys
+    import pygame
+    from common import UserEscape
+    from animated_screen import AnimatedScreen
+
+    NUM_SPRITES = 2000
+    rng = np.random.RandomState(0)
+    try:
+        #crosses spiralling out from the center at random angular velocities
+        sprites = SpriteArray(position_initial = np.column_stack((np.zeros(NUM_SPRITES), rng.uniform(0, 2*np.pi, NUM_SPRITES))),
+                              velocity = np.column_stack((rng.uniform(0.05, 0.2, NUM_SPRITES), rng.uniform(-np.pi, np.pi, NUM_SPRITES))),
+                              movement_duration = rng.uniform(4, 8, NUM_SPRITES),
+                              use_polar_coords = True,
+                              size = 0.03,
+                              thickness = 0.005,
+                              color = rng.uniform(0, 1, (NUM_SPRITES, 3)),
+                             )
+        aSCR = AnimatedScreen.with_pygame_display()
+        aSCR.setup(sprite_array = sprites,
+                   background_color = 'black',
+                   log_frames = True,
+                  )
+        aSCR.run(duration = 8)
+        dt = np.diff(aSCR.frame_log.t)
+        print("%d sprites: %d frames, median frame interval %0.2f ms, max %0.2f ms" % (NUM_SPRITES, len(dt) + 1, 1e3*np.median(dt), 1e3*dt.max()))
+    except UserEscape as exc:
+        print(exc)
+
+    pygame.quit()
+    sys.exit()
@@ -1,7 +1,8 @@
 import time
 import numpy as np
 
-from common import DEBUG, COLORS, cart2pol, pol2cart
+from common import COLORS, cart2pol, pol2cart
+from trajectories import precompute_positions, flip_index
 
 class Sprite:
     def __init__(self,
@@ -11,14 +12,22 @@ class Sprite:
                  position_final = None,
                  movement_duration = 1.0,  # time to move from position_initial to position_final, seconds
                  dt_threshold = 0.001,  # shortest allowed time between updates and between renders
+                 trajectory = None,     # a single sprite trajectory (see trajectories) instead of the velocity
                  ):
         self.use_polar_coords  = use_polar_coords
         self.position_initial  = position_initial
         self.position_final    = position_final
         self.movement_duration = movement_duration
         self.dt_threshold      = dt_threshold
+        self.trajectory        = trajectory
+        self.position_table    = None
+        self.display_rate      = None
         # check if velocity was specified or if it must be calculated from initial and final positions
-        if not velocity == None:
+        if not trajectory is None:
+            # trajectories give cartesian positions in closed form
+            self.use_polar_coords = False
+            self.velocity = None
+        elif not velocity == None:
             self.velocity = velocity
         elif not position_final == None:
             self.position_diff = np.array(np.subtract(position_final, position_initial)) # difference vector between initial and final positions
@@ -33,9 +42,29 @@ class Sprite:
         self.t_since_update = None
         self.t_since_render = None
         self.has_rendered   = False # this keeps track of if render() has been called
-        
+        self.t_start        = None
+
+    def precompute(self, num_frames, display_rate):
+        "tabulate the trajectory at the flip times of 'num_frames' frames"
+        if not self.trajectory is None:
+            self.position_table = precompute_positions(self.trajectory, num_frames, display_rate)[:,0]
+            self.display_rate = display_rate
+
+    def position_at(self, elapsed):
+        "cartesian position on the trajectory 'elapsed' seconds after the start"
+        if self.position_table is None:
+            return tuple(self.trajectory.evaluate(elapsed)[0,0])
+        #the frame being rendered is shown at the next flip
+        frame = min(flip_index(elapsed, self.display_rate), len(self.position_table) - 1)
+        return tuple(self.position_table[frame])
+
     def update(self, t = 0, v = None):
         """ update render position (velocity is vector in OpenGL style coorinates/timestep)"""
+        if not self.trajectory is None:
+            if self.t_start is None:
+                self.t_start = t
+            self.position_current = self.position_at(t - self.t_start)
+            return
         # if update() has not been run, set time_since_update to current time
         if self.t_since_update == None:
             self.t_since_update = t
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Spectral verification of presented stimuli from a FrameLog.
+
+The per-frame values (e.g. check luminance) are held from one flip to the
+next, resampled onto a uniform time grid and Fourier transformed, all
+channels at once.  Each channel is then compared against the frequency it
+was supposed to be presented at.
+
+Note that the checkerboard flashers reverse at 'flash_rate', so the
+luminance of any single check has its fundamental at flash_rate/2 Hz.
+"""
+from __future__ import print_function
+
+from collections import OrderedDict
+
+import numpy as np
+
+OVERSAMPLE_DEFAULT     = 4
+NUM_HARMONICS_DEFAULT  = 5
+MIN_FREQUENCY_DEFAULT  = 0.5 #Hz, ignore the DC region when looking for peaks
+
+def resample_frame_values(t_flip, values, sample_rate = None, oversample = OVERSAMPLE_DEFAULT):
+    """ zero-order hold resampling of per-frame values onto a uniform grid,
+        'values' is (frames x channels); if 'sample_rate' is not given it is
+        'oversample' times the median frame rate
+    """
+    t_flip = np.asarray(t_flip, dtype = float)
+    values = np.asarray(values, dtype = float)
+    if values.ndim == 1:
+        values = values[:,np.newaxis]
+    if sample_rate is None:
+        sample_rate = oversample/np.median(np.diff(t_flip))
+    num_samples = int((t_flip[-1] - t_flip[0])*sample_rate)
+    t_grid = t_flip[0] + np.arange(num_samples)/sample_rate
+    # each grid point shows the frame flipped most recently before it
+    frame_index = np.searchsorted(t_flip, t_grid, side = 'right') - 1
+    return (t_grid, values[frame_index], sample_rate)
+
+def compute_spectrum(t_flip, values, sample_rate = None, oversample = OVERSAMPLE_DEFAULT):
+    """ amplitude spectra of all channels, returns 'freqs' and an
+        (frequencies x channels) array of Hann windowed amplitudes scaled so
+        that a sinusoid of amplitude A shows a peak of height A
+    """
+    t_grid, x, sample_rate = resample_frame_values(t_flip, values,
+                                                   sample_rate = sample_rate,
+                                                   oversample  = oversample,
+                                                  )
+    x = x - x.mean(axis = 0)
+    window = np.hanning(len(x))
+    X = np.fft.rfft(x*window[:,np.newaxis], axis = 0)
+    amplitude = 2.0*np.abs(X)/window.sum()
+    freqs = np.fft.rfftfreq(len(x), 1.0/sample_rate)
+    return (freqs, amplitude)
+
+def analyze_spectrum(freqs,
+                     amplitude,
+                     requested_frequencies,
+                     num_harmonics = NUM_HARMONICS_DEFAULT,
+                     bandwidth = None,
+                     min_frequency = MIN_FREQUENCY_DEFAULT,
+                    ):
+    """ compare the spectra (frequencies x channels) against the
+        'requested_frequencies' (one per channel), returns a dict of arrays
+        with one entry (or row) per channel:
+            peak_frequency       - location of the largest peak above min_frequency
+            peak_amplitude       - its height
+            frequency_error      - peak_frequency - requested_frequency
+            harmonic_amplitudes  - (channels x num_harmonics) peak heights at k*f
+            harmonic_ratio       - harmonic amplitudes relative to the fundamental
+            unintended_fraction  - fraction of AC power outside the harmonic bands
+            unintended_frequency - location of the largest peak outside those bands
+    """
+    amplitude = np.asarray(amplitude, dtype = float)
+    if amplitude.ndim == 1:
+        amplitude = amplitude[:,np.newaxis]
+    f_req = np.atleast_1d(np.asarray(requested_frequencies, dtype = float))
+    df = freqs[1] - freqs[0]
+    if bandwidth is None:
+        bandwidth = 3*df #main lobe of the Hann window is +/- 2 bins
+    ac = freqs >= min_frequency
+    ac_amplitude = np.where(ac[:,np.newaxis], amplitude, 0.0)
+
+    # largest peak, refined by parabolic interpolation of neighbouring bins
+    i_peak = ac_amplitude.argmax(axis = 0)
+    i_peak = np.clip(i_peak, 1, len(freqs) - 2)
+    ch = np.arange(amplitude.shape[1])
+    a0, a1, a2 = (amplitude[i_peak - 1, ch], amplitude[i_peak, ch], amplitude[i_peak + 1, ch])
+    denom = a0 - 2*a1 + a2
+    delta = np.where(denom != 0, 0.5*(a0 - a2)/np.where(denom != 0, denom, 1.0), 0.0)
+    peak_frequency = freqs[i_peak] + delta*df
+
+    # peak height within +/- bandwidth of each harmonic k*f_req
+    k = np.arange(1, num_harmonics + 1)
+    f_harm = f_req[:,np.newaxis]*k                                         #(channels x harmonics)
+    in_band = np.abs(freqs - f_harm[:,:,np.newaxis]) <= bandwidth          #(channels x harmonics x frequencies)
+    band_amplitude = np.where(in_band, amplitude.T[:,np.newaxis,:], 0.0)
+    harmonic_amplitudes = band_amplitude.max(axis = 2)
+    fundamental = harmonic_amplitudes[:,:1]
+    harmonic_ratio = harmonic_amplitudes/np.where(fundamental > 0, fundamental, 1.0)
+
+    # power outside all harmonic bands
+    power = ac_amplitude.T**2                                              #(channels x frequencies)
+    intended = in_band.any(axis = 1)
+    total_power = power.sum(axis = 1)
+    unintended_power = np.where(intended, 0.0, power).sum(axis = 1)
+    unintended_fraction = unintended_power/np.where(total_power > 0, total_power, 1.0)
+    unintended_frequency = freqs[np.where(intended, 0.0, power).argmax(axis = 1)]
+
+    return OrderedDict((
+        ('requested_frequency' , f_req),
+        ('peak_frequency'      , peak_frequency),
+        ('peak_amplitude'      , a1),
+        ('frequency_error'     , peak_frequency - f_req),
+        ('harmonic_frequencies', f_harm),
+        ('harmonic_amplitudes' , harmonic_amplitudes),
+        ('harmonic_ratio'      , harmonic_ratio),
+        ('unintended_fraction' , unintended_fraction),
+        ('unintended_frequency', unintended_frequency),
+        ('bandwidth'           , bandwidth),
+    ))
+
+def analyze_frame_log(frame_log, requested_frequencies, **kwargs):
+    """ spectral report for every channel of 'frame_log' listed in the mapping
+        'requested_frequencies' (channel name -> expected fundamental in Hz),
+        e.g. from Screen.get_stimulus_frequencies(); returns an OrderedDict
+        of per-channel report dicts
+    """
+    names = list(requested_frequencies.keys())
+    cols  = [frame_log.channel_names.index(name) for name in names]
+    spectrum_kwargs = dict((key, kwargs.pop(key)) for key in ('sample_rate','oversample') if key in kwargs)
+    freqs, amplitude = compute_spectrum(frame_log.t, frame_log.values[:,cols], **spectrum_kwargs)
+    results = analyze_spectrum(freqs, amplitude,
+                               [requested_frequencies[name] for name in names],
+                               **kwargs)
+    reports = OrderedDict()
+    for i, name in enumerate(names):
+        report = OrderedDict()
+        for key, val in results.items():
+            report[key] = val if np.ndim(val) == 0 else val[i]
+        reports[name] = report
+    return reports
+
+def format_report(reports):
+    lines = []
+    lines.append("%-12s %10s %10s %10s %10s %12s" % ("channel","requested","peak","error","2nd harm.","unintended"))
+    for name, r in reports.items():
+        harm2 = r['harmonic_ratio'][1] if len(r['harmonic_ratio']) > 1 else np.nan
+        lines.append("%-12s %8.3fHz %8.3fHz %+8.3fHz %9.1f%% %10.2f%% (strongest at %.2f Hz)" % (name,
+                     r['requested_frequency'], r['peak_frequency'], r['frequency_error'],
+                     100*harm2, 100*r['unintended_fraction'], r['unintended_frequency']))
+    return "\n".join(lines)
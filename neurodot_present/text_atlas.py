@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+Pre-rendered text stimuli packed into texture atlases.
+
+All strings of a session (e.g. the words and their cyphered variants) are
+rasterized before it starts, in a pool of worker processes, and packed
+into a few large RGBA images.  Presenting an item is then a dictionary
+lookup and one textured quad, no font code runs at trial onset.
+"""
+from __future__ import print_function
+
+import sys, time
+import multiprocessing
+from collections import OrderedDict
+
+import numpy as np
+import pygame
+
+#local imports
+from text_rendering import fit_surface, surface_to_array, upload_texture, draw_texture_quad,\
+                           delete_texture, disk_cache_key
+from disk_cache import get_default_disk_cache
+
+ATLAS_SIZE_DEFAULT = 4096 #pixels, width and maximum height of an atlas
+ATLAS_PADDING = 2         #pixels between items, so that filtering does not bleed
+
+ENTRY_DTYPE = np.dtype([('atlas' , np.int32),
+                        ('x'     , np.int32), #left column of the item in its atlas
+                        ('y'     , np.int32), #top row of the item in its atlas
+                        ('width' , np.int32),
+                        ('height', np.int32),
+                       ])
+
+def _init_worker():
+    pygame.font.init()
+
+def _rasterize_worker(args):
+    text, font_path, font_size, color, bg_color, max_size = args
+    return surface_to_array(fit_surface(text, font_path, font_size, color, bg_color, max_size = max_size))
+
+def print_progress(num_done, num_total, t_start):
+    #about every 5%
+    if num_done % max(num_total//20, 1) and num_done != num_total:
+        return
+    sys.stdout.write("\rrasterized %d/%d strings (%0.1f s)" % (num_done, num_total, time.time() - t_start))
+    if num_done == num_total:
+        sys.stdout.write("\n")
+    sys.stdout.flush()
+
+def rasterize_strings(strings,
+                      font_path,
+                      font_size,
+                      color,
+                      bg_color = None,
+                      max_size = None,
+                      num_workers = None,
+                      progress = None,
+                     ):
+    """ rasterize every string (colors as 0-255 RGB tuples), spread over
+        'num_workers' processes (default: one per CPU, 1 renders in this
+        process); returns a list of (height x width x 4) RGBA arrays, rows
+        top down.  'progress(num_done, num_total, t_start)' is called as the
+        results come in, see print_progress.
+    """
+    tasks = [(text, font_path, font_size, color, bg_color, max_size) for text in strings]
+    if num_workers is None:
+        num_workers = multiprocessing.cpu_count()
+    t_start = time.time()
+    pool = None
+    if num_workers > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(num_workers, initializer = _init_worker)
+        chunksize = max(len(tasks)//(8*num_workers), 1)
+        results = pool.imap(_rasterize_worker, tasks, chunksize)
+    else:
+        _init_worker()
+        results = (_rasterize_worker(task) for task in tasks)
+    images = []
+    try:
+        for img in results:
+            images.append(img)
+            if not progress is None:
+                progress(len(images), len(tasks), t_start)
+    finally:
+        if not pool is None:
+            pool.close()
+            pool.join()
+    return images
+
+def pack_images(images, atlas_size = ATLAS_SIZE_DEFAULT, padding = ATLAS_PADDING):
+    """ shelf packing of the images into atlases at most atlas_size square,
+        tallest images first; returns the list of atlas arrays and the
+        ENTRY_DTYPE placement of every image
+    """
+    entries = np.zeros(len(images), dtype = ENTRY_DTYPE)
+    entries['height'] = [img.shape[0] for img in images]
+    entries['width']  = [img.shape[1] for img in images]
+    if len(images) and (entries['width'].max() > atlas_size or entries['height'].max() > atlas_size):
+        raise ValueError("an image is larger than the atlas size %d" % atlas_size)
+    atlas = 0
+    x = y = shelf_height = 0
+    atlas_heights = []
+    for i in np.argsort(-entries['height'], kind = 'mergesort'):
+        w, h = entries['width'][i], entries['height'][i]
+        if x + w > atlas_size: #next shelf
+            y += shelf_height + padding
+            x = shelf_height = 0
+        if y + h > atlas_size: #next atlas
+            atlas_heights.append(y)
+            atlas += 1
+            x = y = shelf_height = 0
+        entries['atlas'][i] = atlas
+        entries['x'][i] = x
+        entries['y'][i] = y
+        x += w + padding
+        shelf_height = max(shelf_height, h)
+    atlas_heights.append(y + shelf_height)
+    atlases = [np.zeros((height, atlas_size, 4), dtype = np.uint8) for height in atlas_heights]
+    for img, e in zip(images, entries):
+        atlases[e['atlas']][e['y']:e['y'] + e['height'], e['x']:e['x'] + e['width']] = img
+    return (atlases, entries)
+
+class TextAtlas:
+    """ A fixed set of strings rendered once into texture atlases, any of
+        them is then drawn in O(1) with 'draw' or looked up with 'size'.
+        The textures are uploaded on the first draw, when a GL context
+        exists.
+    """
+    def __init__(self, strings, atlases, entries):
+        self.strings = list(strings)
+        self.index = OrderedDict((text, i) for i, text in enumerate(self.strings))
+        self.atlases = atlases
+        self.entries = entries
+        self.textures = None
+
+    @classmethod
+    def build(cls,
+              strings,
+              font_path,
+              font_size,
+              color,
+              bg_color = None,
+              max_size = None,
+              atlas_size = ATLAS_SIZE_DEFAULT,
+              num_workers = None,
+              progress = print_progress,
+              disk_cache = None,
+             ):
+        """ rasterize the unique 'strings' in parallel and pack them, see
+            rasterize_strings; strings found in 'disk_cache' (a DiskCache,
+            default ~/.neurodot_present/cache, False to disable) are loaded
+            instead and new ones are added to it
+        """
+        strings = list(OrderedDict.fromkeys(strings))
+        if disk_cache is None:
+            disk_cache = get_default_disk_cache()
+        images = [None]*len(strings)
+        if disk_cache:
+            keys = [disk_cache_key(text, font_path, font_size, color, bg_color, max_size) for text in strings]
+            images = [disk_cache.load(key) for key in keys]
+        missing = [i for i, img in enumerate(images) if img is None]
+        if missing:
+            rendered = rasterize_strings([strings[i] for i in missing], font_path, font_size, color, bg_color,
+                                         max_size = max_size,
+                                         num_workers = num_workers,
+                                         progress = progress,
+                                        )
+            for i, img in zip(missing, rendered):
+                images[i] = img
+                if disk_cache:
+                    disk_cache.save(keys[i], img)
+            if disk_cache:
+                disk_cache.evict_if_full()
+        atlases, entries = pack_images(images, atlas_size = atlas_size)
+        return cls(strings, atlases, entries)
+
+    def __contains__(self, text):
+        return text in self.index
+
+    def __len__(self):
+        return len(self.strings)
+
+    @property
+    def nbytes(self):
+        return sum(atlas.nbytes for atlas in self.atlases)
+
+    def size(self, text):
+        "(width, height) of the rendered text in pixels"
+        e = self.entries[self.index[text]]
+        return (int(e['width']), int(e['height']))
+
+    def upload(self):
+        if self.textures is None:
+            self.textures = [upload_texture(atlas, atlas.shape[1], atlas.shape[0]) for atlas in self.atlases]
+
+    def draw(self, text, left, bottom, right, top):
+        "draw the rendered 'text' stretched over the rectangle"
+        self.upload()
+        e = self.entries[self.index[text]]
+        atlas_height, atlas_width = self.atlases[e['atlas']].shape[:2]
+        draw_texture_quad(self.textures[e['atlas']], left, bottom, right, top,
+                          u0 = float(e['x'])/atlas_width,
+                          v0 = float(e['y'])/atlas_height,
+                          u1 = float(e['x'] + e['width'])/atlas_width,
+                          v1 = float(e['y'] + e['height'])/atlas_height,
+                         )
+
+    def release(self):
+        if not self.textures is None:
+            for texture in self.textures:
+                delete_texture(texture)
+            self.textures = None
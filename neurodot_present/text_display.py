@@ -12,6 +12,7 @@ import pygame
 import resources
 from common import SETTINGS, COLORS
 from screen import Screen
+from text_rendering import get_rendered_text, color_to_rgb255
 
 class TextDisplay(Screen):
     def __init__(self,
@@ -27,6 +28,7 @@ class TextDisplay(Screen):
               font_type = None,
               screen_background_color = 'white',
               scale_refObj = None,
+              text_atlas = None,
               **kwargs
              ):
         Screen.setup(self,
@@ -43,67 +45,105 @@ class TextDisplay(Screen):
         self.font_size = font_size
         self.font_type = font_type
         self.scale_refObj = scale_refObj
-        
+        #a TextAtlas with the strings pre-rendered in this font, size and colors
+        self.text_atlas = text_atlas
+        #load the font now rather than on the first frame
+        resources.preload_fonts([(self.get_font_path(), font_size)])
+
     def get_coords(self, xPos, yPos): #xPos, yPos in pixels with origin at center of screen
         xPos = self.screen_right * (float(xPos) / (self.screen_width/2))
         yPos = self.screen_top * (float(yPos) / (self.screen_height/2))
         return (xPos, yPos)
 
-    def render(self):
-        #this will draw background and vsync_patch
-        Screen.render(self)
-        
+    def get_font_path(self):
         # get file path for font file if it was specified
-        font_path = None
         if self.font_type is None:
-            font_path = self.font_type
-        else:
-            font_path = resources.get_fontpath(self.font_type)
+            return None
+        return resources.get_fontpath(self.font_type)
 
-        #render textSurface from text_content
-        self.font = pygame.font.Font(font_path, self.font_size)
-        rgb    = [int(c*255) for c in self.text_color]
-        rgb_bg = [int(c*255) for c in self.text_bgColor]
-        self.textSurface = self.font.render(self.text_content, 1, rgb, rgb_bg)
+    def get_rendered_text(self):
+        "the rasterized text_content, only rendered on the first request"
+        return get_rendered_text(self.text_content,
+                                 self.get_font_path(),
+                                 self.font_size,
+                                 color_to_rgb255(self.text_color),
+                                 color_to_rgb255(self.text_bgColor),
+                                 max_size = (self.screen_width, self.screen_height),
+                                )
 
-        #Scaling font; attempting to render text that is too wide/tall sets the raster position off screen and nothing is rendered
-        if self.textSurface.get_width() > self.screen_width:
-            percent_scale = float(self.screen_width) / self.textSurface.get_width()
-            self.font = pygame.font.Font(font_path, int(font_size * percent_scale))
-            self.textSurface = self.font.render(text_content, 1, rgb, rgb_bg)
-            print("'", text_content, "' is too wide for screen; scaling to fit")
+    def render(self):
+        Screen.render_before(self)
 
-        if self.textSurface.get_height() > self.screen_height:
-            percent_scale = float(self.screen_height) / self.textSurface.get_height()
-            self.font = pygame.font.Font(font_path, int(font_size * percent_scale))
-            self.textSurface = self.font.render(text_content, 1, rgb, rgb_bg)
-            print("'", text_content, "' is too tall for screen; scaling to fit")
-            
-        #prepare some values for rendering centered text
-        centerOffset_pixels = [-self.textSurface.get_width()/2, -self.textSurface.get_height()/2]
-        raster_position = self.get_coords(*centerOffset_pixels)
-        textData = pygame.image.tostring(self.textSurface, "RGBA", True)
-        
-        #render text
-        gl.glRasterPos2d(*raster_position)
-        gl.glDrawPixels(self.textSurface.get_width(), self.textSurface.get_height(), gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, textData)
-        
-        # check if we are scaling size to match other TextDisplay obj's last run() and scale textSurface if needed
+        if not self.text_atlas is None and self.text_content in self.text_atlas:
+            width, height = self.text_atlas.size(self.text_content)
+        else:
+            rendered = self.get_rendered_text()
+            width, height = rendered.width, rendered.height
+        # check if we are scaling size to match another TextDisplay obj's text
+        zoom = (1.0, 1.0)
         if not self.scale_refObj is None:
-            ref_surface = scale_refObj.render_surface(scale_refObj.text_content, scale_refObj.font_size)
-            width_scale = float(ref_surface.get_width()) / float(self.textSurface.get_width())
-            height_scale = float(ref_surface.get_height()) / float(self.textSurface.get_height())
-            new_width  = int(width_scale * self.textSurface.get_width())
-            new_height = int(height_scale * self.textSurface.get_height())
-            self.textSurface = pygame.transform.scale(self.textSurface, (new_width,new_height))
+            ref_rendered = self.scale_refObj.get_rendered_text()
+            zoom = (float(ref_rendered.width)/width, float(ref_rendered.height)/height)
+
+        #centered text, as a textured quad
+        left, bottom = self.get_coords(-zoom[0]*width/2.0, -zoom[1]*height/2.0)
+        right, top   = self.get_coords( zoom[0]*width/2.0,  zoom[1]*height/2.0)
+        gl.glLoadIdentity()
+        if not self.text_atlas is None and self.text_content in self.text_atlas:
+            self.text_atlas.draw(self.text_content, left, bottom, right, top)
+        else:
+            rendered.draw(left, bottom, right, top)
+
+        #this will draw the vsync_patch over the text
+        Screen.render_after(self)
 
 ################################################################################
 # TEST CODE
 ################################################################################
 if __name__ == "__main__":
+    import sys
     TD = TextDisplay.with_pygame_display()
     TD.setup(font_size = 288,
              font_type = "FreeMono.ttf",
              screen_background_color = "white",
             )
-    TD.run(duration = 5, vsync_value = 10)
+    if not "--benchmark" in sys.argv:
+        TD.run(duration = 5, vsync_value = 10)
+    else:
+        #compare the draw time (until glFinish, excluding the flip) of a 288 pt word
+        #for the old per frame glDrawPixels path against the cached texture
+        from text_rendering import render_surface
+        font_path = TD.get_font_path()
+        rgb    = color_to_rgb255(TD.text_color)
+        rgb_bg = color_to_rgb255(TD.text_bgColor)
+        def time_frames(draw, num_frames = 300):
+            TD.start_rendering()
+            draw_times = np.zeros(num_frames)
+            for i in range(num_frames):
+                t0 = time.time()
+                Screen.render_before(TD)
+                draw()
+                gl.glFinish()
+                draw_times[i] = time.time() - t0
+                pygame.display.flip()
+            return 1e3*np.median(draw_times)
+        def draw_pixels_per_frame():
+            surface = render_surface(TD.text_content, font_path, TD.font_size, rgb, rgb_bg)
+            data = pygame.image.tostring(surface, "RGBA", True)
+            gl.glRasterPos2d(*TD.get_coords(-surface.get_width()/2, -surface.get_height()/2))
+            gl.glDrawPixels(surface.get_width(), surface.get_height(), gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, data)
+        surface = render_surface(TD.text_content, font_path, TD.font_size, rgb, rgb_bg)
+        data = pygame.image.tostring(surface, "RGBA", True)
+        def draw_pixels_cached():
+            gl.glRasterPos2d(*TD.get_coords(-surface.get_width()/2, -surface.get_height()/2))
+            gl.glDrawPixels(surface.get_width(), surface.get_height(), gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, data)
+        def draw_texture():
+            rendered = TD.get_rendered_text()
+            left, bottom = TD.get_coords(-rendered.width/2.0, -rendered.height/2.0)
+            right, top   = TD.get_coords( rendered.width/2.0,  rendered.height/2.0)
+            gl.glLoadIdentity()
+            rendered.draw(left, bottom, right, top)
+        print("median draw time of '%s' at %d pt:" % (TD.text_content, TD.font_size))
+        print("    rasterize + glDrawPixels every frame: %0.3f ms" % time_frames(draw_pixels_per_frame))
+        print("    cached buffer + glDrawPixels        : %0.3f ms" % time_frames(draw_pixels_cached))
+        print("    cached texture, textured quad       : %0.3f ms" % time_frames(draw_texture))
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+Rasterized text kept between frames.
+
+Rendering a string with pygame.font means parsing the font, rasterizing
+every glyph and converting the surface to a pixel buffer, which is far too
+slow to do inside the display loop for text that does not change.  The
+rendered strings are kept as GL textures in an LRU cache with a byte budget
+(counting their surfaces), keyed by
+(text, font path, size, text color, background color), the size being the
+largest one at which the text fits on the screen.
+"""
+from __future__ import print_function
+
+import sys
+from collections import OrderedDict
+
+import numpy as np
+import OpenGL.GL as gl
+import pygame
+
+#local imports
+import resources
+
+TEXT_CACHE_BYTES_DEFAULT = 64*1024*1024
+
+def color_to_rgb255(color):
+    "(r,g,b) floats in 0-1 to a tuple of 0-255 integers"
+    return tuple(int(c*255) for c in color)
+
+class LRUCache:
+    """ Least recently used cache with a budget on the total 'nbytes' of its
+        values.  Values evicted to stay within the budget have their
+        'release' method called if they have one.
+    """
+    def __init__(self, max_bytes = TEXT_CACHE_BYTES_DEFAULT):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self.nbytes = 0
+        self.hits   = 0
+        self.misses = 0
+
+    def get(self, key, default = None):
+        try:
+            value = self._entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self._entries[key] = value #most recently used entries are last
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if key in self._entries:
+            self._discard(key)
+        self._entries[key] = value
+        self.nbytes += value.nbytes
+        # evict the least recently used entries, but always keep the new one
+        while self.nbytes > self.max_bytes and len(self._entries) > 1:
+            self._discard(next(iter(self._entries)))
+
+    def _discard(self, key):
+        value = self._entries.pop(key)
+        self.nbytes -= value.nbytes
+        if hasattr(value, 'release'):
+            value.release()
+
+    def clear(self):
+        for key in list(self._entries.keys()):
+            self._discard(key)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+#byte order of 32 bit surfaces as GL pixel formats, by (R,G,B,A) masks on a
+#little endian machine
+SURFACE_GL_FORMATS = {
+    (0x00FF0000, 0x0000FF00, 0x000000FF, 0xFF000000): gl.GL_BGRA,
+    (0x000000FF, 0x0000FF00, 0x00FF0000, 0xFF000000): gl.GL_RGBA,
+}
+
+def upload_texture(pixels, width, height, pixel_format = gl.GL_RGBA, row_length = 0):
+    """ create a texture from 'pixels' (rows top down, 4 bytes per pixel,
+        'row_length' pixels apart if the rows are padded)
+    """
+    texture = gl.glGenTextures(1)
+    gl.glBindTexture(gl.GL_TEXTURE_2D, texture)
+    gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER, gl.GL_LINEAR)
+    gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER, gl.GL_LINEAR)
+    gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_S, gl.GL_CLAMP_TO_EDGE)
+    gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_T, gl.GL_CLAMP_TO_EDGE)
+    gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT, 4)
+    gl.glPixelStorei(gl.GL_UNPACK_ROW_LENGTH, row_length)
+    try:
+        gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_RGBA8, width, height, 0,
+                        pixel_format, gl.GL_UNSIGNED_BYTE, pixels)
+    finally:
+        gl.glPixelStorei(gl.GL_UNPACK_ROW_LENGTH, 0)
+        gl.glBindTexture(gl.GL_TEXTURE_2D, 0)
+    return texture
+
+def surface_to_texture(surface):
+    """ upload a 32 bit surface straight from its pixel buffer when its byte
+        order is a GL pixel format
+    """
+    pixel_format = None
+    if sys.byteorder == 'little':
+        pixel_format = SURFACE_GL_FORMATS.get(tuple(surface.get_masks()))
+    if pixel_format is None:
+        #unusual surface layout, let pygame reorder the bytes
+        return upload_texture(pygame.image.tostring(surface, "RGBA", False), *surface.get_size())
+    pixels = np.frombuffer(surface.get_view('1'), dtype = np.uint8)
+    width, height = surface.get_size()
+    return upload_texture(pixels, width, height,
+                          pixel_format = pixel_format,
+                          row_length = surface.get_pitch()//4,
+                         )
+
+def draw_texture_quad(texture, left, bottom, right, top, u0 = 0.0, v0 = 0.0, u1 = 1.0, v1 = 1.0):
+    """ draw the (u0,v0)-(u1,v1) region of 'texture' over the rectangle,
+        v0 being the top row of the region
+    """
+    gl.glDisable(gl.GL_LIGHTING)
+    gl.glEnable(gl.GL_TEXTURE_2D)
+    gl.glEnable(gl.GL_BLEND)
+    gl.glBlendFunc(gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA)
+    gl.glBindTexture(gl.GL_TEXTURE_2D, texture)
+    gl.glTexEnvi(gl.GL_TEXTURE_ENV, gl.GL_TEXTURE_ENV_MODE, gl.GL_REPLACE)
+    try:
+        #texture rows run top down
+        gl.glBegin(gl.GL_QUADS)
+        gl.glTexCoord2f(u0, v1); gl.glVertex2f(left , bottom)
+        gl.glTexCoord2f(u1, v1); gl.glVertex2f(right, bottom)
+        gl.glTexCoord2f(u1, v0); gl.glVertex2f(right, top)
+        gl.glTexCoord2f(u0, v0); gl.glVertex2f(left , top)
+        gl.glEnd()
+    finally:
+        gl.glBindTexture(gl.GL_TEXTURE_2D, 0)
+        gl.glDisable(gl.GL_BLEND)
+        gl.glDisable(gl.GL_TEXTURE_2D)
+        gl.glEnable(gl.GL_LIGHTING)
+
+def delete_texture(texture):
+    try:
+        gl.glDeleteTextures([texture])
+    except Exception:
+        pass #the context may already be gone
+
+class RenderedText:
+    """ A rasterized string, uploaded once to a GL texture on the first
+        'draw' (when a context exists) and then drawn as a textured quad.
+        The texture is filled straight from the pixel buffer of a 32 bit
+        copy of the surface, rows top down, so no RGBA string is built.
+    """
+    def __init__(self, surface):
+        self.width, self.height = surface.get_size()
+        if surface.get_bitsize() != 32 or not surface.get_flags() & pygame.SRCALPHA:
+            converted = pygame.Surface(surface.get_size(), pygame.SRCALPHA, 32)
+            converted.blit(surface, (0,0))
+            surface = converted
+        self.surface = surface
+        self.nbytes = surface.get_pitch()*self.height
+        self.texture = None
+
+    @classmethod
+    def from_array(cls, pixels):
+        "from a (height x width x 4) RGBA array, rows top down"
+        height, width = pixels.shape[:2]
+        return cls(pygame.image.fromstring(np.ascontiguousarray(pixels).tobytes(), (width, height), "RGBA"))
+
+    def draw(self, left, bottom, right, top):
+        "draw the text stretched over the rectangle, in the current coordinates"
+        if self.texture is None:
+            self.texture = surface_to_texture(self.surface)
+        draw_texture_quad(self.texture, left, bottom, right, top)
+
+    def release(self):
+        "free the GL texture, it is uploaded again if drawn later"
+        if not self.texture is None:
+            delete_texture(self.texture)
+            self.texture = None
+
+def render_surface(text, font_path, font_size, color, bg_color = None):
+    font = resources.get_font(font_path, font_size)
+    if bg_color is None:
+        return font.render(text, 1, color)
+    return font.render(text, 1, color, bg_color)
+
+#fitted font sizes by (text, font path, size, max_size)
+_fit_sizes = {}
+
+def fit_font_size(text, font_path, font_size, max_size = None):
+    """ the largest font size up to 'font_size' at which 'text' fits in
+        'max_size' = (width, height) pixels, found by a binary search on the
+        font metrics without rendering, memoized
+    """
+    if max_size is None:
+        return font_size
+    key = (text, font_path, font_size, tuple(max_size))
+    fitted = _fit_sizes.get(key)
+    if fitted is None:
+        max_width, max_height = max_size
+        def fits(size):
+            width, height = resources.get_font(font_path, size).size(text)
+            return width <= max_width and height <= max_height
+        fitted = font_size
+        if not fits(font_size):
+            #fits(lo) holds (or lo is the smallest size) and fits(hi) does not
+            lo, hi = 1, font_size
+            while hi - lo > 1:
+                mid = (lo + hi)//2
+                if fits(mid):
+                    lo = mid
+                else:
+                    hi = mid
+            fitted = lo
+            print("'", text, "' is too large for screen; scaling to fit at", fitted, "pt")
+        _fit_sizes[key] = fitted
+    return fitted
+
+def fit_surface(text, font_path, font_size, color, bg_color = None, max_size = None):
+    """ render 'text' with colors given as 0-255 RGB tuples; if it is larger
+        than 'max_size' = (width, height) in pixels the font size is scaled
+        down to fit, see fit_font_size
+    """
+    #attempting to render text that is too wide/tall sets the raster position off screen and nothing is rendered
+    return render_surface(text, font_path, fit_font_size(text, font_path, font_size, max_size), color, bg_color)
+
+def surface_to_array(surface):
+    "(height x width x 4) RGBA array of a surface, rows top down"
+    width, height = surface.get_size()
+    return np.frombuffer(pygame.image.tostring(surface, "RGBA", False), dtype = np.uint8).reshape((height, width, 4))
+
+def rasterize_text(text, font_path, font_size, color, bg_color = None, max_size = None):
+    "fit_surface as a RenderedText"
+    return RenderedText(fit_surface(text, font_path, font_size, color, bg_color, max_size = max_size))
+
+def disk_cache_key(text, font_path, font_size, color, bg_color = None, max_size = None):
+    """ disk_cache.text_key of the text at its fitted size, so that any
+        bounds giving the same size share one entry
+    """
+    from disk_cache import text_key
+    return text_key(text, font_path, fit_font_size(text, font_path, font_size, max_size), color, bg_color)
+
+#shared by all TextDisplay screens
+text_cache = LRUCache()
+
+def get_rendered_text(text, font_path, font_size, color, bg_color = None, max_size = None, cache = None, disk_cache = None):
+    """ cached rasterize_text, the colors are 0-255 RGB tuples so that the
+        key does not depend on float rounding; on a miss the optional
+        'disk_cache' (a disk_cache.DiskCache) is tried before rendering
+    """
+    if cache is None:
+        cache = text_cache
+    #keyed by the fitted size, so bounds that need no scaling share entries
+    font_size = fit_font_size(text, font_path, font_size, max_size)
+    key = (text, font_path, font_size, color, bg_color)
+    rendered = cache.get(key)
+    if rendered is None:
+        if disk_cache:
+            disk_key = disk_cache_key(text, font_path, font_size, color, bg_color)
+            pixels = disk_cache.load(disk_key)
+            if pixels is None:
+                surface = render_surface(text, font_path, font_size, color, bg_color)
+                disk_cache.save(disk_key, surface_to_array(surface))
+                disk_cache.evict_if_full()
+                rendered = RenderedText(surface)
+            else:
+                rendered = RenderedText.from_array(pixels)
+        else:
+            rendered = RenderedText(render_surface(text, font_path, font_size, color, bg_color))
+        cache.put(key, rendered)
+    return rendered
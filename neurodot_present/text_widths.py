@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+Rendered widths of whole word lists and of their random cyphers.
+
+The advance width of every glyph is measured once per font and size; a word
+is then its vector of letter counts, so the widths of all words are a single
+matrix product, and so are the widths under thousands of random cypher
+permutations (each permutation just reorders the glyph widths).  The
+kerning of every adjacent pair and the ink of the last glyph past its
+advance are added the same way, so the widths equal Font.size() (to a
+pixel where the font kerns by fractions of one).
+"""
+from __future__ import print_function
+
+import multiprocessing
+
+import numpy as np
+
+#local imports
+import resources
+
+LATIN_ALPHABET = u"ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+NUM_PERMUTATIONS_DEFAULT = 10000
+
+def glyph_metrics(glyphs, font_path, font_size):
+    """ pixel metrics of the single character 'glyphs': the advance of each,
+        the ink it adds past its advance when it ends a string, and the
+        (glyphs x glyphs) kerning of each adjacent pair
+    """
+    font = resources.get_font(font_path, font_size)
+    extents = np.array([font.size(g)[0] for g in glyphs], dtype = np.int32)
+    advances = extents.copy()
+    for i, m in enumerate(font.metrics(u"".join(glyphs))):
+        if not m is None: #None for glyphs missing from the font
+            advances[i] = m[4]
+    kerning = np.array([[font.size(a + b)[0] for b in glyphs] for a in glyphs], dtype = np.int32)
+    kerning -= advances[:,np.newaxis] + extents[np.newaxis,:]
+    return (advances, extents - advances, kerning)
+
+def letter_counts(words, alphabet):
+    "(words x letters) number of occurrences of each letter of 'alphabet'"
+    index = dict((ch, i) for i, ch in enumerate(alphabet))
+    counts = np.zeros((len(words), len(alphabet)), dtype = np.int32)
+    for n, word in enumerate(words):
+        for ch in word:
+            counts[n, index[ch]] += 1
+    return counts
+
+def last_letters(words, alphabet):
+    "index in 'alphabet' of the last letter of each word"
+    index = dict((ch, i) for i, ch in enumerate(alphabet))
+    return np.array([index[word[-1]] for word in words], dtype = np.int32)
+
+def pair_counts(words, alphabet):
+    """ the distinct adjacent letter pairs of 'words' as (pairs x 2) indices
+        into 'alphabet', and the (words x pairs) number of occurrences
+    """
+    index = dict((ch, i) for i, ch in enumerate(alphabet))
+    words_pairs = [[(index[a], index[b]) for a, b in zip(word[:-1], word[1:])] for word in words]
+    pairs = {}
+    for word_pairs in words_pairs:
+        for pair in word_pairs:
+            pairs.setdefault(pair, len(pairs))
+    counts = np.zeros((len(words), len(pairs)), dtype = np.int32)
+    for n, word_pairs in enumerate(words_pairs):
+        for pair in word_pairs:
+            counts[n, pairs[pair]] += 1
+    pair_index = np.zeros((len(pairs), 2), dtype = np.int32)
+    for pair, p in pairs.items():
+        pair_index[p] = pair
+    return (pair_index, counts)
+
+def random_permutations(num_permutations, num_letters, seed = None):
+    "(permutations x letters) random permutations of range(num_letters)"
+    rng = np.random.RandomState(seed)
+    return np.argsort(rng.random_sample((num_permutations, num_letters)), axis = 1).astype(np.int8)
+
+def permuted_widths(perms, layout, metrics):
+    """ (permutations x words) widths of the words of 'layout' (letter_counts,
+        last_letters, pair_counts) with letter i drawn as glyph perms[:,i]
+        of 'metrics' (glyph_metrics)
+    """
+    counts, last, pairs, pair_occurrences = layout
+    advances, overhangs, kerning = metrics
+    #sums of small integers, exact in floating point which numpy multiplies fastest
+    widths = advances[perms].astype(float).dot(counts.T)
+    widths += overhangs[perms[:,last]]
+    if len(pairs):
+        widths += kerning[perms[:,pairs[:,0]], perms[:,pairs[:,1]]].astype(float).dot(pair_occurrences.T)
+    return np.round(widths).astype(np.int32)
+
+def _cypher_worker(args):
+    seed, num_permutations, num_letters, layout, metrics = args
+    perms = random_permutations(num_permutations, num_letters, seed = seed)
+    #characters past the cyphered letters are kept
+    kept = np.arange(num_letters, len(metrics[0]))
+    full_perms = np.hstack((perms, np.tile(kept, (num_permutations, 1)))).astype(np.intp)
+    return (perms, permuted_widths(full_perms, layout, metrics))
+
+class WidthIndex:
+    """ Widths in pixels of a word list as rendered in one font and size,
+        and of the same words under random cyphers that map the letters of
+        'latin_alphabet' onto the glyphs of 'cypher_alphabet' (other
+        characters are kept).
+    """
+    def __init__(self, words, widths, latin_alphabet = LATIN_ALPHABET, cypher_alphabet = None, perms = None, cypher_widths = None):
+        self.words = list(words)
+        self.index = dict((word, n) for n, word in enumerate(self.words))
+        self.widths = np.asarray(widths)
+        self.latin_alphabet = latin_alphabet
+        self.cypher_alphabet = cypher_alphabet
+        self.perms = perms                 #(permutations x letters) cypher glyph of each latin letter
+        self.cypher_widths = cypher_widths #(permutations x words)
+
+    @classmethod
+    def build(cls,
+              words,
+              font_path,
+              font_size,
+              cypher_alphabet = None,
+              num_permutations = NUM_PERMUTATIONS_DEFAULT,
+              latin_alphabet = LATIN_ALPHABET,
+              num_workers = None,
+              seed = None,
+             ):
+        """ measure the glyphs once and compute the widths of all 'words' and,
+            if a 'cypher_alphabet' (one glyph per letter of 'latin_alphabet')
+            is given, of 'num_permutations' random cyphers of them, spread
+            over 'num_workers' processes (default: one per CPU)
+        """
+        words = list(words)
+        other = sorted(set(u"".join(words)) - set(latin_alphabet))
+        alphabet = list(latin_alphabet) + other
+        pairs, pair_occurrences = pair_counts(words, alphabet)
+        layout = (letter_counts(words, alphabet).astype(float),
+                  last_letters(words, alphabet),
+                  pairs,
+                  pair_occurrences.astype(float),
+                 )
+        identity = np.arange(len(alphabet))[np.newaxis,:]
+        widths = permuted_widths(identity, layout, glyph_metrics(alphabet, font_path, font_size))[0]
+        if cypher_alphabet is None:
+            return cls(words, widths, latin_alphabet = latin_alphabet)
+        if len(cypher_alphabet) != len(latin_alphabet):
+            raise ValueError("the cypher alphabet must have one glyph per latin letter")
+        metrics = glyph_metrics(list(cypher_alphabet) + other, font_path, font_size)
+        if num_workers is None:
+            num_workers = multiprocessing.cpu_count()
+        #a chunk of permutations per task, each with its own random stream
+        num_chunks = max(min(num_workers*4, num_permutations//1000), 1)
+        chunk_sizes = np.diff(np.linspace(0, num_permutations, num_chunks + 1).astype(int))
+        seeds = np.random.RandomState(seed).randint(2**31 - 1, size = num_chunks)
+        tasks = [(s, n, len(latin_alphabet), layout, metrics) for s, n in zip(seeds, chunk_sizes)]
+        if num_workers > 1 and num_chunks > 1:
+            pool = multiprocessing.Pool(num_workers)
+            try:
+                results = pool.map(_cypher_worker, tasks)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [_cypher_worker(task) for task in tasks]
+        perms = np.concatenate([perms for perms, w in results])
+        cypher_word_widths = np.concatenate([w for perms, w in results])
+        return cls(words, widths,
+                   latin_alphabet = latin_alphabet,
+                   cypher_alphabet = cypher_alphabet,
+                   perms = perms,
+                   cypher_widths = cypher_word_widths,
+                  )
+
+    def width(self, word):
+        return int(self.widths[self.index[word]])
+
+    def select(self, min_width = None, max_width = None):
+        "the words whose width is within [min_width, max_width]"
+        mask = np.ones(len(self.words), dtype = bool)
+        if not min_width is None:
+            mask &= self.widths >= min_width
+        if not max_width is None:
+            mask &= self.widths <= max_width
+        return [word for word, m in zip(self.words, mask) if m]
+
+    def cypher_range(self, word = None):
+        "(min, max) width over the cyphers of 'word' (default: of all words)"
+        if word is None:
+            widths = self.cypher_widths
+        else:
+            widths = self.cypher_widths[:,self.index[word]]
+        return (int(widths.min()), int(widths.max()))
+
+    def cypher_percentiles(self, q = (5, 50, 95)):
+        "(words x len(q)) percentiles of the cypher widths of each word"
+        return np.percentile(self.cypher_widths, q, axis = 0).T
+
+    def find_cyphers(self, word, min_width = None, max_width = None):
+        "indices of the permutations rendering 'word' within [min_width, max_width]"
+        widths = self.cypher_widths[:,self.index[word]]
+        mask = np.ones(len(widths), dtype = bool)
+        if not min_width is None:
+            mask &= widths >= min_width
+        if not max_width is None:
+            mask &= widths <= max_width
+        return np.flatnonzero(mask)
+
+    def cypher_string(self, word, permutation):
+        "'word' encoded with the cypher of permutation index 'permutation'"
+        perm = self.perms[permutation]
+        cypher_map = dict((ch, self.cypher_alphabet[p]) for ch, p in zip(self.latin_alphabet, perm))
+        return u"".join(cypher_map.get(ch, ch) for ch in word)
+
+    def save(self, filename):
+        arrays = dict(words = np.array(self.words),
+                      widths = self.widths,
+                      latin_alphabet = np.array(list(self.latin_alphabet)),
+                     )
+        if not self.cypher_alphabet is None:
+            arrays.update(cypher_alphabet = np.array(list(self.cypher_alphabet)),
+                          perms = self.perms,
+                          cypher_widths = self.cypher_widths,
+                         )
+        np.savez(filename, **arrays)
+
+    @classmethod
+    def load(cls, filename):
+        data = np.load(filename)
+        cypher_alphabet = perms = cypher_widths = None
+        if 'cypher_alphabet' in data.files:
+            cypher_alphabet = list(data['cypher_alphabet'])
+            perms = data['perms']
+            cypher_widths = data['cypher_widths']
+        return cls(list(data['words']), data['widths'],
+                   latin_alphabet = u"".join(data['latin_alphabet']),
+                   cypher_alphabet = cypher_alphabet,
+                   perms = perms,
+                   cypher_widths = cypher_widths,
+                  )
+
+################################################################################
+# TEST CODE
+################################################################################
+if __name__ == "__main__":
+    import time
+    font_path = resources.get_fontpath("DejaVuSansMono.ttf")
+    font_size = 288
+    with resources.load_wordlist() as list_file:
+        words = [line.strip().upper() for line in list_file if line.strip()]
+    hebrew_alphabet = list(u"\u05D0\u05D1\u05D2\u05D3\u05D4\u05D5\u05D6\u05D7\u05D8\u05D9\u05DA\u05DB\u05DC"
+                           u"\u05DD\u05DE\u05DF\u05E1\u05E2\u05E3\u05E4\u05E5\u05E6\u05E7\u05E8\u05E9\u05EA")
+    t0 = time.time()
+    index = WidthIndex.build(words, font_path, font_size, cypher_alphabet = hebrew_alphabet, seed = 0)
+    print("%d words x %d cyphers in %0.2f s" % (len(words), len(index.perms), time.time() - t0))
+    font = resources.get_font(font_path, font_size)
+    print("latin widths match Font.size: %s" % all(font.size(w)[0] == index.width(w) for w in words))
+    cyphers = [index.cypher_string(w, 0) for w in words]
+    print("cypher widths match Font.size: %s" % all(font.size(c)[0] == w for c, w in zip(cyphers, index.cypher_widths[0])))
+    print("latin width range: %d - %d pixels" % (index.widths.min(), index.widths.max()))
+    print("cypher width range: %d - %d pixels" % index.cypher_range())
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Closed-form sprite trajectories.
+
+A trajectory maps the time since the start of the motion to the cartesian
+positions of a group of sprites, for a whole array of times at once, so the
+positions at the predicted flip time of every frame can be tabulated before
+a run (see precompute_positions) and each frame only looks its row up.
+"""
+from __future__ import print_function
+
+import numpy as np
+import scipy.interpolate
+
+#local imports
+from common import pol2cart
+
+def frame_times(num_frames, display_rate):
+    "flip times of the frames relative to the first one"
+    return np.arange(num_frames)/float(display_rate)
+
+def flip_index(elapsed, display_rate):
+    """ index of the frame that will show what is rendered 'elapsed' seconds
+        after the start, i.e. the next flip on the refresh grid
+    """
+    return int(np.ceil(elapsed*display_rate - 1e-6))
+
+def precompute_positions(trajectory, num_frames, display_rate):
+    "(frames x sprites x 2) positions at the flip time of every frame"
+    return trajectory.evaluate(frame_times(num_frames, display_rate)).astype(np.float32)
+
+class LinearTrajectory:
+    """ constant velocity from 'position_initial', both (sprites x 2); the
+        positions of sprites flagged in 'use_polar_coords' are (r, theta)
+        and their velocities (dr/dt, dtheta/dt)
+    """
+    def __init__(self, position_initial, velocity, use_polar_coords = False):
+        self.position_initial = np.atleast_2d(np.asarray(position_initial, dtype = float))
+        self.num_sprites = N = len(self.position_initial)
+        self.velocity = np.broadcast_to(np.asarray(velocity, dtype = float), (N,2)).copy()
+        self.use_polar_coords = np.broadcast_to(np.asarray(use_polar_coords, dtype = bool), (N,)).copy()
+
+    def evaluate(self, t):
+        "(times x sprites x 2) cartesian positions at the times 't'"
+        t = np.atleast_1d(np.asarray(t, dtype = float))
+        p = self.position_initial + self.velocity*t[:,np.newaxis,np.newaxis]
+        polar = self.use_polar_coords
+        if polar.any():
+            x, y = pol2cart(p[:,polar,0], p[:,polar,1])
+            p[:,polar,0] = x
+            p[:,polar,1] = y
+        return p
+
+class CircularTrajectory:
+    """ uniform circular motion around 'center' (sprites x 2) at 'radius',
+        'angular_velocity' (radians/s) and starting angle 'phase'
+    """
+    def __init__(self, center, radius, angular_velocity, phase = 0.0):
+        self.center = np.atleast_2d(np.asarray(center, dtype = float))
+        self.num_sprites = N = max(len(self.center), np.size(radius), np.size(angular_velocity), np.size(phase))
+        self.center = np.broadcast_to(self.center, (N,2)).copy()
+        self.radius           = np.broadcast_to(np.asarray(radius, dtype = float), (N,)).copy()
+        self.angular_velocity = np.broadcast_to(np.asarray(angular_velocity, dtype = float), (N,)).copy()
+        self.phase            = np.broadcast_to(np.asarray(phase, dtype = float), (N,)).copy()
+
+    def evaluate(self, t):
+        "(times x sprites x 2) cartesian positions at the times 't'"
+        t = np.atleast_1d(np.asarray(t, dtype = float))
+        theta = self.phase + self.angular_velocity*t[:,np.newaxis]
+        x, y = pol2cart(self.radius, theta)
+        return self.center + np.stack((x, y), axis = -1)
+
+class KeyframeTrajectory:
+    """ spline through the (keyframes x sprites x 2) cartesian 'positions'
+        at the shared keyframe 'times'; 'kind' is an interp1d kind such as
+        'linear' or 'cubic' (at least 4 keyframes), sprites hold their first
+        and last positions outside of the keyframe times
+    """
+    def __init__(self, times, positions, kind = 'cubic'):
+        self.times = np.asarray(times, dtype = float)
+        positions = np.asarray(positions, dtype = float)
+        if positions.ndim == 2: #a single sprite
+            positions = positions[:,np.newaxis,:]
+        self.positions = positions
+        self.num_sprites = positions.shape[1]
+        self.kind = kind
+        self._spline = scipy.interpolate.interp1d(self.times, positions,
+                                                  kind = kind,
+                                                  axis = 0,
+                                                  bounds_error = False,
+                                                  fill_value = (positions[0], positions[-1]),
+                                                  assume_sorted = True,
+                                                 )
+
+    def evaluate(self, t):
+        "(times x sprites x 2) cartesian positions at the times 't'"
+        return self._spline(np.atleast_1d(np.asarray(t, dtype = float)))
+
+################################################################################
+# TEST CODE
+################################################################################
+if __name__ == "__main__":
+    import time
+    DISPLAY_RATE = 144.0
+    NUM_SPRITES = 2000
+    rng = np.random.RandomState(0)
+    trajectories = [LinearTrajectory(rng.uniform(-1, 1, (NUM_SPRITES, 2)), rng.uniform(-0.1, 0.1, (NUM_SPRITES, 2))),
+                    CircularTrajectory(np.zeros(2), rng.uniform(0.1, 0.9, NUM_SPRITES), rng.uniform(-np.pi, np.pi, NUM_SPRITES)),
+                    KeyframeTrajectory([0, 2, 4, 6, 8], rng.uniform(-1, 1, (5, NUM_SPRITES, 2))),
+                   ]
+    num_frames = int(10*DISPLAY_RATE)
+    for trajectory in trajectories:
+        t0 = time.time()
+        table = precompute_positions(trajectory, num_frames, DISPLAY_RATE)
+        print("%s: %d frames x %d sprites in %0.3f s (%0.1f MB)" % (trajectory.__class__.__name__, num_frames, NUM_SPRITES,
+                                                                    time.time() - t0, table.nbytes/1e6))
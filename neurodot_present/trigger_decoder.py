@@ -0,0 +1,444 @@
+# -*- coding: utf-8 -*-
+"""
+Decoding of VsyncPatch events from photodiode recordings.
+
+A trace is a (samples x channels) array, typically a np.memmap of the raw
+amplifier file (see 'open_trace'), or any iterable of such chunks when the
+data is streamed.  The samples are processed chunk by chunk with vectorized
+hysteresis thresholding directly on the raw samples, only the (few)
+transitions are kept in memory.
+
+VsyncPatch_Version1 needs one photodiode per quadrant, channel k looking
+at bit k; VsyncPatch_Version2 needs a single photodiode on the patch;
+VsyncPatch_FrameCounter needs one photodiode per cell, the parity cell last.
+A VsyncPatchGroup needs one photodiode per patch for 'decode_latencies'.
+"""
+from __future__ import print_function
+
+from collections import OrderedDict
+
+import numpy as np
+
+CHUNK_SIZE_DEFAULT  = 1 << 22 #samples
+HYSTERESIS_DEFAULT  = 0.2     #fraction of the low/high level difference
+NUM_PROBE_DEFAULT   = 1 << 20 #samples used to estimate the levels
+MAX_CODE_DEFAULT    = 18
+
+EVENT_DTYPE = np.dtype([('onset'     , np.int64),   #sample index of the event onset
+                        ('time'      , np.float64), #onset/sample_rate
+                        ('code'      , np.int32),
+                        ('confidence', np.float32), #0 (unreliable) to 1
+                       ])
+
+FRAME_DTYPE = np.dtype([('onset'   , np.int64),   #sample index of the frame onset
+                        ('time'    , np.float64), #onset/sample_rate
+                        ('counter' , np.int32),   #decoded frame counter
+                        ('duration', np.float32), #in frame periods, nan for the last frame
+                        ('missed'  , np.int32),   #counter values skipped before this frame
+                        ('repeated', np.int32),   #extra refreshes this frame was held for
+                        ('valid'   , np.bool_),   #parity check passed
+                       ])
+
+#-------------------------------------------------------------------------------
+# trace access
+def open_trace(filename, dtype = np.int16, num_channels = 1, offset = 0):
+    """ memory-map a raw recording of interleaved channels, returns a
+        (samples x channels) array which is only read on demand
+    """
+    data = np.memmap(filename, dtype = dtype, mode = 'r', offset = offset)
+    return data.reshape((-1, num_channels))
+
+def _as_2d(chunk):
+    chunk = np.asarray(chunk)
+    if chunk.ndim == 1:
+        chunk = chunk[:,np.newaxis]
+    return chunk
+
+def iter_chunks(trace, chunk_size = CHUNK_SIZE_DEFAULT):
+    """ yield (start_sample, chunk) pairs from an array-like trace, or pass
+        through the chunks of an iterable one
+    """
+    if hasattr(trace, 'shape'):
+        for start in range(0, len(trace), chunk_size):
+            yield (start, _as_2d(trace[start:start + chunk_size]))
+    else:
+        start = 0
+        for chunk in trace:
+            chunk = _as_2d(chunk)
+            yield (start, chunk)
+            start += len(chunk)
+
+def estimate_levels(trace, num_probe = NUM_PROBE_DEFAULT):
+    """ per channel (off, on) photodiode levels, from the 1st and 99th
+        percentiles of a strided subsample of the trace
+    """
+    trace = _as_2d(trace[::max(1, len(trace)//num_probe)]).astype(np.float64)
+    low  = np.percentile(trace,  1, axis = 0)
+    high = np.percentile(trace, 99, axis = 0)
+    return (low, high)
+
+def _thresholds(levels, hysteresis, dtype):
+    """ (off, on) thresholds per channel, on integer data they are rounded
+        outwards so that samples can be compared without conversion
+    """
+    off_level, on_level = [np.atleast_1d(np.asarray(l, dtype = np.float64)) for l in levels]
+    span = on_level - off_level
+    thresh_off = off_level + (0.5 - 0.5*hysteresis)*span
+    thresh_on  = off_level + (0.5 + 0.5*hysteresis)*span
+    inverted = span < 0  #on level below the off level
+    if np.issubdtype(dtype, np.integer):
+        info = np.iinfo(dtype)
+        thresh_on  = np.where(inverted, np.floor(thresh_on) , np.ceil(thresh_on))
+        thresh_off = np.where(inverted, np.ceil(thresh_off) , np.floor(thresh_off))
+        thresh_on  = np.clip(thresh_on , info.min, info.max).astype(dtype)
+        thresh_off = np.clip(thresh_off, info.min, info.max).astype(dtype)
+    return (thresh_off, thresh_on, inverted)
+
+def _run_starts(mask):
+    "indices where runs of True begin"
+    starts = np.flatnonzero(mask[1:] & ~mask[:-1]) + 1
+    if mask[0]:
+        starts = np.concatenate(([0], starts))
+    return starts
+
+def channel_transitions(x, thresh_off, thresh_on, inverted, state):
+    """ hysteresis thresholding of one channel: the state turns on at the
+        first sample past 'thresh_on' and off at the first one past
+        'thresh_off', samples in between keep it.  Only the starts of the
+        definite runs are extracted, returns (indices, new_states, final_state)
+    """
+    if inverted:
+        on, off = (x <= thresh_on, x >= thresh_off)
+    else:
+        on, off = (x >= thresh_on, x <= thresh_off)
+    on_starts  = _run_starts(on)
+    off_starts = _run_starts(off)
+    indices = np.concatenate((on_starts, off_starts))
+    new_states = np.concatenate((np.ones(len(on_starts), dtype = bool), np.zeros(len(off_starts), dtype = bool)))
+    order = np.argsort(indices, kind = 'mergesort')
+    indices, new_states = indices[order], new_states[order]
+    # runs alternate except across an undecided gap, keep only real changes
+    prev = np.concatenate(([state], new_states[:-1]))
+    changed = new_states != prev
+    indices, new_states = indices[changed], new_states[changed]
+    if len(new_states):
+        state = new_states[-1]
+    return (indices, new_states, state)
+
+def _prepend(item, iterator):
+    yield item
+    for it in iterator:
+        yield it
+
+def find_transitions(trace,
+                     levels = None,
+                     hysteresis = HYSTERESIS_DEFAULT,
+                     invert = False,
+                     chunk_size = CHUNK_SIZE_DEFAULT,
+                    ):
+    """ on/off transitions of every photodiode channel over the whole trace,
+        processed in chunks; returns (indices, channels, new_states,
+        initial_states) with the transitions sorted by sample index
+    """
+    chunks = iter_chunks(trace, chunk_size = chunk_size)
+    if levels is None:
+        if hasattr(trace, 'shape'):
+            levels = estimate_levels(trace)
+        else: #streamed, estimate from the first chunk
+            first = next(chunks)
+            levels = estimate_levels(first[1])
+            chunks = _prepend(first, chunks)
+    if invert:
+        levels = (levels[1], levels[0])
+    thresholds = None
+    states = None
+    initial_states = None
+    indices, channels, new_states = ([], [], [])
+    for start, chunk in chunks:
+        if thresholds is None:
+            thresholds = _thresholds(levels, hysteresis, chunk.dtype)
+            thresh_off, thresh_on, inverted = thresholds
+            mid = 0.5*(np.asarray(levels[0], dtype = float) + np.asarray(levels[1], dtype = float))
+            initial_states = np.where(inverted, chunk[0] <= mid, chunk[0] >= mid)
+            states = initial_states.copy()
+        for ch in range(chunk.shape[1]):
+            idx, new, states[ch] = channel_transitions(chunk[:,ch], thresh_off[ch], thresh_on[ch], inverted[ch], states[ch])
+            indices.append(start + idx)
+            channels.append(np.full(len(idx), ch, dtype = np.int64))
+            new_states.append(new)
+    if not indices:
+        empty = np.zeros(0, dtype = np.int64)
+        return (empty, empty, np.zeros(0, dtype = bool), np.zeros(0, dtype = bool))
+    indices, channels, new_states = [np.concatenate(a) for a in (indices, channels, new_states)]
+    order = np.argsort(indices, kind = 'mergesort')
+    return (indices[order], channels[order], new_states[order], initial_states)
+
+def transitions_to_codes(indices, channels, initial_states):
+    """ combine per channel transitions into the code (channel k is bit k)
+        held from each transition on, simultaneous transitions are merged;
+        returns (indices, codes, initial_code)
+    """
+    initial_code = int(np.dot(initial_states, 1 << np.arange(len(initial_states))))
+    if len(indices) == 0:
+        return (indices, np.zeros(0, dtype = np.int64), initial_code)
+    # every transition toggles the bit of its channel
+    codes = initial_code ^ np.bitwise_xor.accumulate(np.left_shift(1, channels))
+    last = np.append(indices[1:] != indices[:-1], True)
+    return (indices[last], codes[last], initial_code)
+
+def settle_codes(indices, codes, initial_code, min_samples):
+    """ discard codes held for less than 'min_samples' (e.g. while several
+        photodiodes switch at slightly different times) and glitches that
+        return to the same code; returns (onsets, settled, codes) where the
+        onset is the first sample at which the previous stable code was
+        left and 'settled' the sample from which the new code is held
+    """
+    if len(indices) == 0:
+        empty = np.zeros(0, dtype = np.int64)
+        return (empty, empty, empty)
+    ends = np.append(indices[1:], indices[-1] + max(min_samples, 1))
+    stable = np.flatnonzero(ends - indices >= min_samples)
+    stable_codes = codes[stable]
+    prev_codes = np.concatenate(([initial_code], stable_codes[:-1]))
+    stable = stable[stable_codes != prev_codes]
+    # the transition starts at the first change after the previous stable code
+    first_change = np.concatenate(([0], stable[:-1] + 1))
+    return (indices[first_change], indices[stable], codes[stable])
+
+#-------------------------------------------------------------------------------
+# decoders
+def decode_version1(trace,
+                    sample_rate,
+                    min_duration = 0.004,
+                    levels = None,
+                    **kwargs
+                   ):
+    """ decode the 4-bit quadrant codes of VsyncPatch_Version1 from a
+        (samples x 4) trace, channel k looking at bit k.  Codes held for less
+        than 'min_duration' seconds (e.g. while the photodiodes settle at
+        slightly different times) are discarded, the onset of an event is
+        the first sample at which the previous stable code was left.
+        The confidence is the smallest normalized distance of any channel
+        from its mid level, halfway into the stable code.
+    """
+    if levels is None and hasattr(trace, 'shape'):
+        levels = estimate_levels(trace)
+    indices, channels, new_states, initial_states = find_transitions(trace, levels = levels, **kwargs)
+    indices, codes, initial_code = transitions_to_codes(indices, channels, initial_states)
+    if len(indices) == 0:
+        return np.zeros(0, dtype = EVENT_DTYPE)
+    min_samples = int(round(min_duration*sample_rate))
+    onsets, settled, stable_codes = settle_codes(indices, codes, initial_code, min_samples)
+    events = np.zeros(len(onsets), dtype = EVENT_DTYPE)
+    events['onset'] = onsets
+    events['time']  = events['onset']/float(sample_rate)
+    events['code']  = stable_codes
+    if not levels is None and hasattr(trace, 'shape') and len(onsets):
+        low, high = [np.asarray(l, dtype = np.float64) for l in levels]
+        probe = np.minimum(settled + min_samples//2, len(trace) - 1)
+        x = _as_2d(trace[probe]).astype(np.float64)
+        half_span = 0.5*np.abs(high - low)
+        margin = np.abs(x - 0.5*(low + high))/np.where(half_span > 0, half_span, np.inf)
+        events['confidence'] = np.clip(margin, 0.0, 1.0).min(axis = 1)
+    else:
+        events['confidence'] = 1.0
+    return events
+
+def decode_version2(trace,
+                    sample_rate,
+                    timing_base = None,
+                    pulse_duration = None,
+                    display_rate = None,
+                    max_code = MAX_CODE_DEFAULT,
+                    channel = 0,
+                    **kwargs
+                   ):
+    """ decode the pulse-interval codes of VsyncPatch_Version2, the gap
+        between the end of the first pulse and the start of the second is
+        (code + 0.25)*timing_base seconds.  The onset of an event is the first
+        sample of its first pulse.  The confidence combines how close the
+        gap is to its nominal value (1 when exact, 0 halfway to the next
+        code) with how close the first pulse width is to 'pulse_duration'.
+        Pass the 'timing_base' and 'pulse_duration' of the patch, or the
+        'display_rate' it ran at to derive them from its default frame counts.
+    """
+    if timing_base is None or pulse_duration is None:
+        from vsync_patch import VsyncPatch_Version2
+        if display_rate is None:
+            default_timing_base = VsyncPatch_Version2.VSYNC_TIMING_BASE
+            default_pulse_duration = VsyncPatch_Version2.PULSE_DURATION
+        else:
+            pulse_frames, timing_base_frames = VsyncPatch_Version2.frame_timing(display_rate)
+            default_timing_base = timing_base_frames/float(display_rate)
+            default_pulse_duration = pulse_frames/float(display_rate)
+        if timing_base is None:
+            timing_base = default_timing_base
+        if pulse_duration is None:
+            pulse_duration = default_pulse_duration
+    if hasattr(trace, 'shape') and len(trace.shape) == 2:
+        trace = trace[:,channel]
+    indices, channels, new_states, initial_states = find_transitions(trace, **kwargs)
+    rises = indices[new_states]
+    falls = indices[~new_states]
+    # pair every rise with the fall that follows it
+    if len(falls) and len(rises) and falls[0] < rises[0]:
+        falls = falls[1:]
+    num_pulses = min(len(rises), len(falls))
+    rises, falls = rises[:num_pulses], falls[:num_pulses]
+    if num_pulses < 2:
+        return np.zeros(0, dtype = EVENT_DTYPE)
+    # candidate events: pulse i followed by pulse i+1 within the longest code
+    gaps = (rises[1:] - falls[:-1])/float(sample_rate)
+    x = gaps/timing_base - 0.25
+    code = np.round(x).astype(np.int64)
+    candidate = (code >= 1) & (code <= max_code)
+    # a pulse can only be used once, take candidates greedily in time order
+    first_pulse = []
+    i = 0
+    candidates = np.flatnonzero(candidate)
+    for c in candidates:
+        if c >= i:
+            first_pulse.append(c)
+            i = c + 2
+    first_pulse = np.array(first_pulse, dtype = np.int64)
+    events = np.zeros(len(first_pulse), dtype = EVENT_DTYPE)
+    if len(first_pulse) == 0:
+        return events
+    events['onset'] = rises[first_pulse]
+    events['time']  = events['onset']/float(sample_rate)
+    events['code']  = code[first_pulse]
+    nominal_gap = (code[first_pulse] + 0.25)*timing_base
+    if not display_rate is None:
+        #the patch rounds the gap to whole frames
+        timing_base_frames = np.round(timing_base*display_rate)
+        nominal_gap = np.floor((code[first_pulse] + 0.25)*timing_base_frames + 0.5)/display_rate
+    timing_conf = 1.0 - 2.0*np.abs(gaps[first_pulse] - nominal_gap)/timing_base
+    width = (falls[first_pulse] - rises[first_pulse])/float(sample_rate)
+    width_conf = np.clip(1.0 - np.abs(width - pulse_duration)/pulse_duration, 0.0, 1.0)
+    events['confidence'] = np.clip(timing_conf, 0.0, 1.0)*width_conf
+    return events
+
+def gray_to_binary(codes, num_bits):
+    codes = np.array(codes, dtype = np.int64)
+    shift = 1
+    while shift < num_bits:
+        codes ^= codes >> shift
+        shift <<= 1
+    return codes
+
+def decode_frame_counter(trace,
+                         sample_rate,
+                         frame_rate,
+                         num_bits = None,
+                         parity = True,
+                         gray_code = True,
+                         min_duration = None,
+                         **kwargs
+                        ):
+    """ decode the rolling frame counter of VsyncPatch_FrameCounter from a
+        (samples x cells) trace, channel k looking at cell k.  Codes held
+        for less than 'min_duration' seconds (default a quarter frame) are
+        discarded as in decode_version1.  A frame is counted as 'missed'
+        for every counter value skipped (rendered but never shown) and as
+        'repeated' for every extra refresh period it stayed on screen (the
+        next flip missed its vsync).
+    """
+    if num_bits is None:
+        from vsync_patch import VsyncPatch_FrameCounter
+        num_bits = VsyncPatch_FrameCounter.NUM_BITS_DEFAULT
+    if min_duration is None:
+        min_duration = 0.25/frame_rate
+    if kwargs.get('levels') is None and hasattr(trace, 'shape'):
+        kwargs['levels'] = estimate_levels(trace)
+    indices, channels, new_states, initial_states = find_transitions(trace, **kwargs)
+    indices, codes, initial_code = transitions_to_codes(indices, channels, initial_states)
+    min_samples = int(round(min_duration*sample_rate))
+    onsets, settled, codes = settle_codes(indices, codes, initial_code, min_samples)
+    frames = np.zeros(len(onsets), dtype = FRAME_DTYPE)
+    if len(onsets) == 0:
+        return frames
+    mask = (1 << num_bits) - 1
+    data = codes & mask
+    if parity:
+        num_on = np.zeros(len(data), dtype = np.int64)
+        for bit in range(num_bits + 1):
+            num_on += (codes >> bit) & 1
+        frames['valid'] = num_on % 2 == 0
+    else:
+        frames['valid'] = True
+    counter = gray_to_binary(data, num_bits) if gray_code else data
+    frames['onset']   = onsets
+    frames['time']    = onsets/float(sample_rate)
+    frames['counter'] = counter
+    duration = np.diff(onsets)*float(frame_rate)/sample_rate
+    frames['duration'] = np.append(duration, np.nan)
+    frames['repeated'][:-1] = np.maximum(np.round(duration).astype(np.int64) - 1, 0)
+    frames['missed'][1:] = (np.diff(counter) - 1) & mask
+    # a frame failing the parity check makes its neighbours unreliable too
+    invalid = ~frames['valid']
+    frames['missed'][1:][invalid[1:] | invalid[:-1]] = 0
+    return frames
+
+def summarize_frames(frames):
+    "counts of the decoded, missed, repeated and invalid frames"
+    return OrderedDict((
+        ('num_frames'  , len(frames)),
+        ('num_missed'  , int(frames['missed'].sum())),
+        ('num_repeated', int(frames['repeated'].sum())),
+        ('num_invalid' , int((~frames['valid']).sum())),
+    ))
+
+def decode_latencies(trace,
+                     sample_rate,
+                     reference = 0,
+                     max_latency = 0.05,
+                     **kwargs
+                    ):
+    """ per channel delay of the photodiode onsets of a VsyncPatchGroup (one
+        photodiode per patch) relative to the 'reference' channel: every
+        rise of the reference is matched to the first rise of each other
+        channel within 'max_latency' seconds.  Returns an OrderedDict per
+        channel of the median latency, its spread (std) and the number of
+        matched onsets, positive latencies are scanned out later.
+    """
+    if kwargs.get('levels') is None and hasattr(trace, 'shape'):
+        kwargs['levels'] = estimate_levels(trace)
+    indices, channels, new_states, initial_states = find_transitions(trace, **kwargs)
+    rises = indices[new_states]
+    rise_channels = channels[new_states]
+    ref_rises = rises[rise_channels == reference]
+    max_samples = max_latency*sample_rate
+    results = OrderedDict()
+    for ch in range(len(initial_states)):
+        ch_rises = rises[rise_channels == ch]
+        # search from half the window before the reference, for patches
+        # scanned out earlier than it
+        i = np.searchsorted(ch_rises, ref_rises - max_samples/2)
+        valid = i < len(ch_rises)
+        delay = ch_rises[np.minimum(i, len(ch_rises) - 1)] - ref_rises
+        valid &= np.abs(delay) <= max_samples
+        latency = delay[valid]/float(sample_rate)
+        results[ch] = OrderedDict((
+            ('latency', np.median(latency) if len(latency) else np.nan),
+            ('spread' , latency.std() if len(latency) else np.nan),
+            ('num_onsets', len(latency)),
+        ))
+    return results
+
+def decode_file(filename,
+                sample_rate,
+                version = 2,
+                dtype = np.int16,
+                num_channels = 1,
+                offset = 0,
+                **kwargs
+               ):
+    trace = open_trace(filename, dtype = dtype, num_channels = num_channels, offset = offset)
+    if version == 1:
+        return decode_version1(trace, sample_rate, **kwargs)
+    elif version == 2:
+        return decode_version2(trace, sample_rate, **kwargs)
+    elif version == 3:
+        return decode_frame_counter(trace, sample_rate, **kwargs)
+    else:
+        raise ValueError("version = %r is not valid, try 1, 2 or 3" % version)
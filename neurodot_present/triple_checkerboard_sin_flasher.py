@@ -26,10 +26,14 @@ class TripleCheckerBoardSinFlasher(Screen):
               #rate_compensation = None,
               inv_gamma_func = None,
               vsync_patch = 'bottom-right',
+              log_frames = False,
+              probe_patches = False,
              ):
         Screen.setup(self,
                      background_color = screen_background_color,
                      vsync_patch = vsync_patch,
+                     log_frames = log_frames,
+                     probe_patches = probe_patches,
                      )
         # check if we are rendering center board
         if flash_rate_center == None:
@@ -169,6 +173,15 @@ class TripleCheckerBoardSinFlasher(Screen):
 
         return color_func
 
+    def get_reversing_boards(self):
+        #cos(flash_rate*pi*t) has period 2/flash_rate
+        boards = [('left' , self.CB_left.color1 , self.flash_rate_left),
+                  ('right', self.CB_right.color1, self.flash_rate_right),
+                 ]
+        if self.render_center:
+            boards.append(('center', self.CB_center.color1, self.flash_rate_center))
+        return boards
+
     def run(self, **kwargs):
         # loop rate set too high so that it should run effectively as fast as python is capable of looping
         Screen.run(self, display_loop_rate = 10000, **kwargs)
@@ -204,6 +217,7 @@ if __name__ == "__main__":
                nrows_center = nrows_center,
                show_fixation_dot = True,
                inv_gamma_func = inv_gamma_func,
+               log_frames = True,
               )
 
 #-------------------------------------------------------------------------------
@@ -232,19 +246,23 @@ if __name__ == "__main__":
     TCBF.run(duration = duration)
     pygame.quit()
 
+    # spectral verification of what was actually flipped to the screen
+    from stimulus_spectrum import analyze_frame_log, compute_spectrum, format_report
+    reports = analyze_frame_log(TCBF.frame_log, TCBF.get_stimulus_frequencies())
+    print(format_report(reports))
+
     if show_plot:
-        t_diffs = np.diff(np.array(TCBF.t_list))
+        t_diffs = np.diff(TCBF.frame_log.t)
         mean_sample_freq = 1.0/t_diffs.mean()
         
-        print('Mean sample interval: ', t_diffs.mean())
-        print('Mean sample frequency:', mean_sample_freq)
-        print('Sample interval STD:  ', t_diffs.std())
+        print('Mean frame interval:  ', t_diffs.mean())
+        print('Mean frame frequency: ', mean_sample_freq)
+        print('Frame interval STD:   ', t_diffs.std())
 
         import matplotlib.pyplot as plt
         plt.subplot(2,1,1)
-        plt.scatter(TCBF.t_list, TCBF.r1_list, color = 'red', label = 'Displayed')
+        plt.step(TCBF.frame_log.t - TCBF.t0, TCBF.frame_log.channel('left'), where = 'post', color = 'red', label = 'Displayed')
         time_vals = np.linspace(0, duration, duration * 720)
-        #trig_vals = [(-1.0 * np.cos(TCBF.flash_rate_left * 2.0 * np.pi * t) / 2.0 + 0.5) for t in time_vals]
         if inv_gamma_func is None:
             inv_gamma_func = lambda x:x
         trig_vals = [inv_gamma_func(-1.0 * np.cos(TCBF.flash_rate_left * np.pi * t) / 2.0 + 0.5) for t in time_vals]
@@ -252,10 +270,8 @@ if __name__ == "__main__":
         plt.legend()#loc = 'best')
 
         plt.subplot(2,1,2)
-        fft_data = abs(np.fft.rfft(TCBF.r1_list))
-        fft_freqs = np.fft.rfftfreq(len(TCBF.r1_list), 1.0/mean_sample_freq)
-        plt.plot(fft_freqs, fft_data)
-        plt.scatter(fft_freqs, fft_data)
+        fft_freqs, fft_data = compute_spectrum(TCBF.frame_log.t, TCBF.frame_log.values)
+        for name, spectrum in zip(TCBF.frame_log.channel_names, fft_data.T):
+            plt.plot(fft_freqs, spectrum, label = name)
+        plt.legend()
         plt.show()
-
-
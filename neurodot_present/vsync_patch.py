@@ -8,10 +8,149 @@ import itertools
 
 #local imports
 from common import SETTINGS, COLORS, VSYNC_PATCH_HEIGHT_DEFAULT,\
-                   VSYNC_PATCH_WIDTH_DEFAULT
+                   VSYNC_PATCH_WIDTH_DEFAULT, get_display_rate
+from event_log import EventRecorder, EVENT_PULSE_START, EVENT_PULSE_OFF,\
+                      EVENT_PULSE_END
+from quad_batch import QuadBatch, rect_vertices
+
+def make_code_batch(cell_rects, cell_states, on_color, off_color):
+    """ precompile a patch: one quad per cell of 'cell_rects' (rows of
+        left, bottom, right, top) and one color set per row of the
+        (codes x cells) boolean array 'cell_states', so that showing any
+        code is a single draw call without any upload
+    """
+    cell_rects  = np.asarray(cell_rects, dtype = np.float32)
+    cell_states = np.asarray(cell_states, dtype = bool)
+    batch = QuadBatch(rect_vertices(*cell_rects.T),
+                      num_color_sets = len(cell_states),
+                      dynamic = False,
+                     )
+    on_color  = np.asarray(on_color,  dtype = np.float32)
+    off_color = np.asarray(off_color, dtype = np.float32)
+    for code, states in enumerate(cell_states):
+        batch.set_colors(np.where(states[:,np.newaxis], on_color, off_color), color_set = code)
+    return batch
+
+#anchor of a patch as fractions of the free space (screen minus patch size)
+#along x and y, (0,0) is the bottom left corner of the screen
+PATCH_POSITIONS = {
+    'bottom-left'  : (0.0, 0.0),
+    'bottom-center': (0.5, 0.0),
+    'bottom-right' : (1.0, 0.0),
+    'left-center'  : (0.0, 0.5),
+    'center'       : (0.5, 0.5),
+    'right-center' : (1.0, 0.5),
+    'top-left'     : (0.0, 1.0),
+    'top-center'   : (0.5, 1.0),
+    'top-right'    : (1.0, 1.0),
+}
+
+def make_vsync_patch(cls,
+                     position,
+                     screen_left,
+                     screen_bottom,
+                     screen_right,
+                     screen_top,
+                     patch_width  = None,
+                     patch_height = None,
+                     **kwargs
+                    ):
+    """ make a patch of class 'cls' at 'position', one of PATCH_POSITIONS or
+        an (fx, fy) pair of fractions of the free space along x and y
+    """
+    if patch_width is None:
+        patch_width =  cls.VSYNC_PATCH_WIDTH_DEFAULT
+    if patch_height is None:
+        patch_height =  cls.VSYNC_PATCH_HEIGHT_DEFAULT
+    try:
+        fx, fy = PATCH_POSITIONS[position]
+    except (KeyError, TypeError):
+        fx, fy = position
+    obj = cls(left   = screen_left + fx*(screen_right - screen_left - patch_width),
+              bottom = screen_bottom + fy*(screen_top - screen_bottom - patch_height),
+              width  = patch_width,
+              height = patch_height,
+              **kwargs
+             )
+    obj.position = position
+    return obj
+
+def is_single_position(position):
+    "whether 'position' names one patch position rather than a sequence of them"
+    if isinstance(position, str):
+        return True
+    return (len(position) == 2
+            and all(isinstance(f, (int, float, np.number)) for f in position))
+
+def make_vsync_patch_group(cls, positions, screen_left, screen_bottom, screen_right, screen_top, **kwargs):
+    """ one patch of class 'cls' at each of 'positions', all driven by the
+        same code on the same frames; only the first patch records its
+        transitions to the event log, the others would repeat them
+    """
+    patches = []
+    for position in positions:
+        patch = make_vsync_patch(cls, position, screen_left, screen_bottom, screen_right, screen_top, **kwargs)
+        if not patches and hasattr(patch, 'event_log'):
+            kwargs['event_log'] = False
+        patches.append(patch)
+    return VsyncPatchGroup(patches)
+
+class VsyncPatchGroup:
+    """ Several simultaneous probe patches (e.g. top-left, center and
+         bottom-right) with one photodiode each, every call is forwarded to
+         all of them so they switch on the same flip, see
+         trigger_decoder.decode_latencies for the scan-out delay between them.
+    """
+    def __init__(self, patches):
+        self.patches = list(patches)
+        self.positions = [getattr(patch, 'position', None) for patch in self.patches]
+        self.ready_to_render = None
+
+    def start_time(self, t, vsync_value = 0):
+        for patch in self.patches:
+            patch.start_time(t, vsync_value = vsync_value)
+        self.ready_to_render = True
+
+    def update(self, t, dt):
+        self.ready_to_render = False
+        for patch in self.patches:
+            patch.update(t, dt)
+            self.ready_to_render = self.ready_to_render or patch.ready_to_render
+
+    def render(self):
+        for patch in self.patches:
+            patch.render()
+
+    def frame_flipped(self):
+        for patch in self.patches:
+            if hasattr(patch, 'frame_flipped'):
+                patch.frame_flipped()
+
+    @property
+    def cell_rects(self):
+        return np.vstack([patch.cell_rects for patch in self.patches])
+
+    def get_cell_colors(self):
+        colors = [patch.get_cell_colors() for patch in self.patches]
+        if any(c is None for c in colors):
+            return None
+        return np.vstack(colors)
+
+    def get_cell_states(self):
+        states = []
+        for patch in self.patches:
+            states.extend(patch.get_cell_states())
+        return states
+
+    @property
+    def event_log(self):
+        return self.patches[0].event_log
 
 
 class VsyncPatch_Version1:
+    VSYNC_PATCH_WIDTH_DEFAULT   = VSYNC_PATCH_WIDTH_DEFAULT
+    VSYNC_PATCH_HEIGHT_DEFAULT  = VSYNC_PATCH_HEIGHT_DEFAULT
+
     def __init__(self, left, bottom, width, height,
                  on_color  = COLORS['white'],
                  off_color = COLORS['black'],
@@ -30,6 +169,15 @@ class VsyncPatch_Version1:
         self.t0 = None
         self.vsync_value = None
         self.ready_to_render = None
+        #one quad per bit, one color set for each of the 16 codes
+        self.cell_rects = np.array(((left + width/2.0, bottom             , left + width     , bottom + height/2.0), #bit 0, bottom/right, also the vsync trigger bit
+                                    (left            , bottom             , left + width/2.0 , bottom + height/2.0), #bit 1, bottom/left
+                                    (left            , bottom + height/2.0, left + width/2.0 , bottom + height    ), #bit 2, top/left
+                                    (left + width/2.0, bottom + height/2.0, left + width     , bottom + height    ), #bit 3, top/right
+                                   ))
+        codes = np.arange(16)
+        self._code_states = ((codes[:,np.newaxis] >> np.arange(4)) & 1).astype(bool)
+        self._batch = make_code_batch(self.cell_rects, self._code_states, on_color, off_color)
         
     def start_time(self, t, vsync_value = 0):
         self.t0 = t
@@ -40,48 +188,26 @@ class VsyncPatch_Version1:
         #only update when ready
         self.ready_to_render = True
 
+    def get_cell_states(self):
+        "on/off state of the 4 bit cells on the last rendered frame"
+        if self.vsync_value is None:
+            return self._code_states[0]
+        return self._code_states[self.vsync_value & 0b1111]
+
     def compute_bit_colors(self):
-        bit_colors = []
-        if self.vsync_value & 0b0001:  #bit0,  also the vsync trigger bit
-            bit_colors.append(self.on_color)
-        else:
-            bit_colors.append(self.off_color)
-        if self.vsync_value & 0b0010:  #bit1
-            bit_colors.append(self.on_color)
-        else:
-            bit_colors.append(self.off_color)
-        if self.vsync_value & 0b0100:  #bit2
-            bit_colors.append(self.on_color)
-        else:
-            bit_colors.append(self.off_color)
-        if self.vsync_value & 0b1000:  #bit3
-            bit_colors.append(self.on_color)
-        else:
-            bit_colors.append(self.off_color)
-        return bit_colors
+        states = self._code_states[self.vsync_value & 0b1111]
+        return [self.on_color if state else self.off_color for state in states]
+
+    def get_cell_colors(self):
+        "colors of the cell_rects as rendered, None when nothing is drawn"
+        if self.vsync_value is None:
+            return None
+        return self._batch.colors[self.vsync_value & 0b1111, ::4]
 
     def render(self):
         if not self.vsync_value is None:
-            left, bottom, width, height = (self.left,self.bottom,self.width,self.height)
-            bit_colors = self.compute_bit_colors()
             gl.glLoadIdentity()
-            gl.glDisable(gl.GL_LIGHTING)
-
-            try:
-                #bit 0, sub square at bottom/right corner, also the vsync trigger bit
-                gl.glColor3f(*bit_colors[0])
-                gl.glRectf(left + width/2.0, bottom,  left + width, bottom + height/2.0) #left,bottom -> right,top
-                #bit 1, sub square at bottom/left corner
-                gl.glColor3f(*bit_colors[1])
-                gl.glRectf(left, bottom,left + width/2.0, bottom + height/2.0) #left,bottom -> right,top
-                #bit 2, sub square at top/left corner
-                gl.glColor3f(*bit_colors[2])
-                gl.glRectf(left, bottom + height/2.0,left + width/2.0, bottom + height) #left,bottom -> right,top
-                #bit 3, sub square at top/right corner
-                gl.glColor3f(*bit_colors[3])
-                gl.glRectf(left + width/2.0, bottom + height/2.0,left + width, bottom + height) #left,bottom -> right,top
-            finally:
-                gl.glEnable(gl.GL_LIGHTING)
+            self._batch.render(color_set = self.vsync_value & 0b1111)
                 
     @classmethod
     #define the vsync patch as being in the bottom right corner
@@ -99,20 +225,48 @@ class VsyncPatch_Version1:
         return obj
         
 class VsyncPatch_Version2:
-    """  The vSync code is sent as a timing between the start of two white 
-         pulses, pulse_interval = VSYNC_TIMING_BASE*VSYNC_CODE.
+    """  The vSync code is sent as a timing between two white pulses, the gap
+         from the end of the first pulse to the start of the second one is
+         (VSYNC_CODE + 0.25)*timing_base.
+
+         Pulse widths and gaps are counted in flipped frames, so that every
+         transition lands on a flip: 'pulse_frames' and 'timing_base_frames'
+         default to PULSE_DURATION and VSYNC_TIMING_BASE rounded to whole
+         frames at 'display_rate', which defaults to the refresh rate
+         measured by Screen.measure_display_rate (settings['display_rate']).
+         Decode with the resulting 'pulse_duration' and 'timing_base'.
+
+         Pulse transitions are recorded in 'event_log' (an EventRecorder)
+         instead of being printed from the frame loop, pass a file-like
+         'event_stream' (e.g. sys.stdout) to have them written out by the
+         recorder's background thread, or event_log = False to record
+         nothing.
     """
     
+    RECORDS_EVENTS = True #accepts an 'event_log', see Screen.setup
     PULSE_DURATION    = 4.0/60.0 #4 frames at 60 FPS
     VSYNC_TIMING_BASE = 4.0/60.0 #4 frames at 60 FPS
     VSYNC_PATCH_WIDTH_DEFAULT   = 0.05
     VSYNC_PATCH_HEIGHT_DEFAULT  = 0.05
     VSYNC_BACKGROUND_MARGIN = 0.05
 
+    @classmethod
+    def frame_timing(cls, display_rate, pulse_frames = None, timing_base_frames = None):
+        "(pulse_frames, timing_base_frames) at 'display_rate', at least one frame each"
+        if pulse_frames is None:
+            pulse_frames = max(int(cls.PULSE_DURATION*display_rate + 0.5), 1)
+        if timing_base_frames is None:
+            timing_base_frames = max(int(cls.VSYNC_TIMING_BASE*display_rate + 0.5), 1)
+        return (int(pulse_frames), int(timing_base_frames))
+
     def __init__(self, left, bottom, width, height,
                  on_color  = COLORS['white'],
                  off_color = COLORS['black'],
-                 display_rate = 144, #Hz
+                 display_rate = None, #Hz
+                 pulse_frames = None,
+                 timing_base_frames = None,
+                 event_log = None,
+                 event_stream = None,
                  ):
         self.vertices = np.array(((left      , bottom),
                                   (left+width, bottom),           #right bottom
@@ -125,25 +279,62 @@ class VsyncPatch_Version2:
         self.height = height
         self.on_color  = on_color
         self.off_color = off_color
+        self.display_rate = display_rate
+        self._pulse_frames_setting = pulse_frames
+        self._timing_base_frames_setting = timing_base_frames
+        self.pulse_frames = None
+        self.timing_base_frames = None
+        self.pulse_duration = None
+        self.timing_base = None
         self.ready_to_render = False
         self.t0 = None
         self._patch_color = None
         self._pulse_active = False
-        self._pulse_interval = None
-        self._start_of_pulse_time = None
-        self._end_of_pulse_time = None
+        self._pulse_interval = None #frames from the end of the first pulse to the final pulse
+        self._phase_start_frame = None
+        self._code = None
+        self._frame_index = 0
+        if event_log is None:
+            event_log = EventRecorder(stream = event_stream)
+        elif event_log is False:
+            event_log = None
+        self.event_log = event_log
+        #the background, which is always black, and the patch on top of it;
+        #color set 0 shows the patch off, color set 1 shows it on
+        bg_margin = self.VSYNC_BACKGROUND_MARGIN
+        self.cell_rects = np.array(((left - bg_margin, bottom - bg_margin, left + width + bg_margin, bottom + height + bg_margin),
+                                    (left            , bottom            , left + width            , bottom + height),
+                                   ))
+        self._batch = QuadBatch(rect_vertices(*self.cell_rects.T), num_color_sets = 2, dynamic = False)
+        self._batch.set_colors(off_color, color_set = 0)
+        self._batch.set_colors(off_color, color_set = 1)
+        self._batch.update_colors(on_color, first_quad = 1, color_set = 1)
+
+    def _update_frame_timing(self):
+        #the display rate may have been measured after this patch was made
+        display_rate = get_display_rate(self.display_rate)
+        self.pulse_frames, self.timing_base_frames = self.frame_timing(display_rate,
+                                                                       pulse_frames = self._pulse_frames_setting,
+                                                                       timing_base_frames = self._timing_base_frames_setting,
+                                                                      )
+        self.pulse_duration = self.pulse_frames/float(display_rate)
+        self.timing_base    = self.timing_base_frames/float(display_rate)
         
     def start_time(self, t, vsync_value):
         self.t0 = t
+        self._code = vsync_value
+        self._update_frame_timing()
+        if not self.event_log is None:
+            self.event_log.start() #background flushing, no-op if already running
         
         if vsync_value > 0:
-            #begin the first pulse
+            #begin the first pulse, shown from the next rendered frame on
             self._pulse_active = True
             self._patch_color = self.on_color
-            self._pulse_interval = (vsync_value + 0.25)*self.VSYNC_TIMING_BASE
-            self._start_of_pulse_time = t
-            print("START:",t)
-            #print("\tpulse_interval =",self._pulse_interval)
+            self._pulse_interval = int((vsync_value + 0.25)*self.timing_base_frames + 0.5)
+            self._phase_start_frame = self._frame_index
+            if not self.event_log is None:
+                self.event_log.record(EVENT_PULSE_START, t, self._frame_index, vsync_value)
         else:
             self._patch_color = self.off_color
             self._pulse_interval = None
@@ -152,51 +343,43 @@ class VsyncPatch_Version2:
         self.ready_to_render = True
 
     def update(self, t, dt):
-        #control the pulse display when it is active
+        #control the pulse display when it is active, every frame has to be
+        #rendered while a code is being sent so that the frame count advances
         if self._pulse_active:
             self.ready_to_render = True
-            pdt = t - self._start_of_pulse_time
-            if ( pdt >= self.PULSE_DURATION): #pulse period is over
-                print("PULSE OFF:",t - self.t0)
-                self._end_of_pulse_time = t
+            if self._frame_index - self._phase_start_frame >= self.pulse_frames: #pulse period is over
+                if not self.event_log is None:
+                    self.event_log.record(EVENT_PULSE_OFF, t, self._frame_index, self._code)
+                self._phase_start_frame = self._frame_index
                 self._pulse_active = False
                 self._patch_color = self.off_color
         elif (not self._pulse_interval is None):
-            pdt = t - self._end_of_pulse_time
-            if ( pdt >= self._pulse_interval): #begin final pulse, but not too early
-                print("END:",t - self.t0)
-                print("pdt =", pdt)
-                print("pdt/VSYNC_TIMING_BASE = %f" % (pdt/self.VSYNC_TIMING_BASE,))
+            self.ready_to_render = True
+            if self._frame_index - self._phase_start_frame >= self._pulse_interval: #begin final pulse
+                if not self.event_log is None:
+                    self.event_log.record(EVENT_PULSE_END, t, self._frame_index, self._code)
                 self._pulse_active = True
                 self._patch_color = self.on_color
                 self._pulse_interval = None #invalidate for rest of epoch
-                self._start_of_pulse_time = t
-                self.ready_to_render = True
+                self._phase_start_frame = self._frame_index
         else:
             self.ready_to_render = False
 
     def render(self):
-        left, bottom, width, height = (self.left,self.bottom,self.width,self.height)
-        
-        bg_margin = self.VSYNC_BACKGROUND_MARGIN
-        
-        
-
         gl.glLoadIdentity()
-        gl.glDisable(gl.GL_LIGHTING)
-
-        try:
-            #draw the background which is always black
-            #bit 0, sub square at bottom/right corner, also the vsync trigger bit
-            gl.glColor3f(*self.off_color)
-            gl.glRectf(left - bg_margin, bottom - bg_margin,  left + width + bg_margin, bottom + height + bg_margin) #left,bottom -> right,top
-           
-            #draw the patch
-            #bit 0, sub square at bottom/right corner, also the vsync trigger bit
-            gl.glColor3f(*self._patch_color)
-            gl.glRectf(left, bottom,  left + width, bottom + height) #left,bottom -> right,top
-        finally:
-            gl.glEnable(gl.GL_LIGHTING)
+        self._batch.render(color_set = int(self._pulse_active)) #the patch is on while a pulse is active
+
+    def frame_flipped(self):
+        "count a shown frame, a render that is not flipped does not count"
+        self._frame_index += 1
+
+    def get_cell_colors(self):
+        "colors of the cell_rects (background and patch) as rendered"
+        return self._batch.colors[int(self._pulse_active), ::4]
+
+    def get_cell_states(self):
+        "on/off state of the patch on the last rendered frame"
+        return [self._pulse_active]
                 
     @classmethod
     #define the vsync patch as being in the bottom right corner
@@ -205,6 +388,7 @@ class VsyncPatch_Version2:
                           screen_right,
                           patch_width  = None,
                           patch_height = None,
+                          **kwargs
                          ):
         if patch_width is None:
             patch_width =  cls.VSYNC_PATCH_WIDTH_DEFAULT
@@ -214,6 +398,234 @@ class VsyncPatch_Version2:
         obj = cls(left   = screen_right - patch_width,
                   bottom = screen_bottom,
                   width  = patch_width,
-                  height = patch_height
+                  height = patch_height,
+                  **kwargs
+                 )
+        return obj
+
+class VsyncPatch_FrameCounter:
+    """ A rolling frame counter shown as a barcode of 'num_bits' sub-patches
+         (bit k in cell k, filled row by row from the bottom right) plus an
+         optional even parity cell, the counter advances on every flip so
+         that each flip carries its own number.
+
+         With 'gray_code' (the default) exactly one data cell changes from
+         one frame to the next, so the parity cell toggles on every frame
+         and acts as a frame clock.  Use trigger_decoder.decode_frame_counter
+         with one photodiode per cell to find missed and repeated frames.
+    """
+    NUM_BITS_DEFAULT = 4
+    VSYNC_PATCH_WIDTH_DEFAULT   = VSYNC_PATCH_WIDTH_DEFAULT
+    VSYNC_PATCH_HEIGHT_DEFAULT  = VSYNC_PATCH_HEIGHT_DEFAULT
+
+    def __init__(self, left, bottom, width, height,
+                 on_color  = COLORS['white'],
+                 off_color = COLORS['black'],
+                 num_bits  = NUM_BITS_DEFAULT,
+                 parity    = True,
+                 gray_code = True,
+                 ):
+        self.left   = left
+        self.bottom = bottom
+        self.width  = width
+        self.height = height
+        self.on_color  = on_color
+        self.off_color = off_color
+        self.num_bits  = int(num_bits)
+        self.parity    = parity
+        self.gray_code = gray_code
+        self.num_cells = self.num_bits + int(bool(parity))
+        # cells on a near square grid, cell 0 (bit 0) in the bottom right
+        # corner like the trigger bit of VsyncPatch_Version1
+        ncols = int(np.ceil(np.sqrt(self.num_cells)))
+        nrows = int(np.ceil(self.num_cells/float(ncols)))
+        w = float(width)/ncols
+        h = float(height)/nrows
+        k = np.arange(self.num_cells)
+        cell_right = left + width - w*(k % ncols)
+        cell_bottom = bottom + h*(k // ncols)
+        self.cell_rects = np.column_stack((cell_right - w, cell_bottom, cell_right, cell_bottom + h))
+        #one color set per counter value
+        self._code_states = np.array([self.compute_cell_states(c) for c in range(1 << self.num_bits)])
+        self._batch = make_code_batch(self.cell_rects, self._code_states, on_color, off_color)
+        self.t0 = None
+        self.vsync_value = None
+        self.ready_to_render = None
+        self.frame_counter = 0 #keeps rolling across runs
+
+    def start_time(self, t, vsync_value = 0):
+        self.t0 = t
+        self.vsync_value = vsync_value
+        self.ready_to_render = True
+
+    def update(self, t, dt):
+        #the counter changes on every frame
+        self.ready_to_render = True
+
+    def compute_cell_states(self, frame_counter = None):
+        "on/off state of every cell for 'frame_counter' (default: the next frame)"
+        if frame_counter is None:
+            frame_counter = self.frame_counter
+        code = frame_counter & ((1 << self.num_bits) - 1)
+        if self.gray_code:
+            code ^= code >> 1
+        states = [bool((code >> bit) & 1) for bit in range(self.num_bits)]
+        if self.parity:
+            states.append(sum(states) % 2 == 1) #total number of on cells is even
+        return states
+
+    def render(self):
+        gl.glLoadIdentity()
+        self._batch.render(color_set = self.frame_counter & ((1 << self.num_bits) - 1))
+
+    def frame_flipped(self):
+        "count a shown frame, a render that is not flipped does not count"
+        self.frame_counter += 1
+
+    def get_cell_states(self):
+        "on/off state of every cell on the frame being shown"
+        return self.compute_cell_states(self.frame_counter)
+
+    def get_cell_colors(self):
+        "colors of the cell_rects as rendered"
+        return self._batch.colors[self.frame_counter & ((1 << self.num_bits) - 1), ::4]
+
+    @classmethod
+    #define the vsync patch as being in the bottom right corner
+    def make_bottom_right(cls,
+                          screen_bottom,
+                          screen_right,
+                          patch_width  = None,
+                          patch_height = None,
+                          **kwargs
+                         ):
+        if patch_width is None:
+            patch_width =  cls.VSYNC_PATCH_WIDTH_DEFAULT
+        if patch_height is None:
+            patch_height =  cls.VSYNC_PATCH_HEIGHT_DEFAULT
+        obj = cls(left   = screen_right - patch_width,
+                  bottom = screen_bottom,
+                  width  = patch_width,
+                  height = patch_height,
+                  **kwargs
                  )
         return obj
+
+class ProbePatches:
+    """ One small probe patch per stimulus channel (e.g. per flasher target)
+         showing that channel's current luminance, so that with a photodiode
+         on a probe the realized frequency and phase of its target can be
+         checked optically, like the 'flash_rate_util' board of the legacy
+         present_lib.DoubleCheckerBoardFlasher.
+
+         The probes, their black surrounds and the cells of the vsync
+         'patch' (any patch with cell_rects and get_cell_colors) are one
+         quad batch: each frame takes a single color upload and a single
+         draw call, in place of rendering the patch on its own.
+    """
+    PROBE_SIZE_DEFAULT   = 0.05
+    PROBE_MARGIN_DEFAULT = 0.025 #black gap around and between probes
+
+    def __init__(self, probe_positions,
+                 size   = PROBE_SIZE_DEFAULT,
+                 margin = PROBE_MARGIN_DEFAULT,
+                 background_color = COLORS['black'],
+                 patch = None,
+                 ):
+        #'probe_positions' are the bottom left corners of the probes
+        probe_positions = np.asarray(probe_positions, dtype = np.float32).reshape((-1,2))
+        self.probe_positions = probe_positions
+        self.num_probes = len(probe_positions)
+        self.size = size
+        self.patch = patch
+        left, bottom = probe_positions.T
+        #quads: the black surround of every probe, the probes, the patch cells
+        patch_rects = np.zeros((0,4)) if patch is None else np.asarray(patch.cell_rects, dtype = np.float32)
+        rects = np.vstack((np.column_stack((left - margin, bottom - margin, left + size + margin, bottom + size + margin)),
+                           np.column_stack((left, bottom, left + size, bottom + size)),
+                           patch_rects,
+                          ))
+        self.num_patch_cells = len(patch_rects)
+        self._batch = QuadBatch(rect_vertices(*rects.T))
+        self._colors = np.zeros((len(rects), 3), dtype = np.float32)
+        self._colors[:self.num_probes] = background_color
+
+    def render(self, values):
+        """ show each probe at gray level 'values[k]' (0 to 1) together with
+            the patch in its current state
+        """
+        n = self.num_probes
+        self._colors[n:2*n] = np.clip(np.asarray(values, dtype = np.float32), 0.0, 1.0)[:,np.newaxis]
+        num_quads = 2*n
+        if self.num_patch_cells:
+            patch_colors = self.patch.get_cell_colors()
+            if not patch_colors is None: #the patch may draw nothing on this frame
+                self._colors[num_quads:] = patch_colors
+                num_quads += self.num_patch_cells
+        self._batch.update_colors(self._colors[n:num_quads], first_quad = n)
+        gl.glLoadIdentity()
+        self._batch.render(num_quads = num_quads)
+
+    @classmethod
+    def make_row(cls,
+                 num_probes,
+                 screen_left,
+                 screen_bottom,
+                 screen_right,
+                 patch = None,
+                 size   = PROBE_SIZE_DEFAULT,
+                 margin = PROBE_MARGIN_DEFAULT,
+                 **kwargs
+                ):
+        """ probes in a row along the bottom edge from the left, wrapping
+            upwards, skipping the places taken by the cells of 'patch', which
+            is then drawn with the probes
+        """
+        pitch = size + margin
+        ncols = max(int((screen_right - screen_left - margin)//pitch), 1)
+        if patch is None or not hasattr(patch, 'get_cell_colors'):
+            patch = None
+            patch_rects = np.zeros((0,4))
+        else:
+            patch_rects = np.asarray(patch.cell_rects, dtype = float)
+        positions = []
+        row = 0
+        while len(positions) < num_probes:
+            left   = screen_left + margin + pitch*np.arange(ncols)
+            bottom = screen_bottom + margin + pitch*row
+            #a probe and its surround must not cover any patch cell
+            free = np.ones(ncols, dtype = bool)
+            for l, b, r, t in patch_rects:
+                free &= ((left + size + margin <= l) | (left - margin >= r) |
+                         (bottom + size + margin <= b) | (bottom - margin >= t))
+            positions.extend((x, bottom) for x in left[free])
+            row += 1
+        return cls(positions[:num_probes], size = size, margin = margin, patch = patch, **kwargs)
+
+################################################################################
+# TEST CODE
+################################################################################
+if __name__ == "__main__":
+    #offline check of the pulse widths, in the order of the display loop:
+    #start_time, one render that is never flipped, then update, render and
+    #flip on every frame
+    DISPLAY_RATE = 144.0
+    for code in (1, 5, 18):
+        patch = VsyncPatch_Version2(0.0, 0.0, 0.1, 0.1, display_rate = DISPLAY_RATE)
+        patch.start_time(0.0, vsync_value = code)
+        states = []
+        for i in range(1000):
+            t = i/DISPLAY_RATE
+            patch.update(t, 1.0/DISPLAY_RATE)
+            states.append(patch.get_cell_states()[0])
+            patch.frame_flipped()
+        #lengths of the runs of equal states, the first one is the first pulse
+        states = np.asarray(states, dtype = int)
+        edges = np.flatnonzero(np.diff(states)) + 1
+        runs = np.diff(np.concatenate(([0], edges)))
+        gap = int((code + 0.25)*patch.timing_base_frames + 0.5)
+        assert runs[0] == patch.pulse_frames, (code, runs[0], patch.pulse_frames)
+        assert runs[1] == gap, (code, runs[1], gap)
+        assert runs[2] == patch.pulse_frames, (code, runs[2], patch.pulse_frames)
+        print("code %2d: pulse %d, gap %d, pulse %d frames" % (code, runs[0], runs[1], runs[2]))
+    patch.event_log.stop()